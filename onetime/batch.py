@@ -0,0 +1,210 @@
+'''
+Author: Scott Halgrim
+Date: 10/19/26
+Functionality: Runs a batch of onetime scripts in one warm interpreter (or in a
+               pool of them) instead of launching a new python process per
+               script. The batch is described by a manifest config file where
+               each section is a job, e.g.,
+
+               [median_iqr]
+               Script: median_iqr_rpts_per_ptnt
+               ConfigFile: C:\chains\0437\data\config.cfg
+               OutputFile: C:\chains\0437\out\out.txt
+               Args: -v 10
+
+               Script is a module name in this package (or a full dotted module
+               name), ConfigFile and OutputFile are passed to the script as if
+               it were run from the command line and Args is optional and holds
+               any other command line arguments.
+               Because jobs share a process, std_import and the util modules
+               are only imported once per process, and directory listings and
+               PID files read through myos.listdirCached and
+               myos.readlinesCached are only read once per process.
+               A section named SharedCache isn't a job. It lists PID files and
+               (report dir, PID file) pairs to load once into a
+               cohortcache.CohortCache before any job runs, e.g.,
+
+               [SharedCache]
+               PIDFiles: C:\chains\0437\data\trn_pids.txt
+               RptDirs: C:\chains\0437\data\trn C:\chains\0437\data\trn_pids.txt
+
+               Workers get the cache through the pool's initializer and read
+               it in shared memory, so getPtntIdSet, getPtntIdIndex and
+               getRptNamesByPID don't re-read PID files or re-list directories
+               in each worker, and median_iqr_rpts_per_ptnt doesn't scan a
+               cached report dir. A PID file with IDs a pidindex.PtntIdIndex
+               can't hold (e.g., leading zeros) is left out of the cache with
+               a warning, and jobs read it themselves.
+               RptDirs holds a report dir and its PID file, then the next pair.
+               Writes a tab-separated summary of job name, status, seconds and
+               output filename to the output file.
+'''
+import std_import as si
+import runpy, time, traceback
+import multiprocessing
+from org.ghri.shalgrim.util import cohortcache, pidindex
+
+# package that Script names are relative to when not given as dotted names
+SCRIPT_PKG = 'org.ghri.shalgrim.onetime'
+
+# manifest section listing what to load into the shared cache
+CACHE_SECTION = 'SharedCache'
+
+# get module logger
+logger = si.logging.getLogger('org.ghri.shalgrim.onetime.batch')
+
+def getJobs(manifestfn):
+    '''
+    Reads the manifest config file manifestfn and returns a list of jobs in the
+    order their sections appear. Each job is a (name, modname, argv) tuple
+    where modname is the full module name of the script and argv is the
+    command line the script would have been run with.
+    '''
+    cp = si.ConfigParser.SafeConfigParser(allow_no_value = True)
+    cp.read(manifestfn)
+
+    jobs = []
+
+    for name in cp.sections():              # one job per section
+        if name == CACHE_SECTION:           # except the cache's
+            continue
+
+        modname = cp.get(name, 'Script')
+
+        if '.' not in modname:              # make module name absolute
+            modname = '%s.%s'%(SCRIPT_PKG, modname)
+
+        argv = [modname, cp.get(name, 'ConfigFile')]
+
+        if cp.has_option(name, 'OutputFile'):
+            argv.extend(['-o', cp.get(name, 'OutputFile')])
+
+        if cp.has_option(name, 'Args'):
+            argv.extend(cp.get(name, 'Args').split())
+
+        jobs.append((name, modname, argv))
+
+    return jobs
+
+def getCache(manifestfn):
+    '''
+    Reads the SharedCache section of the manifest config file manifestfn and
+    returns a cohortcache.CohortCache with its PID files and report dirs
+    loaded, or None if there is no such section.
+    '''
+    cp = si.ConfigParser.SafeConfigParser(allow_no_value = True)
+    cp.read(manifestfn)
+
+    if not cp.has_section(CACHE_SECTION):
+        return None
+
+    # getRptNamesByPID lives in a script, so only import it if there's a cache
+    from org.ghri.shalgrim.onetime.median_iqr_rpts_per_ptnt import \
+                                                            getRptNamesByPID
+    cache = cohortcache.CohortCache()
+
+    if cp.has_option(CACHE_SECTION, 'PIDFiles'):
+        for fn in cp.get(CACHE_SECTION, 'PIDFiles').split():
+            try:
+                index = pidindex.readPtntIdIndex(fn)
+            except ValueError as myerr:     # e.g., IDs with leading zeros
+                logger.warning('not caching %s: %s'%(fn, myerr))
+                continue
+
+            cache.addPtntIds(fn, index)
+
+    if cp.has_option(CACHE_SECTION, 'RptDirs'):
+        paths = cp.get(CACHE_SECTION, 'RptDirs').split()
+
+        for adir, pidfn in zip(paths[::2], paths[1::2]):
+            cache.addRptNames(adir, pidfn, getRptNamesByPID(adir, pidfn))
+
+    logger.info('cached %d PID files and %d report dirs'%(
+                                    len(cache.ptntIds), len(cache.rptNames)))
+
+    return cache
+
+def runJob(job):
+    '''
+    Runs job, a (name, modname, argv) tuple from getJobs, as __main__ in this
+    process with sys.argv set to argv. Returns a (name, status, seconds,
+    outfn) tuple where status is 'OK' or the error that ended the job.
+    Errors, including the SystemExit a script's parser raises on a bad command
+    line, are logged and reported rather than ending the batch.
+    '''
+    name, modname, argv = job
+
+    try: outfn = argv[argv.index('-o') + 1]     # get job's output filename
+    except ValueError: outfn = ''               # stdout if not given
+
+    logger.info('starting job %s (%s)'%(name, modname))
+    savedArgv = si.sys.argv                     # hold on to our command line
+    si.sys.argv = list(argv)                    # give the script its own
+    start = time.time()
+
+    try:
+        runpy.run_module(modname, run_name='__main__', alter_sys=True)
+        status = 'OK'
+    except SystemExit as se:
+        status = 'SystemExit: %s'%(se.code)
+        logger.error('job %s exited: %s'%(name, status))
+    except Exception as myerr:
+        status = '%s: %s'%(type(myerr).__name__, myerr)
+        logger.error('job %s failed:\n%s'%(name, traceback.format_exc()))
+    finally:
+        si.sys.argv = savedArgv                 # restore our command line
+
+    seconds = time.time() - start
+    logger.info('finished job %s in %.2f seconds'%(name, seconds))
+
+    return (name, status, seconds, outfn)
+
+def runJobs(jobs, processes=0, cache=None):
+    '''
+    Runs jobs, a list of tuples from getJobs. If processes is 0 they are run
+    one after another in this process; otherwise they are spread over a pool
+    of that many worker processes, each of which stays warm across the jobs it
+    is handed. If cache, a cohortcache.CohortCache such as getCache returns, is
+    given, it is handed to each worker, or used here if there is no pool.
+    Returns the list of runJob results in the order of jobs.
+    '''
+    if processes:
+        pool = multiprocessing.Pool(processes, cohortcache.initWorker,
+                                                                    (cache,))
+
+        try:
+            # chunksize of 1 so long jobs don't hold up a queue of short ones
+            results = pool.map(runJob, jobs, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        cohortcache.initWorker(cache)
+        results = [runJob(job) for job in jobs]
+
+    return results
+
+if __name__ == '__main__':                  # if run as main, not if imported
+
+    # usage string to give if user asks for help or gets command line wrong
+    usageStr = '%(prog)s manifestfile [options]'
+    parser = si.opts.ConfigFileParser(usage=usageStr)  # create cmd line parser
+
+    # add p option for number of worker processes. 0 runs jobs in this process
+    parser.add_argument('-p', '--processes', action='store', type=int,
+                                                                    default=0)
+    options = parser.parse_args()                   # parse command line
+
+    # start logging at root according to command line
+    si.mylogger.config(logfn=options.logfile, logmode=options.logmode, \
+                                                    loglevel=options.loglevel)
+
+    logger.setLevel(options.loglevel)   # set module logging level to input
+
+    start = time.time()
+    results = runJobs(getJobs(options.configfn), options.processes,
+                                                getCache(options.configfn))
+
+    outlines = ['%s\t%s\t%.2f\t%s'%result for result in results]
+    outlines.append('TOTAL\t\t%.2f\t'%(time.time() - start))
+    si.myos.writelines(outlines, options.outfn)
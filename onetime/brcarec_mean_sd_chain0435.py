@@ -46,4 +46,20 @@ if __name__ == '__main__':                  # if run as main, not if imported
     outlines.append('Test SSD: %02f'%(mymath.ssd(testvals)/365.25))
     outlines.append('All mean: %02f'%(mymath.mean(trainvals + testvals)/365.25))
     outlines.append('All SSD: %02f'%(mymath.ssd(trainvals + testvals)/365.25))
+
+    # if BootstrapResamples is configured, add CIs for the means and SSDs.
+    # util.bootstrap needs numpy, so it's only imported when asked for
+    if cp.has_option('Main', 'BootstrapResamples'):
+        from org.ghri.shalgrim.util import bootstrap
+        numResamples = cp.getint('Main', 'BootstrapResamples')
+
+        for name, vals in (('Train', trainvals), ('Test', testvals),
+                           ('All', trainvals + testvals)):
+            cis = bootstrap.bootstrapCIs(vals, numResamples=numResamples,
+                                                        stats=('mean', 'sd'))
+            outlines.append('%s mean 95%% CI: (%02f, %02f)'%(name,
+                            cis['mean'][1]/365.25, cis['mean'][2]/365.25))
+            outlines.append('%s SSD 95%% CI: (%02f, %02f)'%(name,
+                            cis['sd'][1]/365.25, cis['sd'][2]/365.25))
+
     si.myos.writelines(outlines, outfn)
\ No newline at end of file
@@ -8,13 +8,14 @@ Functionality: "Onetime" code used to determine the median and IQR
                both sets of numbers.
 '''
 import std_import as si
-import re, copy
+import re, collections
 from org.ghri.shalgrim.onetime.num_rpts_ptnts_w_reports import PNUM
+from org.ghri.shalgrim.util import rptstats, dirscan, cohortcache
 
 # get module logger
 logger = si.logging.getLogger('org.ghri.shalgrim.onetime.median_iqr_rpts_per_ptnt')
 
-def getRptNamesByPID(adir, pidfn, includeZeroRptPtnts=True):
+def getRptNamesByPID(adir, pidfn, includeZeroRptPtnts=True, fnsByPID=None):
     '''
     Given a directory of pathology reports named in such a way that the filename
     encodes the patient id according to the PNUM regex, a filename of a file 
@@ -25,23 +26,37 @@ def getRptNamesByPID(adir, pidfn, includeZeroRptPtnts=True):
     Those with no reports have an empty list as their value.
     If includeZeroRptPtnts is False, then only those patients in the file and
     who have reprots are returned.
+    If fnsByPID, a dict of patient ID to filenames in adir such as
+    dirscan.scanDirs gives, is passed in, it is used instead of listing adir.
+    If batch.py loaded adir and pidfn into a cohortcache.CohortCache, the
+    cached, read-only SharedRptNames is used instead of either.
     '''
+    cached = cohortcache.getRptNames(adir, pidfn)
+
+    if cached is not None:                  # loaded once by batch.py
+        if includeZeroRptPtnts: return cached
+        return {k:v for k, v in cached.items() if v}
 
     # initialize dict to have every pid with empty list
-    rptNamesByPID = {line.strip():[] for line in si.myos.readlines(pidfn)}
-    fns = si.os.listdir(adir)             # get all filenames
+    rptNamesByPID = {line.strip():[] for line in si.myos.readlinesCached(pidfn)}
+
+    if fnsByPID is not None:                # if adir already scanned
+        for pid in rptNamesByPID:           # just look up each cohort pid
+            rptNamesByPID[pid] = list(fnsByPID.get(pid, []))
+    else:
+        fns = si.myos.listdirCached(adir)   # get all filenames
 
-    for fn in fns:                          # for each filename
-        pid = PNUM.search(fn).group()       # get patient ID
+        for fn in fns:                          # for each filename
+            pid = PNUM.search(fn).group()       # get patient ID
 
-        try:
-            rptNamesByPID[pid].append(fn)   # add filename to list for that pid
-        except KeyError:                    
-            pass                            # if that ptnt not in list skip
+            try:
+                rptNamesByPID[pid].append(fn)   # add filename to list for that pid
+            except KeyError:
+                pass                            # if that ptnt not in list skip
 
     # filter out patients with zero reports if appropriate
     if not includeZeroRptPtnts:
-        rptNamesByPid = {k:v for k, v in rptNamesByPid.items() if len(v) > 0}
+        rptNamesByPID = {k:v for k, v in rptNamesByPID.items() if len(v) > 0}
 
     return rptNamesByPID
 
@@ -77,7 +92,49 @@ def getQuartileVals(rptsByPtnt):
 
     return (q1, med, q3)
 
+def getSnapshotQuartileVals(trnSnap, testSnap, includeZeroRptPtnts):
+    '''
+    Incremental-mode counterpart of the getQuartileVals calls in main. Given
+    up-to-date rptstats.RptCountSnapshots for the train and test sets, returns
+    (q1, med, q3) tuples for train, test and all, with or without zero-report
+    patients.
+    '''
+    trnHist = trnSnap.getHist(includeZeroRptPtnts)
+    testHist = testSnap.getHist(includeZeroRptPtnts)
+    allHist = rptstats.mergeHists(trnHist, testHist)
+
+    return [rptstats.getQuartileValsFromHist(hist)
+                                    for hist in (trnHist, testHist, allHist)]
+
+def getHistFromRptNames(rptsByPtnt, includeZeroRptPtnts):
+    '''
+    Given a dict of patient ID to list of report names like getRptNamesByPID
+    returns, returns a dict of number of reports to number of patients with
+    that many, with or without zero-report patients.
+    '''
+    return dict(collections.Counter(len(v) for v in rptsByPtnt.values()
+                                            if includeZeroRptPtnts or v))
+
+def getBootstrapLines(trnHist, testHist, numResamples, processes=None):
+    '''
+    Given histograms of reports per patient for the train and test sets,
+    returns output lines with bootstrap 95% CIs of q1, median and q3 for
+    train, test and all. util.bootstrap needs numpy, so it's only imported
+    when CIs are asked for.
+    '''
+    from org.ghri.shalgrim.util import bootstrap
 
+    allHist = rptstats.mergeHists(trnHist, testHist)
+    lines = []
+
+    for name, hist in zip(('TRAIN', 'TEST', 'ALL'), (trnHist, testHist, allHist)):
+        cis = bootstrap.bootstrapHistCIs(hist, numResamples,
+                                                        processes=processes)
+        lines.append('%s 95%% CI q1: (%.1f, %.1f), median: (%.1f, %.1f), '
+                        'q3: (%.1f, %.1f)'%((name,) + cis['q1'][1:] +
+                                            cis['median'][1:] + cis['q3'][1:]))
+
+    return lines
 
 if __name__ == '__main__':                  # if run as main, not if imported
     
@@ -103,39 +160,108 @@ if __name__ == '__main__':                  # if run as main, not if imported
     testFilterFn = cp.get('Main', 'TestPIDsFile')
     outfn = options.outfn       # get name of output file
 
-
-    trnRptsByPtnt = getRptNamesByPID(trndir, trnFilterFn)
-    testRptsByPtnt = getRptNamesByPID(testdir, testFilterFn)
-
-    # make all dict.  could make into util function
-    # first verify there's no overlap in patients
-    assert len(set(trnRptsByPtnt.keys()).intersection(set(testRptsByPtnt.keys()))) == 0
-
-    allRptsByPtnt = copy.copy(trnRptsByPtnt)        # then initialize by copying train
-
-    for k, v in testRptsByPtnt.items():             # then add those from test
-        allRptsByPtnt[k] = v
-
-    # get q1, med, and q3 for train, test, and all sets
-    trnq1, trnmed, trnq3 = getQuartileVals(trnRptsByPtnt)
-    testq1, testmed, testq3 = getQuartileVals(testRptsByPtnt)
-    allq1, allmed, allq3 = getQuartileVals(allRptsByPtnt)
-
-    # create output for the numbers when 0-rpt ptnts included
-    outlines = ['WITH ZERO REPORT PATIENTS']
-    outlines.append('TRAIN q1: %.1f, median: %.1f, q3: %.1f'%(trnq1, trnmed, trnq3))
-    outlines.append('TEST q1: %.1f, median: %.1f, q3: %.1f'%(testq1, testmed, testq3))
-    outlines.append('ALL q1: %.1f, median: %.1f, q3: %.1f'%(allq1, allmed, allq3))
-
-    # run it again but remove zero-report patients
-    trnq1, trnmed, trnq3 = getQuartileVals({k:v for k, v in trnRptsByPtnt.items() if len(v) > 0})
-    testq1, testmed, testq3 = getQuartileVals({k:v for k, v in testRptsByPtnt.items() if len(v) > 0})
-    allq1, allmed, allq3 = getQuartileVals({k:v for k, v in allRptsByPtnt.items() if len(v) > 0})
-
-    # create output for when 0-rpt ptnts excluded
-    outlines.append('WITHOUT ZERO REPORT PATIENTS')
-    outlines.append('TRAIN q1: %.1f, median: %.1f, q3: %.1f'%(trnq1, trnmed, trnq3))
-    outlines.append('TEST q1: %.1f, median: %.1f, q3: %.1f'%(testq1, testmed, testq3))
-    outlines.append('ALL q1: %.1f, median: %.1f, q3: %.1f'%(allq1, allmed, allq3))
+    # if snapshot files are configured, update the saved counts from just the
+    # reports added or removed since last run rather than recounting
+    useSnapshots = cp.has_option('Main', 'TrainSnapshotFile')
+
+    if useSnapshots:
+        trnSnapFn = cp.get('Main', 'TrainSnapshotFile')
+        testSnapFn = cp.get('Main', 'TestSnapshotFile')
+        trnSnap = rptstats.loadRptCountSnapshot(trnSnapFn, trndir, trnFilterFn,
+                                                                        PNUM)
+        testSnap = rptstats.loadRptCountSnapshot(testSnapFn, testdir,
+                                                        testFilterFn, PNUM)
+        trnSnap.update()
+        testSnap.update()
+        trnSnap.save(trnSnapFn)
+        testSnap.save(testSnapFn)
+
+        # first verify there's no overlap in patients
+        assert not set(trnSnap.counts).intersection(testSnap.counts)
+
+        outlines = []
+
+        for includeZero, header in ((True, 'WITH ZERO REPORT PATIENTS'),
+                                    (False, 'WITHOUT ZERO REPORT PATIENTS')):
+            vals = getSnapshotQuartileVals(trnSnap, testSnap, includeZero)
+            outlines.append(header)
+
+            for name, (q1, med, q3) in zip(('TRAIN', 'TEST', 'ALL'), vals):
+                outlines.append('%s q1: %.1f, median: %.1f, q3: %.1f'%(name,
+                                                                q1, med, q3))
+    else:
+        # if ScanThreads is configured, list train and test dirs concurrently,
+        # leaving out any batch.py already cached. ShardedDirs says the reports
+        # are in subdirectories of them, which are listed concurrently too
+        toScan = [adir for adir, pidfn in ((trndir, trnFilterFn),
+                                                        (testdir, testFilterFn))
+                                if cohortcache.getRptNames(adir, pidfn) is None]
+
+        if cp.has_option('Main', 'ScanThreads') and toScan:
+            sharded = cp.has_option('Main', 'ShardedDirs') and \
+                                        cp.getboolean('Main', 'ShardedDirs')
+            fnsByPIDByDir, stats = dirscan.scanDirs(toScan, PNUM,
+                                    cp.getint('Main', 'ScanThreads'), sharded)
+            logger.info('scanned %s'%(stats))
+        else:
+            fnsByPIDByDir = {}
+
+        trnRptsByPtnt = getRptNamesByPID(trndir, trnFilterFn,
+                                        fnsByPID=fnsByPIDByDir.get(trndir))
+        testRptsByPtnt = getRptNamesByPID(testdir, testFilterFn,
+                                        fnsByPID=fnsByPIDByDir.get(testdir))
+
+        # make all dict.  could make into util function
+        # first verify there's no overlap in patients
+        assert len(set(trnRptsByPtnt.keys()).intersection(set(testRptsByPtnt.keys()))) == 0
+
+        allRptsByPtnt = dict(trnRptsByPtnt)             # then initialize by copying train
+
+        for k, v in testRptsByPtnt.items():             # then add those from test
+            allRptsByPtnt[k] = v
+
+        # get q1, med, and q3 for train, test, and all sets
+        trnq1, trnmed, trnq3 = getQuartileVals(trnRptsByPtnt)
+        testq1, testmed, testq3 = getQuartileVals(testRptsByPtnt)
+        allq1, allmed, allq3 = getQuartileVals(allRptsByPtnt)
+
+        # create output for the numbers when 0-rpt ptnts included
+        outlines = ['WITH ZERO REPORT PATIENTS']
+        outlines.append('TRAIN q1: %.1f, median: %.1f, q3: %.1f'%(trnq1, trnmed, trnq3))
+        outlines.append('TEST q1: %.1f, median: %.1f, q3: %.1f'%(testq1, testmed, testq3))
+        outlines.append('ALL q1: %.1f, median: %.1f, q3: %.1f'%(allq1, allmed, allq3))
+
+        # run it again but remove zero-report patients
+        trnq1, trnmed, trnq3 = getQuartileVals({k:v for k, v in trnRptsByPtnt.items() if len(v) > 0})
+        testq1, testmed, testq3 = getQuartileVals({k:v for k, v in testRptsByPtnt.items() if len(v) > 0})
+        allq1, allmed, allq3 = getQuartileVals({k:v for k, v in allRptsByPtnt.items() if len(v) > 0})
+
+        # create output for when 0-rpt ptnts excluded
+        outlines.append('WITHOUT ZERO REPORT PATIENTS')
+        outlines.append('TRAIN q1: %.1f, median: %.1f, q3: %.1f'%(trnq1, trnmed, trnq3))
+        outlines.append('TEST q1: %.1f, median: %.1f, q3: %.1f'%(testq1, testmed, testq3))
+        outlines.append('ALL q1: %.1f, median: %.1f, q3: %.1f'%(allq1, allmed, allq3))
+
+    # if BootstrapResamples is configured, add CIs for the quartile values
+    if cp.has_option('Main', 'BootstrapResamples'):
+        numResamples = cp.getint('Main', 'BootstrapResamples')
+
+        if cp.has_option('Main', 'BootstrapProcesses'):
+            processes = cp.getint('Main', 'BootstrapProcesses')
+        else:
+            processes = None
+
+        for includeZero, header in ((True, 'WITH ZERO REPORT PATIENTS'),
+                                    (False, 'WITHOUT ZERO REPORT PATIENTS')):
+            if useSnapshots:
+                trnHist = trnSnap.getHist(includeZero)
+                testHist = testSnap.getHist(includeZero)
+            else:
+                trnHist = getHistFromRptNames(trnRptsByPtnt, includeZero)
+                testHist = getHistFromRptNames(testRptsByPtnt, includeZero)
+
+            outlines.append('%s, %d BOOTSTRAP RESAMPLES'%(header, numResamples))
+            outlines.extend(getBootstrapLines(trnHist, testHist, numResamples,
+                                                                    processes))
 
     si.myos.writelines(outlines, outfn)
\ No newline at end of file
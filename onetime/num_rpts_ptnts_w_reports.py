@@ -7,6 +7,7 @@ Functionality: "Onetime" code used to determine the number of reports
 '''
 import std_import as si
 import re
+from org.ghri.shalgrim.util import pidindex, rptstats, dirscan, cohortcache
 
 PNUM = re.compile(r'\d+')
 EMPTY_SET = set()
@@ -15,7 +16,7 @@ EMPTY_SET = set()
 logger = si.logging.getLogger('org.ghri.shalgrim.onetime.num_rpts_ptnts_w_reports')
 
 def getNumReports(d, filterSet=EMPTY_SET):
-    fns = si.os.listdir(d)
+    fns = si.myos.listdirCached(d)
 
     if filterSet:
         reports = [fn for fn in fns if PNUM.search(fn).group() in filterSet]
@@ -25,23 +26,84 @@ def getNumReports(d, filterSet=EMPTY_SET):
     return len(reports)
 
 def getNumPtnts(d, filterSet=EMPTY_SET):
-    fns = si.os.listdir(d)
+    fns = si.myos.listdirCached(d)
     ptntset = set([PNUM.search(fn).group() for fn in fns])
 
-    if filterSet:
-        ptntset.intersection_update(filterSet)
+    if filterSet:   # by membership so filterSet can be a set or PtntIdIndex
+        ptntset = set([pid for pid in ptntset if pid in filterSet])
 
     return len(ptntset)
 
+def getCountsFromScan(fnsByPID, filterSet=EMPTY_SET):
+    '''
+    Given a dict of patient ID to filenames such as dirscan.scanDirs gives,
+    returns the (number of reports, number of patients) that getNumReports and
+    getNumPtnts would for the same directory and filterSet.
+    '''
+    if filterSet:
+        fnsByPID = {pid:fns for pid, fns in fnsByPID.items() if pid in filterSet}
+
+    return sum(len(fns) for fns in fnsByPID.itervalues()), len(fnsByPID)
+
 def getPtntIdSet(fn):
-    if fn:
-        filterLines = si.myos.readlines(fn)
+    '''
+    Returns the set of patient IDs (strings) in the file fn, or an empty set if
+    fn is ''. If batch.py loaded fn into a cohortcache.CohortCache, the set is
+    made from the cached IDs and fn isn't read.
+    '''
+    cached = cohortcache.getPtntIds(fn)
+
+    if cached is not None:                  # loaded once by batch.py
+        idset = set(str(pid) for pid in cached)
+    elif fn:
+        filterLines = si.myos.readlinesCached(fn)
         idset = set([pid.strip() for pid in filterLines])
     else:
         idset = EMPTY_SET
 
     return idset
 
+def getPtntIdIndex(fn, idxfn=''):
+    '''
+    Like getPtntIdSet, but returns a compact pidindex.PtntIdIndex, which can be
+    used as the filterSet for getNumReports and getNumPtnts. If idxfn is given
+    the index is saved there, and is memory-mapped from there instead of
+    re-reading fn on later runs as long as it is newer than fn. If batch.py
+    loaded fn into a cohortcache.CohortCache, the index is a view of the cached
+    IDs and nothing is read.
+    '''
+    cached = cohortcache.getPtntIds(fn)
+
+    if cached is not None:                  # loaded once by batch.py
+        index = cached
+    elif not fn:
+        index = pidindex.PtntIdIndex()
+    elif idxfn and si.os.path.exists(idxfn) and \
+            si.os.path.getmtime(idxfn) >= si.os.path.getmtime(fn):
+        index = pidindex.loadPtntIdIndex(idxfn)
+    else:
+        index = pidindex.readPtntIdIndex(fn)
+
+        if idxfn:
+            pidindex.savePtntIdIndex(index, idxfn)
+
+    return index
+
+def getPtntIdFilter(fn, idxfn=''):
+    '''
+    Returns the filterSet for getNumReports, getNumPtnts and getCountsFromScan
+    for the PID file fn. That's the getPtntIdIndex index if idxfn is given or
+    batch.py cached fn, and the getPtntIdSet set otherwise. If fn has IDs an
+    index can't hold (e.g., '00123'), it falls back to the set with a warning.
+    '''
+    if idxfn or cohortcache.getPtntIds(fn) is not None:
+        try:
+            return getPtntIdIndex(fn, idxfn)
+        except ValueError as myerr:
+            logger.warning('using a set of the IDs in %s: %s'%(fn, myerr))
+
+    return getPtntIdSet(fn)
+
 if __name__ == '__main__':                  # if run as main, not if imported
     
     # usage string to give if user asks for help or gets command line wrong
@@ -66,13 +128,60 @@ if __name__ == '__main__':                  # if run as main, not if imported
     testFilterFn = cp.get('Main', 'TestPIDsFile')
     outfn = options.outfn       # get name of output file
 
-    trnSetIds = getPtntIdSet(trnFilterFn)
-    testSetIds = getPtntIdSet(testFilterFn)
+    # optionally keep indexes of the PID files around for later runs
+    if cp.has_option('Main', 'TrainPIDsIndex'):
+        trnIdxFn = cp.get('Main', 'TrainPIDsIndex')
+        testIdxFn = cp.get('Main', 'TestPIDsIndex')
+    else:
+        trnIdxFn = testIdxFn = ''
 
     outlines = []
-    outlines.append('numTrnRpts: %d'%(getNumReports(trndir, trnSetIds)))
-    outlines.append('numTestRpts: %d'%(getNumReports(testdir, testSetIds)))
-    outlines.append('numTrnPtntsWithRpt: %d'%(getNumPtnts(trndir, trnSetIds)))
-    outlines.append('numTestPtntsWithRpt: %d'%(getNumPtnts(testdir, testSetIds)))
+
+    # if snapshot files are configured, update the saved counts from just the
+    # reports added or removed since last run rather than recounting
+    if cp.has_option('Main', 'TrainSnapshotFile'):
+        for name, adir, pidfn, snapkey in \
+                    (('Trn', trndir, trnFilterFn, 'TrainSnapshotFile'),
+                     ('Test', testdir, testFilterFn, 'TestSnapshotFile')):
+            snapfn = cp.get('Main', snapkey)
+            snap = rptstats.loadRptCountSnapshot(snapfn, adir, pidfn, PNUM)
+            snap.update()
+            snap.save(snapfn)
+            outlines.append('num%sRpts: %d'%(name, snap.numReports))
+            outlines.append('num%sPtntsWithRpt: %d'%(name, snap.getNumPtnts()))
+
+        # keep the same line order as the full recount below
+        outlines = [outlines[i] for i in (0, 2, 1, 3)]
+    else:
+        # the snapshots filter by the PID files themselves, so only a full
+        # recount needs the patient ID sets
+        trnSetIds = getPtntIdFilter(trnFilterFn, trnIdxFn)
+        testSetIds = getPtntIdFilter(testFilterFn, testIdxFn)
+
+        if cp.has_option('Main', 'ScanThreads'):
+            # list train and test dirs concurrently. ShardedDirs says the
+            # reports are in subdirectories of them, which are listed
+            # concurrently too
+            sharded = cp.has_option('Main', 'ShardedDirs') and \
+                                        cp.getboolean('Main', 'ShardedDirs')
+            fnsByPIDByDir, stats = dirscan.scanDirs([trndir, testdir], PNUM,
+                                    cp.getint('Main', 'ScanThreads'), sharded)
+            logger.info('scanned %s'%(stats))
+            numTrnRpts, numTrnPtnts = getCountsFromScan(
+                                            fnsByPIDByDir[trndir], trnSetIds)
+            numTestRpts, numTestPtnts = getCountsFromScan(
+                                            fnsByPIDByDir[testdir], testSetIds)
+            outlines.append('numTrnRpts: %d'%(numTrnRpts))
+            outlines.append('numTestRpts: %d'%(numTestRpts))
+            outlines.append('numTrnPtntsWithRpt: %d'%(numTrnPtnts))
+            outlines.append('numTestPtntsWithRpt: %d'%(numTestPtnts))
+        else:
+            outlines.append('numTrnRpts: %d'%(getNumReports(trndir, trnSetIds)))
+            outlines.append('numTestRpts: %d'%(getNumReports(testdir,
+                                                                testSetIds)))
+            outlines.append('numTrnPtntsWithRpt: %d'%(getNumPtnts(trndir,
+                                                                trnSetIds)))
+            outlines.append('numTestPtntsWithRpt: %d'%(getNumPtnts(testdir,
+                                                                testSetIds)))
 
     si.myos.writelines(outlines, outfn)
\ No newline at end of file
@@ -8,14 +8,17 @@ Contents:
     EvalOptionParser - class that extends GenOptionParser with a DEFAULT_USAGE
                        message and a default number of required arguments (2)
                        useful for evaluation
-NOTE: This class currently does not do much since its only extensions are a
-       default usage message and minimum number of required arguments, both of
-       which are easily established with a call to the superclass constructor
 NOTE: The optparse module used here is deprecated and newer code should use
       argparse
+History:
+    10/19/26 - added column and parallelism options and evaluate, which runs
+               util/myeval on the files given, and removed the note that this
+               class doesn't do much. The options are long only, so they
+               don't take short flags (e.g., -c) scripts already use.
 '''
-import optparse, sys
+import optparse, sys, os
 from org.ghri.shalgrim.options.gen_opts import GenOptionParser
+from org.ghri.shalgrim.util import myeval, myos
 
 class EvalOptionParser(GenOptionParser):
     '''
@@ -28,7 +31,10 @@ class EvalOptionParser(GenOptionParser):
                           and exit
     Functionality: Extends GenOptionParser with a DEFAULT_USAGE message and a
                    default number of required arguments (2) useful for
-                   evaluation
+                   evaluation, options saying where the key and label are in
+                   the files, and evaluate, which runs the default evaluation
+    History:
+        10/19/26 - added column options and evaluate
     '''
     # DEFAULT_USAGE message for an evaluation process parser
     DEFAULT_USAGE = '%prog goldfilename sysfilename [options]'
@@ -49,4 +55,59 @@ class EvalOptionParser(GenOptionParser):
         # call superclass constructor
         GenOptionParser.__init__(self, numReqArgs=numReqArgs, **kwargs)
 
+        # add keycol option for index of key column, e.g., document ID. No
+        # short flags here or below, so subclasses and scripts keep theirs
+        self.add_option('--keycol', action='store', type='int', default=0)
+
+        # add labelcol option for index of label (class) column
+        self.add_option('--labelcol', action='store', type='int', default=1)
+
+        # add colsep option for column separator
+        self.add_option('--colsep', action='store', type='string',
+                                                                default='\t')
+
+        # add header option for files whose first line is column names
+        self.add_option('--header', action='store_true', default=False)
+
+        # add sorted option for files both sorted by key, so neither is indexed
+        self.add_option('--sorted', action='store_true', dest='presorted',
+                                                                default=False)
+
+        # add processes option for number of processes evaluating system files
+        self.add_option('--processes', action='store', type='int')
+
         return
+
+    def evaluate(self):
+        '''
+        Method: evaluate
+        Input: self - this EvalOptionParser
+        Output: results - list of util.myeval.EvalResult, one per system file
+        Functionality: Parses the command line, evaluates the system file (the
+                       last argument) against the gold file (the first) with
+                       util.myeval and writes the report to --outfn. If the
+                       system file is a directory every file in it is
+                       evaluated, in parallel.
+        '''
+        options, args = self.parse_args()
+        goldfn, sysfn = args[0], args[-1]
+        kwargs = {'keycol': options.keycol, 'labelcol': options.labelcol,
+                            'colsep': options.colsep, 'header': options.header}
+
+        if os.path.isdir(sysfn):
+            sysfns = [os.path.join(sysfn, fn) for fn in
+                            sorted(os.listdir(sysfn))]
+            results = myeval.evaluateMany(goldfn, sysfns, options.processes,
+                                                                    **kwargs)
+        else:
+            results = [myeval.evaluate(goldfn, sysfn, options.presorted,
+                                                                    **kwargs)]
+
+        fd = myos.openw(options.outfn)
+
+        for i, result in enumerate(results):
+            result.report(fd, i == 0)       # column names just once
+
+        if options.outfn: myos.close(fd)    # leave stdout open for caller
+
+        return results
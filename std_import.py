@@ -0,0 +1,93 @@
+'''
+File: std_import.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: The standard bundle of imports used by my scripts, as in
+                   import std_import as si
+               or
+                   from std_import import *
+               Modules in the bundle are not imported until they are first
+               used, so a script that only touches files never loads the
+               database modules or the ODBC drivers behind them.
+Contents:
+    LAZY_MODULES - dict of name in the bundle to the module it stands for
+    LazyImporter - module type that imports members of the bundle on first
+                   attribute access
+Notes:
+    - from std_import import * imports everything in __all__ right away, since
+      it has to bind the names. db, adodbapi and pyodbc are left out of __all__
+      for that reason (and because db itself does from std_import import *), so
+      get them with si.db or import them directly.
+'''
+import sys, types, importlib
+
+# name in the bundle -> full name of module it stands for
+LAZY_MODULES = {
+    'os': 'os',
+    'sys': 'sys',
+    're': 're',
+    'copy': 'copy',
+    'logging': 'logging',
+    'ConfigParser': 'ConfigParser',
+    'myos': 'org.ghri.shalgrim.util.myos',
+    'mylogger': 'org.ghri.shalgrim.util.mylogger',
+    'mystring': 'org.ghri.shalgrim.util.mystring',
+    'mydate': 'org.ghri.shalgrim.util.mydate',
+    'myre': 'org.ghri.shalgrim.util.myre',
+    'opts': 'org.ghri.shalgrim.options.gen_opts',
+    'db': 'org.ghri.shalgrim.util.db',
+    'adodbapi': 'adodbapi',
+    'pyodbc': 'pyodbc',
+}
+
+# names that from std_import import * should not pull in
+NOT_STARRED = set(['db', 'adodbapi', 'pyodbc'])
+
+class LazyImporter(types.ModuleType):
+    '''
+    Class: LazyImporter
+    Superclass: types.ModuleType
+    Members:
+        __all__ - names bound by from std_import import *
+    Functionality: Stands in for this module in sys.modules and imports
+                   members of LAZY_MODULES the first time they are asked for,
+                   then stores them as regular attributes so later access costs
+                   nothing extra
+    '''
+
+    def __getattr__(self, name):
+        '''
+        Method: __getattr__
+        Input:
+            self - this LazyImporter
+            name - attribute being looked up
+        Output: module - the module that name stands for
+        Functionality: Only called when normal lookup fails, i.e., the first
+                       time name is used. Imports the module and caches it.
+        '''
+        try:
+            modname = LAZY_MODULES[name]    # get module name stands for
+        except KeyError:
+            raise AttributeError(name)      # not part of the bundle
+
+        module = importlib.import_module(modname)   # import it
+        setattr(self, name, module)                 # so it's found next time
+
+        return module
+
+    def __dir__(self):
+        '''
+        Method: __dir__
+        Input: self - this LazyImporter
+        Output: list of attributes, including those not imported yet
+        Functionality: Overrides dir() so the bundle can be browsed
+        '''
+        return sorted(set(self.__dict__.keys() + LAZY_MODULES.keys()))
+
+# replace this module with a LazyImporter carrying over its globals
+_lazy = LazyImporter(__name__, __doc__)
+_lazy.__dict__.update({k: v for k, v in globals().items()
+                                        if k not in ('sys', 'types', 'importlib')})
+_lazy.__all__ = sorted(set(LAZY_MODULES) - NOT_STARRED)
+_lazy._modref = sys.modules[__name__]   # keep original from being collected
+sys.modules[__name__] = _lazy
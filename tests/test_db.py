@@ -0,0 +1,333 @@
+'''
+File: test_db.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests db functions against sqlite databases
+'''
+import os, sys, shutil, sqlite3, tempfile, types, unittest, datetime, decimal
+import random, threading
+from org.ghri.shalgrim.util import db
+
+class RecordingCursor(object):
+    '''
+    Class: RecordingCursor
+    Members:
+        crsr - the sqlite cursor being wrapped
+        log - list of ('executemany', number of rows) and ('commit', None)
+              events, shared with the connection
+    Functionality: Cursor that records the batches executemany is given. It
+                   takes attributes sqlite3's cursors refuse, like pyodbc's
+                   fast_executemany.
+    '''
+    def __init__(self, crsr, log):
+        self.crsr = crsr
+        self.log = log
+
+    def executemany(self, sql, rows):
+        self.log.append(('executemany', len(rows)))
+        return self.crsr.executemany(sql, rows)
+
+class RecordingConnection(object):
+    '''
+    Class: RecordingConnection
+    Members:
+        cnctn - the sqlite connection being wrapped
+        log - as for RecordingCursor
+        crsrs - the cursors made, so a test can look at their attributes
+    Functionality: Connection that records commits and makes RecordingCursors
+    '''
+    def __init__(self, cnctn):
+        self.cnctn = cnctn
+        self.log = []
+        self.crsrs = []
+
+    def cursor(self):
+        self.crsrs.append(RecordingCursor(self.cnctn.cursor(), self.log))
+        return self.crsrs[-1]
+
+    def commit(self):
+        self.log.append(('commit', None))
+        self.cnctn.commit()
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = db.QueryCache(self.tmpdir, 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def tags(self):
+        '''
+        (table, key) of every table tag in the cache
+        '''
+        tablesdir = os.path.join(self.tmpdir, db.QueryCache.TABLES_DIR)
+
+        return sorted((table, key) for table in os.listdir(tablesdir)
+                        for key in os.listdir(os.path.join(tablesdir, table)))
+
+    def testNormalizeSql(self):
+        self.assertEqual(db.normalizeSql(" SELECT  a\n FROM\tt WHERE b = 'x  Y' "),
+                                            "SELECT a FROM t WHERE b = 'x  Y'")
+        self.assertNotEqual(self.cache.key('SELECT [Name] FROM t'),
+                                        self.cache.key('SELECT [name] FROM t'))
+        self.assertEqual(self.cache.key('SELECT a FROM t'),
+                                        self.cache.key('SELECT  a\nFROM t'))
+
+    def testPutGet(self):
+        self.assertEqual(self.cache.get('SELECT a FROM t'), (False, None))
+        self.cache.put('SELECT a FROM t', [[1], [2]], tables=['t'])
+        self.cache.put('SELECT a FROM t', [[3]], tables=['t'])  # replaces it
+        self.assertEqual(self.cache.get('SELECT a FROM t'), (True, [(3,)]))
+        self.assertEqual([fn for fn in os.listdir(self.tmpdir)
+                                    if fn.endswith('.tmp')], [])
+
+    def testConcurrentPuts(self):
+        errors = []
+
+        def put(i):
+            try:
+                for j in range(20):
+                    self.cache.put('SELECT a FROM t', [(i, j)]*100)
+            except Exception as myerr:
+                errors.append(myerr)
+
+        threads = [threading.Thread(target=put, args=(i,)) for i in range(4)]
+
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+
+        self.assertEqual(errors, [])
+        hit, rows = self.cache.get('SELECT a FROM t')
+        self.assertTrue(hit)
+        self.assertEqual(len(set(rows)), 1)     # one put's rows, not a mix
+        self.assertEqual([fn for fn in os.listdir(self.tmpdir)
+                                    if fn.endswith('.tmp')], [])
+
+    def testInvalidateTable(self):
+        self.cache.put('SELECT a FROM t JOIN u', [(1,)], tables=['t', 'U'])
+        self.cache.put('SELECT a FROM u', [(2,)], tables=['u'])
+        self.assertEqual(self.cache.invalidateTable('T'), 1)
+        self.assertFalse(self.cache.get('SELECT a FROM t JOIN u')[0])
+        self.assertTrue(self.cache.get('SELECT a FROM u')[0])
+        self.assertEqual(self.tags(), [('u', self.cache.key('SELECT a FROM u'))])
+
+    def testExpiredTagsRemoved(self):
+        cache = db.QueryCache(self.tmpdir, 'test', ttl=-1)
+        cache.put('SELECT a FROM t', [(1,)], tables=['t'])
+        self.assertEqual(cache.get('SELECT a FROM t'), (False, None))
+        self.assertEqual(self.tags(), [])
+
+    def testEvictedTagsRemoved(self):
+        cache = db.QueryCache(self.tmpdir, 'test', maxbytes=0)
+        cache.put('SELECT a FROM t', [(1,)], tables=['t'])
+        self.assertEqual(cache.get('SELECT a FROM t'), (False, None))
+        self.assertEqual(self.tags(), [])
+
+    def testClear(self):
+        self.cache.put('SELECT a FROM t', [(1,)], tables=['t'])
+        self.cache.clear()
+        self.assertEqual(self.cache.get('SELECT a FROM t'), (False, None))
+        self.assertEqual(self.tags(), [])
+
+class BulkInsertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfn = os.path.join(self.tmpdir, 'test.db')
+        self.cnctn = sqlite3.connect(self.dbfn)
+        self.cnctn.execute('CREATE TABLE pts (pid INTEGER, name TEXT)')
+
+    def tearDown(self):
+        self.cnctn.close()
+        shutil.rmtree(self.tmpdir)
+
+    def rows(self):
+        '''
+        rows in pts as a separate connection sees them, i.e., committed
+        '''
+        cnctn = sqlite3.connect(self.dbfn)
+        rows = cnctn.execute('SELECT pid, name FROM pts ORDER BY pid').fetchall()
+        cnctn.close()
+
+        return rows
+
+    def testInsert(self):
+        rows = [(i, 'pt%d'%(i)) for i in range(25)]
+        n = db.bulkInsert(self.cnctn, 'pts', ['pid', 'name'], iter(rows),
+                                                                batchsize=10)
+        self.assertEqual(n, 25)
+        self.assertEqual(self.rows(), rows)
+
+    def testBatching(self):
+        recorder = RecordingConnection(self.cnctn)
+        db.bulkInsert(recorder, 'pts', ['pid', 'name'],
+                            ((i, 'pt%d'%(i)) for i in range(25)), batchsize=10)
+        self.assertEqual([size for event, size in recorder.log
+                                if event == 'executemany'], [10, 10, 5])
+        self.assertTrue(recorder.crsrs[0].fast_executemany)
+
+    def testCommitEvery(self):
+        recorder = RecordingConnection(self.cnctn)
+        db.bulkInsert(recorder, 'pts', ['pid', 'name'],
+                            ((i, 'pt%d'%(i)) for i in range(25)), batchsize=4,
+                                                                commitEvery=10)
+
+        # 10 rounds up to 3 batches of 4, so commits after rows 12 and 24,
+        # then one for the last row
+        self.assertEqual([event for event, size in recorder.log],
+                    ['executemany']*3 + ['commit'] + ['executemany']*3 +
+                                        ['commit', 'executemany', 'commit'])
+        self.assertEqual(len(self.rows()), 25)
+
+    def testNoFastExecutemany(self):
+        crsr = self.cnctn.cursor()
+        self.assertRaises(AttributeError, setattr, crsr, 'fast_executemany',
+                                                                        True)
+        n = db.bulkInsert(self.cnctn, 'pts', ['pid', 'name'], [(1, 'a')])
+        self.assertEqual(n, 1)
+        self.assertEqual(self.rows(), [(1, u'a')])
+
+    def testEmpty(self):
+        self.assertEqual(db.bulkInsert(self.cnctn, 'pts', ['pid', 'name'], []),
+                                                                            0)
+        self.assertEqual(self.rows(), [])
+
+    def testInsertFile(self):
+        fn = os.path.join(self.tmpdir, 'pts.txt')
+        fd = open(fn, 'w')
+        fd.write('pid\tname\n1\ta\n2\tNULL\n3\t\n')
+        fd.close()
+        n = db.bulkInsertFile(self.cnctn, 'pts', ['pid', 'name'], fn,
+                                    skipHeader=True, nullstr='NULL', batchsize=2)
+        self.assertEqual(n, 3)
+        self.assertEqual(self.rows(), [(1, u'a'), (2, None), (3, u'')])
+
+    def testInsertFileNoNullstr(self):
+        fn = os.path.join(self.tmpdir, 'pts.txt')
+        fd = open(fn, 'w')
+        fd.write('1\tNULL\r\n2\t\r\n')
+        fd.close()
+        db.bulkInsertFile(self.cnctn, 'pts', ['pid', 'name'], fn)
+        self.assertEqual(self.rows(), [(1, u'NULL'), (2, u'')])
+
+class CountRowsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cnctn = sqlite3.connect(':memory:')
+        self.cnctn.execute('CREATE TABLE pts (pid INTEGER)')
+        random.seed(0)
+
+    def tearDown(self):
+        self.cnctn.close()
+
+    def insert(self, rowids):
+        self.cnctn.executemany('INSERT INTO pts (rowid, pid) VALUES (?, ?)',
+                                                [(i, i) for i in rowids])
+
+    def testSampleBigRowids(self):
+        top = 2**63 - 1                         # sqlite's largest rowid
+        self.insert(range(top - 1999, top + 1))
+        self.assertEqual(db.countRows('pts', self.cnctn, mode='sample'), 2000)
+
+    def testSampleGaps(self):
+        self.insert(range(0, 4000, 2))
+        n = db.countRows('pts', self.cnctn, mode='sample')
+        self.assertTrue(1600 < n < 2400, n)
+
+    def testSampleSmall(self):
+        self.insert(range(0, db.SAMPLE_PROBES, 2))    # counted, not sampled
+        self.assertEqual(db.countRows('pts', self.cnctn, mode='sample'),
+                                                        db.SAMPLE_PROBES//2)
+
+class TypeObject(object):
+    '''
+    Class: TypeObject
+    Members: values - the type codes this type object covers
+    Functionality: Stands in for adodbapi's DB-API type objects, which compare
+                   equal to each of their ADO type codes
+    '''
+    def __init__(self, values):
+        self.values = values
+
+    def __eq__(self, other):
+        return other in self.values
+
+    def __ne__(self, other):
+        return other not in self.values
+
+AD_INTEGER, AD_DECIMAL, AD_VARCHAR, AD_DATE = 3, 14, 200, 7
+
+class FetchTypedTest(unittest.TestCase):
+
+    def setUp(self):
+        sqlite3.register_converter('DECIMAL', decimal.Decimal)
+        self.cnctn = sqlite3.connect(':memory:',
+                                        detect_types=sqlite3.PARSE_DECLTYPES)
+        self.cnctn.execute('CREATE TABLE pts (pid INTEGER, name TEXT, '
+                                'amt DECIMAL, seen TIMESTAMP, born TEXT)')
+        self.cnctn.executemany('INSERT INTO pts VALUES (?, ?, ?, ?, ?)',
+            [(1, 'NULL', '1.5', datetime.datetime(2011, 9, 27, 8, 30),
+                                                    '2011-09-27 00:00:00.000'),
+             (2, 'b', None, None, 'NULL')])
+
+    def tearDown(self):
+        self.cnctn.close()
+
+    def fetch(self, **kwargs):
+        crsr = self.cnctn.execute('SELECT * FROM pts ORDER BY pid')
+
+        return db.fetchAllTyped(crsr, **kwargs)
+
+    def testSqlite(self):
+        rows = self.fetch(dateCols=['SEEN', 'born'], decimalsAsFloat=True)
+        self.assertEqual(rows, [
+                (1, None, 1.5, datetime.datetime(2011, 9, 27, 8, 30),
+                                            datetime.datetime(2011, 9, 27)),
+                (2, u'b', None, None, None)])
+        self.assertEqual(type(rows[0][2]), float)
+
+    def testSqliteNoConversions(self):
+        rows = self.fetch(nullstrs=())
+        self.assertEqual(rows[0][1], u'NULL')
+        self.assertEqual(rows[0][2], decimal.Decimal('1.5'))
+
+    def testSqliteColumnar(self):
+        cols = self.fetch(columnar=True)
+        self.assertEqual(cols[:2], [[1, 2], [None, u'b']])
+
+    def testPyodbcTypes(self):
+        description = [('pid', int), ('name', unicode),
+                            ('amt', decimal.Decimal), ('born', datetime.date)]
+        convs = db.makeConverters(description, dateCols=['born'],
+                                                        decimalsAsFloat=True)
+        rows = db._convertBatch([(1, u'NULL', decimal.Decimal('2.5'),
+                                        datetime.date(2011, 9, 27))], convs, False)
+        self.assertEqual(convs[0], None)
+        self.assertEqual(rows, [(1, None, 2.5, datetime.datetime(2011, 9, 27))])
+
+    def testAdoTypes(self):
+        adodbapi = types.ModuleType('adodbapi')
+        adodbapi.STRING = TypeObject((AD_VARCHAR,))
+        adodbapi.NUMBER = TypeObject((AD_INTEGER, AD_DECIMAL))
+        saved = sys.modules.get('adodbapi')
+        sys.modules['adodbapi'] = adodbapi
+
+        try:
+            description = [('pid', AD_INTEGER), ('name', AD_VARCHAR),
+                                ('amt', AD_DECIMAL), ('seen', AD_DATE)]
+            convs = db.makeConverters(description, decimalsAsFloat=True)
+        finally:
+            if saved: sys.modules['adodbapi'] = saved
+            else: del sys.modules['adodbapi']
+
+        seen = datetime.datetime(2011, 9, 27)
+        rows = db._convertBatch([(1, u'NULL', decimal.Decimal('2.5'), seen),
+                                    (2, u'b', 3, None)], convs, False)
+        self.assertEqual(convs[3], None)
+        self.assertEqual(rows, [(1, None, 2.5, seen), (2, u'b', 3, None)])
+        self.assertEqual(type(rows[1][2]), int)
+
+if __name__ == '__main__':
+    unittest.main()
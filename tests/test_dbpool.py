@@ -0,0 +1,175 @@
+'''
+File: test_dbpool.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests DbExecutor against sqlite databases
+'''
+import os, shutil, sqlite3, tempfile, threading, time, unittest
+from org.ghri.shalgrim.util import dbpool
+
+NUM_ROWS = 1000
+
+class CountingCursor(object):
+    '''
+    Class: CountingCursor
+    Members:
+        crsr - the sqlite cursor being wrapped
+        fetches - list that gets a value for each fetchmany call
+    Functionality: Cursor that records its fetchmany calls, so a test can see
+                   how far ahead of the caller iterBatches fetched
+    '''
+    def __init__(self, crsr, fetches):
+        self.crsr = crsr
+        self.fetches = fetches
+
+    def execute(self, *args):
+        return self.crsr.execute(*args)
+
+    def fetchmany(self, size):
+        self.fetches.append(size)
+        return self.crsr.fetchmany(size)
+
+class CountingConnection(object):
+    '''
+    Class: CountingConnection
+    Members:
+        cnctn - the sqlite connection being wrapped
+        fetches - as for CountingCursor
+    Functionality: Connection whose cursors are CountingCursors
+    '''
+    def __init__(self, cnctn, fetches):
+        self.cnctn = cnctn
+        self.fetches = fetches
+
+    def cursor(self):
+        return CountingCursor(self.cnctn.cursor(), self.fetches)
+
+    def close(self):
+        self.cnctn.close()
+
+class DbExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfn = os.path.join(self.tmpdir, 'test.db')
+        cnctn = sqlite3.connect(self.dbfn)
+        cnctn.execute('CREATE TABLE pts (pid INTEGER, name TEXT)')
+        cnctn.executemany('INSERT INTO pts VALUES (?, ?)',
+                            [(i, 'pt%d'%(i)) for i in range(NUM_ROWS)])
+        cnctn.commit()
+        cnctn.close()
+        self.executor = dbpool.DbExecutor(self.connect, numWorkers=2)
+
+    def tearDown(self):
+        self.executor.close()
+        shutil.rmtree(self.tmpdir)
+
+    def connect(self):
+        return sqlite3.connect(self.dbfn, check_same_thread=False)
+
+    def testResults(self):
+        rows = self.executor.selColumns('pts', ['pid', 'name'])
+        col = self.executor.selColumn('pts', 'name')
+        count = self.executor.countRows('pts')
+        self.assertEqual(sorted(rows.get(5)),
+                            [(i, u'pt%d'%(i)) for i in range(NUM_ROWS)])
+        self.assertEqual(sorted(col.get(5)),
+                            sorted(u'pt%d'%(i) for i in range(NUM_ROWS)))
+        self.assertEqual(count.get(5), NUM_ROWS)
+
+    def testSubmitRaises(self):
+        result = self.executor.submit(lambda cnctn:
+                                        cnctn.execute('SELECT * FROM nope'))
+        self.assertRaises(sqlite3.OperationalError, result.get, 5)
+
+    def testIterBatches(self):
+        batches = list(self.executor.iterBatches(
+                            'SELECT pid FROM pts ORDER BY pid', batchsize=64))
+        self.assertEqual([len(b) for b in batches[:-1]],
+                                                [64]*(len(batches) - 1))
+        self.assertEqual([row[0] for b in batches for row in b],
+                                                            range(NUM_ROWS))
+
+    def testIterBatchesBackpressure(self):
+        fetches = []
+        executor = dbpool.DbExecutor(lambda: CountingConnection(
+                                            self.connect(), fetches), 1)
+        prefetch = 2
+
+        try:
+            batches = executor.iterBatches('SELECT pid FROM pts', batchsize=10,
+                                                            prefetch=prefetch)
+            next(batches)
+            time.sleep(0.5)         # give the worker time to run ahead
+
+            # the batch we hold, a full queue, and one waiting to be queued
+            self.assertEqual(len(fetches), 1 + prefetch + 1)
+            batches.close()
+        finally:
+            executor.close()
+
+    def testIterBatchesQuitEarly(self):
+        fetches = []
+        executor = dbpool.DbExecutor(lambda: CountingConnection(
+                                            self.connect(), fetches), 1)
+
+        try:
+            for batch in executor.iterBatches('SELECT pid FROM pts',
+                                                    batchsize=10, prefetch=1):
+                break
+
+            # the worker has to give up its put and finish, or this hangs
+            done = executor.pool.apply_async(lambda: True)
+            self.assertTrue(done.get(5 + dbpool.POLL_SECONDS))
+            self.assertTrue(len(fetches) < NUM_ROWS/10)
+        finally:
+            executor.close()
+
+    def testIterBatchesQueryError(self):
+        batches = self.executor.iterBatches('SELECT * FROM nope')
+        self.assertRaises(sqlite3.OperationalError, list, batches)
+
+    def testIterBatchesConnectError(self):
+        def connect():
+            return sqlite3.connect(os.path.join(self.tmpdir, 'no', 'such.db'))
+
+        executor = dbpool.DbExecutor(connect, 1)
+        errors = []
+
+        def run():
+            try: list(executor.iterBatches('SELECT 1'))
+            except sqlite3.OperationalError as myerr: errors.append(myerr)
+
+        try:
+            thread = threading.Thread(target=run)
+            thread.daemon = True    # don't hang the test run if it hangs
+            thread.start()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(len(errors), 1)
+        finally:
+            executor.close()
+
+    def testExport(self):
+        outfn = os.path.join(self.tmpdir, 'out', 'pts.txt')
+        n = self.executor.export('SELECT pid, name FROM pts ORDER BY pid',
+                                                        outfn, batchsize=100)
+        self.assertEqual(n, NUM_ROWS)
+        self.assertEqual(open(outfn).read().splitlines(),
+                            ['%d\tpt%d'%(i, i) for i in range(NUM_ROWS)])
+
+    def testExportErrorRemovesFile(self):
+        outfn = os.path.join(self.tmpdir, 'pts.txt')
+        self.assertRaises(sqlite3.OperationalError, self.executor.export,
+                                                'SELECT * FROM nope', outfn)
+        self.assertFalse(os.path.exists(outfn))
+
+    def testExportShardsErrorRemovesShards(self):
+        outfn = os.path.join(self.tmpdir, 'out', 'pts.txt')
+        self.executor.export('SELECT pid, name FROM pts', outfn, nshards=2)
+        self.assertRaises(sqlite3.OperationalError, self.executor.export,
+                                    'SELECT * FROM nope', outfn, nshards=2)
+        self.assertEqual(os.listdir(os.path.dirname(outfn)), [])
+
+if __name__ == '__main__':
+    unittest.main()
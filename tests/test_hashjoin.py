@@ -0,0 +1,132 @@
+'''
+File: test_hashjoin.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests that hashJoin gives the same rows when it spills to disk
+               as when it joins in memory
+'''
+import os, random, shutil, tempfile, unittest
+from org.ghri.shalgrim.util import hashjoin
+
+def makeRows(rs, n, numKeys, width, asStr=False):
+    '''
+    n rows of a key in range(numKeys) followed by width other columns, with
+    repeated keys. Keys are strings if asStr, as read from a file
+    '''
+    rows = []
+
+    for i in range(n):
+        key = rs.randrange(numKeys)
+        others = [rs.choice(['a', 'b', None]) for j in range(width)]
+        rows.append([str(key) if asStr else key] + others)
+
+    return rows
+
+def nestedLoopJoin(left, right, how, nullstr='', colsep='\t'):
+    '''
+    sorted lines of left joined to right on int keys, the slow way
+    '''
+    lines = []
+
+    for lrow in left:
+        matches = [rrow[1:] for rrow in right if rrow[0] == int(lrow[0])]
+
+        if not matches and how == 'left': matches = [[None]*3]
+
+        for match in matches:
+            lines.append(colsep.join(nullstr if x is None else str(x)
+                                                    for x in lrow + match))
+
+    return sorted(lines)
+
+class HashJoinTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.rs = random.Random(0)
+        self.left = makeRows(self.rs, 300, 60, 2, True)
+        self.right = makeRows(self.rs, 200, 80, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def join(self, left, right, name, **kwargs):
+        '''
+        (n, lines) of left joined to right, written to a file called name
+        '''
+        outfn = os.path.join(self.tmpdir, name)
+        n = hashjoin.hashJoin(iter(left), iter(right), outfn=outfn,
+                                            spilldir=self.tmpdir, **kwargs)
+        fd = open(outfn)
+        lines = fd.read().splitlines()
+        fd.close()
+
+        return (n, lines)
+
+    def checkSpill(self, left, right, **kwargs):
+        '''
+        checks that a join spilling right to disk gives the in-memory join's
+        rows, and returns those rows
+        '''
+        n, expected = self.join(left, right, 'mem.txt', **kwargs)
+        self.assertEqual(n, len(expected))
+
+        for processes in (1, 2):
+            n, lines = self.join(left, right, 'spill.txt', memBudget=5,
+                                numPartitions=4, processes=processes, **kwargs)
+            self.assertEqual(n, len(lines))
+            self.assertEqual(sorted(lines), sorted(expected))
+
+        # spill files are cleaned up
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                                                    ['mem.txt', 'spill.txt'])
+
+        return expected
+
+    def testInner(self):
+        expected = self.checkSpill(self.left, self.right, keyfunc=int,
+                                                                nullstr='NULL')
+        self.assertEqual(sorted(expected), nestedLoopJoin(self.left,
+                                                self.right, 'inner', 'NULL'))
+
+    def testLeft(self):
+        expected = self.checkSpill(self.left, self.right, how='left',
+                                                    keyfunc=int, colsep=',')
+        self.assertEqual(sorted(expected), nestedLoopJoin(self.left,
+                                                self.right, 'left', '', ','))
+
+    def testNoKeyfunc(self):
+        right = [[str(row[0])] + row[1:] for row in self.right]
+        self.checkSpill(self.left, right, lkey=0, rkey=0)
+        self.checkSpill(self.left, [row[1:] + row[:1] for row in right],
+                                                                    rkey=3)
+
+    def testLeftEmptyRight(self):
+        for memBudget in (0, 5):
+            n, lines = self.join(self.left, [], 'out.txt', how='left',
+                                                        memBudget=memBudget)
+            self.assertEqual(n, len(self.left))
+            self.assertEqual(lines, ['\t'.join(x or '' for x in row)
+                                                        for row in self.left])
+
+            n, lines = self.join(self.left, [], 'out.txt', memBudget=memBudget)
+            self.assertEqual((n, lines), (0, []))
+
+    def testLeftEmptyRightPartitions(self):
+        # more partitions than right keys, so some left partitions have no
+        # right rows at all
+        right = [row for row in self.right if row[0] < 3]
+        expected = self.join(self.left, right, 'mem.txt', how='left',
+                                                            keyfunc=int)[1]
+        n, lines = self.join(self.left, right, 'spill.txt', how='left',
+                            keyfunc=int, memBudget=1, numPartitions=16)
+        self.assertEqual(n, len(lines))
+        self.assertEqual(sorted(lines), sorted(expected))
+        self.assertEqual(sorted(lines), nestedLoopJoin(self.left, right,
+                                                                    'left'))
+
+    def testBadJoinType(self):
+        self.assertRaises(ValueError, hashjoin.hashJoin, [], [], how='outer')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+'''
+File: test_mydate.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests DateIndex's answers against checking every event
+'''
+import datetime, logging, random, unittest
+from org.ghri.shalgrim.util import mydate
+from org.ghri.shalgrim.util.mydate import DateIndex, MyDatetime
+
+START = datetime.date(2000, 1, 1)
+
+def nondate():
+    '''
+    a nondate MyDatetime, without its warning
+    '''
+    logging.disable(logging.WARNING)
+
+    try: answer = MyDatetime('unknown')
+    finally: logging.disable(logging.NOTSET)
+
+    return answer
+
+class DateIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        rs = random.Random(0)
+        self.events = []        # (pid, date, event)
+
+        # a mix of date types, with repeated dates
+        for i in range(300):
+            date = START + datetime.timedelta(rs.randrange(200))
+
+            if i%3 == 1:
+                date = datetime.datetime.combine(date, datetime.time(i%24))
+            elif i%3 == 2:
+                date = MyDatetime(date.strftime(mydate.DEFAULT_FORMAT))
+
+            self.events.append((rs.randrange(5), date, 'e%03d'%(i)))
+
+        self.dates = dict((event, date) for pid, date, event in self.events)
+        self.nondates = [(0, nondate(), 'n0'), (3, nondate(), 'n1')]
+        self.index = DateIndex(self.events + self.nondates)
+        self.anchors = [START + datetime.timedelta(d)
+                                            for d in range(-5, 210, 7)]
+
+    def dayEvents(self, pid):
+        '''
+        pid's dated events as (day, event), in the order added
+        '''
+        return [(mydate.toDayNum(date), event)
+                            for p, date, event in self.events if p == pid]
+
+    def testBetween(self):
+        for pid in range(6):
+            for start in self.anchors:
+                end = start + datetime.timedelta(10)
+                lo, hi = start.toordinal(), end.toordinal()
+                expected = sorted((day, event) for day, event in
+                                self.dayEvents(pid) if lo <= day <= hi)
+                answer = self.index.between(pid, start, end)
+                self.assertEqual(sorted(answer), sorted(event for day, event
+                                                                in expected))
+                self.assertEqual([mydate.toDayNum(self.dates[e]) for e in
+                                answer], sorted(day for day, e in expected))
+
+    def testWithin(self):
+        for pid in range(6):
+            for date in self.anchors:
+                day = date.toordinal()
+
+                for before, after in ((True, True), (True, False),
+                                                        (False, True)):
+                    lo = day - 5 if before else day
+                    hi = day + 5 if after else day
+                    expected = [event for d, event in self.dayEvents(pid)
+                                                            if lo <= d <= hi]
+                    answer = self.index.within(pid, date, 5, before, after)
+                    self.assertEqual(sorted(answer), sorted(expected))
+
+    def testNearest(self):
+        for pid in range(6):
+            dayEvents = self.dayEvents(pid)
+
+            for date in self.anchors:
+                answer = self.index.nearest(pid, date)
+
+                if not dayEvents:
+                    self.assertEqual(answer, None)
+                    continue
+
+                day = date.toordinal()
+                best = min(abs(d - day) for d, event in dayEvents)
+                event, ndays = answer
+                self.assertEqual(abs(ndays), best)
+                self.assertTrue((day + ndays, event) in dayEvents)
+
+                # ties go to the earlier event
+                if ndays > 0: self.assertFalse((day - ndays) in
+                                                [d for d, e in dayEvents])
+
+    def testNearestTie(self):
+        index = DateIndex([(1, datetime.date(2000, 1, 1), 'before'),
+                           (1, datetime.date(2000, 1, 5), 'after')])
+        self.assertEqual(index.nearest(1, datetime.date(2000, 1, 3)),
+                                                                ('before', -2))
+        self.assertEqual(index.nearest(1, datetime.date(2000, 1, 4)),
+                                                                ('after', 1))
+        self.assertEqual(index.nearest(1, datetime.date(1999, 1, 1)),
+                                                            ('before', 365))
+        self.assertEqual(index.nearest(1, datetime.date(2001, 1, 1)),
+                                                            ('after', -362))
+        self.assertEqual(index.nearest(2, datetime.date(2000, 1, 1)), None)
+
+    def testAddAfterQuery(self):
+        index = DateIndex()
+        index.add(1, datetime.date(2000, 1, 10), 'b')
+        self.assertEqual(index.nearest(1, datetime.date(2000, 1, 1)),
+                                                                ('b', 9))
+
+        # merged into the already sorted events at the next query
+        index.add(1, datetime.date(2000, 1, 2), 'a')
+        index.add(1, datetime.date(2000, 1, 20), 'c')
+        index.add(1, datetime.date(2000, 1, 10))
+        self.assertEqual(index.nearest(1, datetime.date(2000, 1, 1)),
+                                                                ('a', 1))
+        self.assertEqual(index.between(1, datetime.date(2000, 1, 1),
+                                                datetime.date(2000, 1, 31)),
+                            ['a', 'b', datetime.date(2000, 1, 10), 'c'])
+        self.assertEqual(index.within(1, datetime.date(2000, 1, 10), 0),
+                                            ['b', datetime.date(2000, 1, 10)])
+
+    def testNondates(self):
+        self.assertEqual(self.index.getNondates(0), ['n0'])
+        self.assertEqual(self.index.getNondates(1), [])
+
+        # nondates are never in an answer
+        allDays = (datetime.date(1, 1, 1), datetime.date(9999, 12, 31))
+        self.assertEqual(sorted(self.index.between(3, *allDays)),
+                sorted(event for p, d, event in self.events if p == 3))
+
+        # a nondate has no place to search from
+        self.assertRaises(ValueError, self.index.between, 0, nondate(),
+                                                                    START)
+        self.assertRaises(ValueError, self.index.within, 0, nondate(), 5)
+        self.assertRaises(ValueError, self.index.nearest, 0, nondate())
+
+    def testMany(self):
+        anchors = dict((pid, self.anchors[pid*4]) for pid in range(6))
+        anchors[2] = nondate()
+
+        for before, after in ((True, True), (False, True)):
+            answer = self.index.withinMany(anchors, 10, before, after)
+            self.assertEqual(sorted(answer), range(6))
+            self.assertEqual(answer[2], None)
+
+            for pid, date in anchors.items():
+                if pid != 2:
+                    self.assertEqual(answer[pid], self.index.within(pid, date,
+                                                            10, before, after))
+
+        answer = self.index.nearestMany(anchors)
+        self.assertEqual(sorted(answer), range(6))
+        self.assertEqual(answer[2], None)
+        self.assertEqual(answer[5], None)       # no events
+
+        for pid, date in anchors.items():
+            if pid != 2:
+                self.assertEqual(answer[pid], self.index.nearest(pid, date))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+'''
+File: test_myeval.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests that myeval counts the same confusion matrix whichever
+               way the files are compared, and rejects duplicate keys
+'''
+import os, shutil, tempfile, unittest
+from org.ghri.shalgrim.util import myeval
+
+# gold labels, and system labels with k11 and k12 missing and k13 and k14
+# spurious
+GOLD = dict(('k%02d'%(i), 'pos' if i%3 else 'neg') for i in range(1, 13))
+SYSTEM = dict(('k%02d'%(i), 'pos' if i%2 else 'neg') for i in range(1, 11) +
+                                                                    [13, 14])
+
+def expectedConfusion(gold, system):
+    '''
+    confusion matrix of system against gold, counted pair by pair
+    '''
+    confusion = {}
+
+    for key in set(gold) | set(system):
+        pair = (gold.get(key), system.get(key))
+        confusion[pair] = confusion.get(pair, 0) + 1
+
+    return confusion
+
+class EvaluateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def writeFile(self, name, pairs, pad=0):
+        '''
+        writes pairs, a dict or list of (key, label), sorted by key, with a
+        third column of pad characters to make the file bigger
+        '''
+        if isinstance(pairs, dict): pairs = pairs.items()
+
+        fn = os.path.join(self.tmpdir, name)
+        fd = open(fn, 'w')
+
+        for key, label in sorted(pairs):
+            fd.write('%s\t%s\t%s\n'%(key, label, 'x'*pad))
+
+        fd.close()
+
+        return fn
+
+    def testIndexedMatchesMerged(self):
+        expected = expectedConfusion(GOLD, SYSTEM)
+
+        # gold smaller, so gold is indexed, then system smaller
+        for goldPad, sysPad in ((0, 50), (50, 0)):
+            goldfn = self.writeFile('gold.txt', GOLD, goldPad)
+            sysfn = self.writeFile('sys.txt', SYSTEM, sysPad)
+            self.assertEqual(goldPad < sysPad,
+                            os.path.getsize(goldfn) < os.path.getsize(sysfn))
+            indexed = myeval.evaluate(goldfn, sysfn)
+            merged = myeval.evaluate(goldfn, sysfn, presorted=True)
+            self.assertEqual(indexed.confusion, expected)
+            self.assertEqual(merged.confusion, expected)
+
+    def testMissingAndSpurious(self):
+        goldfn = self.writeFile('gold.txt', {'a': 'pos', 'b': 'pos'})
+        sysfn = self.writeFile('sys.txt', {'a': 'pos', 'c': 'pos'})
+
+        for presorted in (False, True):
+            result = myeval.evaluate(goldfn, sysfn, presorted)
+            self.assertEqual(result.counts('pos'), (1, 1, 1))   # tp, fp, fn
+            self.assertEqual(result.confusion, {('pos', 'pos'): 1,
+                                        ('pos', None): 1, (None, 'pos'): 1})
+
+    def testDuplicateKeys(self):
+        dup = [('k05', 'neg')]          # next to the other k05 once sorted
+
+        for goldDup, sysDup in ((dup, []), ([], dup)):
+            for goldPad, sysPad in ((0, 50), (50, 0)):
+                goldfn = self.writeFile('gold.txt', GOLD.items() + goldDup,
+                                                                    goldPad)
+                sysfn = self.writeFile('sys.txt', SYSTEM.items() + sysDup,
+                                                                    sysPad)
+
+                for presorted in (False, True):
+                    self.assertRaises(ValueError, myeval.evaluate, goldfn,
+                                                            sysfn, presorted)
+
+                self.assertRaises(ValueError, myeval.evaluateMany, goldfn,
+                                                                [sysfn], 1)
+
+    def testEvaluateMany(self):
+        goldfn = self.writeFile('gold.txt', GOLD)
+        systems = [SYSTEM, GOLD, {}, dict(GOLD, k01='neg', k99='pos')]
+        sysfns = [self.writeFile('sys%d.txt'%(i), labels)
+                                    for i, labels in enumerate(systems)]
+
+        for processes in (1, 2):
+            results = myeval.evaluateMany(goldfn, sysfns, processes)
+            self.assertEqual([result.name for result in results], sysfns)
+
+            for sysfn, labels, result in zip(sysfns, systems, results):
+                self.assertEqual(result.confusion,
+                                    myeval.evaluate(goldfn, sysfn).confusion)
+                self.assertEqual(result.confusion,
+                                            expectedConfusion(GOLD, labels))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+'''
+File: test_myos.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests myos readers on files with mixed line endings and on
+               compressed files, and sharded writes
+'''
+import os, shutil, tempfile, unittest, hashlib
+import bz2, gzip, random, struct, zlib
+from org.ghri.shalgrim.util import myos
+
+class GetColsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def writeFile(self, text):
+        fn = os.path.join(self.tmpdir, 'cols.txt')
+        fd = open(fn, 'wb')
+        fd.write(text)
+        fd.close()
+
+        return fn
+
+    def checkSame(self, text, *cols):
+        fn = self.writeFile(text)
+        expected = myos.getColsFromFile(fn, *cols)
+
+        for rangeSize in (1, 4, 1 << 20):   # ranges of about a line and more
+            self.assertEqual(myos.getColsFromFileParallel(fn, *cols,
+                                processes=2, rangeSize=rangeSize), expected)
+
+        return expected
+
+    def testLoneCarriageReturn(self):
+        self.assertEqual(self.checkSame('a\tb\r\nc\rd\te\nf\tg\n', 0, 1),
+                                [['a', 'c\rd', 'f'], ['b', 'e', 'g']])
+
+    def testShortAndBlankLines(self):
+        self.assertEqual(self.checkSame('a\tb\r\n\nc\r\nd\te\t\r\nf', 1, 0),
+                [['b', None, None, 'e', None], ['a', '', 'c', 'd', 'f']])
+
+    def testUnordered(self):
+        fn = self.writeFile(''.join('%d\tx%d\n'%(i, i) for i in range(100)))
+        cols = myos.getColsFromFileParallel(fn, 0, 1, processes=2, rangeSize=64,
+                                                                ordered=False)
+        self.assertEqual(sorted(zip(*cols)), sorted(zip(
+                                            *myos.getColsFromFile(fn, 0, 1))))
+
+class WriteShardsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outfn = os.path.join(self.tmpdir, 'out', 'rows.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testManifest(self):
+        n = myos.writeShards(((i, 'v%d'%(i), None) for i in range(25)),
+                                    self.outfn, 3, key=0, rowsPerWrite=4)
+        shards = myos.readManifest(self.outfn + myos.MANIFEST_SUFFIX)
+        self.assertEqual(n, 25)
+        self.assertEqual(sum(rows for fn, rows, md5 in shards), 25)
+        lines = []
+
+        for fn, rows, md5 in shards:
+            data = open(fn, 'rb').read()
+            self.assertEqual(hashlib.md5(data).hexdigest(), md5)
+            self.assertEqual(data.count('\n'), rows)
+            lines.extend(data.splitlines())
+
+        self.assertEqual(sorted(lines), sorted('%d\tv%d\t'%(i, i)
+                                                        for i in range(25)))
+
+    def testWritelinesShards(self):
+        myos.writelines(['a', 'b', 'c'], self.outfn, nshards=2)
+        shards = myos.readManifest(self.outfn + myos.MANIFEST_SUFFIX)
+        self.assertEqual(''.join(open(fn, 'rb').read() for fn, r, m in shards),
+                                                                'a\nb\nc\n')
+
+    def testFailureRemovesShardsAndOldManifest(self):
+        myos.writeShards([(1,), (2,)], self.outfn, 2)
+        self.assertTrue(os.path.exists(self.outfn + myos.MANIFEST_SUFFIX))
+
+        def rows():
+            yield (3,)
+            raise IOError('fetch failed')
+
+        self.assertRaises(IOError, myos.writeShards, rows(), self.outfn, 2,
+                                                                rowsPerWrite=1)
+        self.assertEqual(os.listdir(os.path.dirname(self.outfn)), [])
+
+def writeBgzf(data, fn, blocksize=65280):
+    '''
+    writes data to fn as BGZF, as bgzip would, ending with the empty EOF block
+    '''
+    fd = open(fn, 'wb')
+
+    for start in xrange(0, len(data) + 1, blocksize):
+        block = data[start:start + blocksize]
+        comp = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        cdata = comp.compress(block) + comp.flush()
+        fd.write(struct.pack('<4BI2BH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67,
+                                                    2, len(cdata) + 25))
+        fd.write(cdata)
+        fd.write(struct.pack('<2I', zlib.crc32(block) & 0xffffffff, len(block)))
+
+    fd.close()
+
+def splitAt(data, splits):
+    '''
+    data cut at each offset in splits
+    '''
+    ends = list(splits) + [len(data)]
+
+    return [data[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+def writeGzip(data, fn, splits=()):
+    '''
+    writes data to fn as gzip, a member per piece of data cut at splits
+    '''
+    fd = open(fn, 'wb')
+
+    for piece in splitAt(data, splits):
+        gz = gzip.GzipFile(fileobj=fd, mode='wb')
+        gz.write(piece)
+        gz.close()
+
+    fd.close()
+
+def writeBz2(data, fn, splits=()):
+    '''
+    writes data to fn as bz2, a stream per piece of data cut at splits
+    '''
+    fd = open(fn, 'wb')
+
+    for piece in splitAt(data, splits):
+        fd.write(bz2.compress(piece))
+
+    fd.close()
+
+def writePlain(data, fn):
+    fd = open(fn, 'wb')
+    fd.write(data)
+    fd.close()
+
+class OpenrTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+        # line endings are mixed, some lines are blank and the last has no
+        # ending. About 250 KB, so it takes several BGZF blocks
+        rs = random.Random(0)
+        ends = ['\n']*8 + ['\n\n', '\r\n', '\r']
+        self.text = ''.join('%x%s'%(rs.getrandbits(rs.randint(1, 400)),
+                                rs.choice(ends)) for i in xrange(5000)) + 'end'
+
+        # where to end members so lines, and one '\r\n', cross them
+        crlf = self.text.index('\r\n')
+        self.splits = [crlf + 1, len(self.text)//3, len(self.text)//2 + 7]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def checkFile(self, write):
+        fn = os.path.join(self.tmpdir, 'text')
+        write(self.text, fn)
+
+        for universal in (False, True):
+            text = self.text
+
+            if universal:
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+            expected = [line + '\n' for line in text.split('\n')]
+            expected[-1] = expected[-1][:-1]        # no newline at the end
+
+            for numThreads in (1, 4):
+                fd = myos.openr(fn, numThreads, universal)
+                self.assertEqual(list(fd), expected)
+                fd.close()
+
+                fd = myos.openr(fn, numThreads, universal)
+                self.assertEqual(list(iter(fd.readline, '')), expected)
+                fd.close()
+
+                fd = myos.openr(fn, numThreads, universal)
+                self.assertEqual(fd.read(), text)
+                fd.close()
+
+    def testPlain(self):
+        self.checkFile(writePlain)
+
+    def testGzip(self):
+        self.checkFile(writeGzip)
+
+    def testMultiMemberGzip(self):
+        self.checkFile(lambda data, fn: writeGzip(data, fn, self.splits))
+
+    def testBz2(self):
+        self.checkFile(writeBz2)
+
+    def testMultiMemberBz2(self):
+        self.checkFile(lambda data, fn: writeBz2(data, fn, self.splits))
+
+    def testBgzf(self):
+        self.checkFile(writeBgzf)
+
+if __name__ == '__main__':
+    unittest.main()
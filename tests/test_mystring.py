@@ -0,0 +1,89 @@
+'''
+File: test_mystring.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests that RowSerializer writes what MyStr.join would
+'''
+import datetime, unittest
+from org.ghri.shalgrim.util.mystring import MyStr, RowSerializer
+
+class FixedZone(datetime.tzinfo):
+    '''
+    Class: FixedZone
+    Members: offset - timedelta east of UTC
+    Functionality: tzinfo at a fixed offset, since python 2 has none built in
+    '''
+    def __init__(self, hours):
+        self.offset = datetime.timedelta(hours=hours)
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+class RowSerializerTest(unittest.TestCase):
+
+    def checkColumn(self, col):
+        '''
+        checks joinRows of one column of values against MyStr.join row by row
+        '''
+        rows = [(v,) for v in col]
+        expected = ''.join(MyStr('\t').join(row) + '\n' for row in rows)
+        self.assertEqual(RowSerializer().joinRows(rows), expected)
+
+    def testMixedTypes(self):
+        self.checkColumn([1, 1.0, True, 1L, '1', 1, True])
+        self.checkColumn([0.0, -0.0, 0.0])
+
+    def testAwareDatetimes(self):
+        utc = datetime.datetime(2012, 7, 27, 12, tzinfo=FixedZone(0))
+        pacific = utc.astimezone(FixedZone(-8))
+        self.assertEqual(utc, pacific)      # equal, but format differently
+        self.checkColumn([utc, pacific, utc, pacific])
+
+    def testNaiveAndAwareDatetimes(self):
+        naive = datetime.datetime(2012, 7, 27, 12)
+        aware = naive.replace(tzinfo=FixedZone(0))
+        self.checkColumn([naive, aware, naive, aware])
+
+    def testNones(self):
+        rows = [(None, 'a'), (datetime.date(2012, 7, 27), None)]
+        self.assertEqual(RowSerializer(nullstr='NULL').joinRows(rows),
+                                    'NULL\ta\n2012-07-27\tNULL\n')
+
+    def testNoneStrings(self):
+        rows = [('None', None, 1), ('xNoney', 2.5, None), ('a', 'b', 3)]
+        self.assertEqual(RowSerializer(nullstr='-').joinRows(rows),
+                                'None\t-\t1\nxNoney\t2.5\t-\na\tb\t3\n')
+        self.assertEqual(RowSerializer().joinRow(rows[0]), 'None\t\t1')
+
+    def testRaggedRows(self):
+        day = datetime.date(2012, 7, 27)
+        rows = [(day, None), (1,), (day, 'a', None)]
+        self.assertEqual(RowSerializer().joinRows(rows),
+                                    '2012-07-27\t\n1\n2012-07-27\ta\t\n')
+
+    def testNullableDateColumns(self):
+        day = datetime.date(2012, 7, 27)
+        self.checkColumn([day, day, day.replace(day=28), day])
+        rows = [(day, 1), (None, 2), (day, None)]
+        self.assertEqual(RowSerializer().joinRows(rows),
+                                    '2012-07-27\t1\n\t2\n2012-07-27\t\n')
+
+    def testDateFormats(self):
+        ser = RowSerializer(datefmt='%m/%d/%Y')
+        day = datetime.date(2012, 7, 27)
+        noon = datetime.datetime(2012, 7, 28, 12)
+
+        # dates first, or only in later rows, or only in a later column
+        for rows in ([(day, 1), (noon, 2)], [(1, 'a'), (2, day)],
+                                                    [(day, 1), (2, noon)]):
+            expected = ''.join(MyStr('\t').join(ser.format(v) for v in row) +
+                                                        '\n' for row in rows)
+            self.assertEqual(ser.joinRows(rows), expected)
+
+        self.assertEqual(ser.joinRow((noon, None)), '07/28/2012\t')
+
+if __name__ == '__main__':
+    unittest.main()
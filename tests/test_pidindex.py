@@ -0,0 +1,69 @@
+'''
+File: test_pidindex.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests PtntIdIndex against the sets of strings it stands in for
+'''
+import os, shutil, tempfile, unittest
+from org.ghri.shalgrim.util import pidindex
+
+class PtntIdIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def writeFile(self, text):
+        fn = os.path.join(self.tmpdir, 'pids.txt')
+        fd = open(fn, 'w')
+        fd.write(text)
+        fd.close()
+
+        return fn
+
+    def testRead(self):
+        fn = self.writeFile('PAT_ID\n5\n3\r\n\n10\n3\n0\n')
+        index = pidindex.readPtntIdIndex(fn)    # header skipped with warning
+        self.assertEqual(list(index), [0, 3, 5, 10])
+
+        for pid in ('5', 5, '0', ' 10\n'):
+            self.assertTrue(pid in index)
+
+        for pid in ('005', '4', 'PAT_ID', '', -5, '-5'):
+            self.assertFalse(pid in index)
+
+    def testLeadingZerosRejected(self):
+        fn = self.writeFile('123\n00123\n')
+        self.assertRaises(ValueError, pidindex.readPtntIdIndex, fn)
+        self.assertRaises(ValueError, pidindex.PtntIdIndex, ['00123'])
+
+    def testRange(self):
+        big = pidindex.MAX_ID
+        index = pidindex.PtntIdIndex([str(big), big - 1, 1])
+        self.assertEqual(list(index), [1, big - 1, big])
+        self.assertTrue(str(big) in index)
+        self.assertFalse(big + 1 in index)
+        self.assertRaises(ValueError, pidindex.PtntIdIndex, [big + 1])
+        self.assertRaises(ValueError, pidindex.PtntIdIndex, [-1])
+
+    def testSaveLoad(self):
+        index = pidindex.PtntIdIndex([7, '3', pidindex.MAX_ID])
+        fn = os.path.join(self.tmpdir, 'pids.idx')
+        pidindex.savePtntIdIndex(index, fn)
+
+        for usemmap in (True, False):
+            loaded = pidindex.loadPtntIdIndex(fn, usemmap)
+            self.assertEqual(list(loaded), list(index))
+            self.assertTrue(str(pidindex.MAX_ID) in loaded)
+            self.assertFalse('4' in loaded)
+
+    def testSetOps(self):
+        a = pidindex.PtntIdIndex([1, 2, 3])
+        b = pidindex.PtntIdIndex([2, 3, 4])
+        self.assertEqual(list(a & b), [2, 3])
+        self.assertEqual(list(a | b), [1, 2, 3, 4])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+'''
+File: test_quantiles.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests KllSketch's rank error against exact quantiles
+'''
+import bisect, random, unittest
+from org.ghri.shalgrim.util.quantiles import KllSketch, mergeSketches, K
+
+N = 100000
+SHARDS = 8
+QS = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+EPS = 0.0165*K/200      # rank error bound, as in the quantiles module NOTE
+
+def rankError(values, est, q):
+    '''
+    Function: rankError
+    Input:
+        values - sorted list of the exact values
+        est - a sketch's value for quantile q
+        q - a fraction from 0 to 1
+    Output: how far est's true ranks are from q*n, as a fraction of n
+    '''
+    n = len(values)
+    lo, hi = bisect.bisect_left(values, est), bisect.bisect_right(values, est)
+    target = q*n
+
+    return max(lo - target, target - hi, 0)/float(n)
+
+class KllSketchTest(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(7)
+
+        # skewed counts with many ties, like reports per patient
+        self.values = [int(rand.expovariate(0.05)) for i in range(N)]
+        self.exact = sorted(self.values)
+
+    def checkError(self, sketch):
+        self.assertEqual(len(sketch), N)
+        self.assertFalse(sketch.isExact())
+        self.assertTrue(sketch.size < 4*sketch.k)
+
+        for q in QS:
+            err = rankError(self.exact, sketch.quantile(q), q)
+            self.assertTrue(err <= EPS, 'q=%s rank error %.4f'%(q, err))
+
+    def testOneSketch(self):
+        sketch = KllSketch(seed=1)
+        sketch.updateMany(self.values)
+        self.checkError(sketch)
+
+    def testMergedSketches(self):
+        sketches = [KllSketch(seed=i) for i in range(SHARDS)]
+
+        for i, value in enumerate(self.values):
+            sketches[i%SHARDS].update(value)
+
+        self.checkError(mergeSketches(sketches, seed=1))
+        self.assertEqual(sum(len(s) for s in sketches), N)   # unchanged
+
+    def testExactWhenSmall(self):
+        values = [5, 1, 4, 2, 3, 3, 9, 0]
+        sketch = KllSketch()
+        sketch.updateMany(values)
+        self.assertTrue(sketch.isExact())
+        self.assertEqual([sketch.kth(i) for i in range(len(values))],
+                                                                sorted(values))
+        self.assertEqual(sketch.rank(3), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+'''
+File: test_rptstats.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Tests that RptCountSnapshot's incremental updates give the same
+               counts as recounting the directory
+'''
+import os, random, shutil, tempfile, time, unittest
+from org.ghri.shalgrim.util import rptstats
+
+class RptCountSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.adir = os.path.join(self.tmpdir, 'rpts')
+        os.mkdir(self.adir)
+        self.pidfn = os.path.join(self.tmpdir, 'pids.txt')
+        self.snapfn = os.path.join(self.tmpdir, 'snap.pkl')
+        self.serial = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def addReport(self, pid):
+        self.serial += 1
+        open(os.path.join(self.adir, '%d_%d.txt'%(pid, self.serial)),
+                                                                'w').close()
+
+    def writePids(self, pids):
+        fd = open(self.pidfn, 'w')
+        fd.write(''.join('%d\n'%(pid) for pid in pids))
+        fd.close()
+
+    def recount(self, pidfn):
+        '''
+        (counts, hist, numReports) counted from scratch
+        '''
+        if pidfn:
+            counts = dict((line.strip(), 0) for line in open(pidfn)
+                                                            if line.strip())
+        else:
+            counts = {}
+
+        for fn in os.listdir(self.adir):
+            pid = fn.split('_')[0]
+
+            if pid in counts or not pidfn:
+                counts[pid] = counts.get(pid, 0) + 1
+
+        hist = {}
+
+        for count in counts.itervalues():
+            hist[count] = hist.get(count, 0) + 1
+
+        return (counts, hist, sum(counts.itervalues()))
+
+    def check(self, snap, pidfn):
+        counts, hist, numReports = self.recount(pidfn)
+        self.assertEqual(snap.counts, counts)
+        self.assertEqual(snap.hist, hist)
+        self.assertEqual(snap.numReports, numReports)
+        self.assertEqual(snap.getNumPtnts(),
+                                    len([c for c in counts.values() if c]))
+
+    def checkRandomSteps(self, pidfn):
+        rs = random.Random(0)
+
+        if pidfn: self.writePids(range(1, 8))
+
+        for step in range(40):
+            op = rs.random()
+            fns = os.listdir(self.adir)
+
+            if op < 0.5:
+                self.addReport(rs.randint(1, 10))
+            elif op < 0.8 and fns:
+                os.remove(os.path.join(self.adir, rs.choice(fns)))
+            elif pidfn:
+                self.writePids(rs.sample(range(1, 11), rs.randint(0, 10)))
+
+            # save and load it back, as scripts do between runs
+            snap = rptstats.loadRptCountSnapshot(self.snapfn, self.adir,
+                                                                        pidfn)
+            snap.update()
+            snap.save(self.snapfn)
+            self.check(snap, pidfn)
+
+    def testRandomStepsWithPidFile(self):
+        self.checkRandomSteps(self.pidfn)
+
+    def testRandomStepsEveryone(self):
+        self.checkRandomSteps('')
+
+    def testAddInSameTick(self):
+        stamp = int(time.time())            # whole seconds, as a coarse mtime
+        snap = rptstats.RptCountSnapshot(self.adir)
+        self.addReport(1)
+        os.utime(self.adir, (stamp, stamp))
+        snap.update()
+
+        # a report added with the directory's mtime unchanged, as a coarse
+        # mtime gives one added just after a listing
+        self.addReport(2)
+        os.utime(self.adir, (stamp, stamp))
+        self.assertEqual(snap.update(), (1, 0))
+        self.check(snap, '')
+
+    def testPidFileChangeInSameTick(self):
+        stamp = int(time.time())
+        self.addReport(1)
+        self.addReport(3)
+        self.writePids([1, 2])
+        os.utime(self.pidfn, (stamp, stamp))
+        snap = rptstats.RptCountSnapshot(self.adir, self.pidfn)
+        snap.update()
+
+        # same size and mtime, different patients
+        self.writePids([3, 4])
+        os.utime(self.pidfn, (stamp, stamp))
+        snap.update()
+        self.check(snap, self.pidfn)
+
+    def testOldStampTrusted(self):
+        old = int(time.time()) - 100
+        self.addReport(1)
+        os.utime(self.adir, (old, old))
+        snap = rptstats.RptCountSnapshot(self.adir)
+        self.assertEqual(snap.update(), (1, 0))
+
+        # well before the listing, so an unchanged mtime skips listing
+        self.addReport(2)
+        os.utime(self.adir, (old, old))
+        self.assertEqual(snap.update(), (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,595 @@
+'''
+File: bench.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Benchmarks for the shalgrim packages. Run as
+                   python bench.py benchmark [args]
+               where benchmark is one of the names in BENCHMARKS. Results are
+               written to stdout.
+Contents:
+    importtime - benchmark that reports how long each module takes to import,
+                 in the style of python 3's -X importtime
+    joinrows - benchmark of mystring.RowSerializer against MyStr.join
+    sanitize - benchmark of myre.sanitize and sanitizeStream against regex
+               substitution
+    quantiles - accuracy and speed of quantiles.KllSketch against exact
+                quantiles
+    decompress - benchmark of myos.readlines on compressed files against
+                 decompressing to disk and then reading
+    parallelcols - benchmark of myos.getColsFromFileParallel against
+                   getColsFromFile
+    getcols - benchmark of myos.getColsFromFile against the split-based
+              version it replaced, in cells per second
+    dateindex - benchmark of mydate.DateIndex against subtracting MyDatetimes
+                pairwise
+    BENCHMARKS - dict of benchmark name to benchmark function
+'''
+import sys, os, time, __builtin__, importlib, datetime, cStringIO, random, bisect
+import struct, zlib, gzip, bz2, shutil, tempfile, logging
+
+def importtime(modname='std_import', *attrs):
+    '''
+    Function: importtime
+    Input:
+        modname - module to import
+        attrs - attributes of modname to touch after importing it, e.g. to see
+                what using si.db costs on top of import std_import
+    Output: none
+    Functionality: Imports modname (then gets attrs from it) with a hook on
+                   __import__ that times every module imported along the way.
+                   Prints a line per module in the order they finish with self
+                   and cumulative microseconds, indented by nesting, like
+                   python 3's -X importtime. Run it in a fresh interpreter or
+                   modules that are already imported won't show up.
+    '''
+    realImport = __builtin__.__import__
+    stack = []              # [name, start, time spent in nested imports]
+    report = []             # (self us, cumulative us, depth, name)
+
+    def timedImport(name, *args, **kwargs):
+        '''
+        __import__ replacement that records time for modules not yet imported
+        '''
+        if name in sys.modules:             # nothing to time
+            return realImport(name, *args, **kwargs)
+
+        stack.append([name, time.time(), 0.0])
+
+        try:
+            return realImport(name, *args, **kwargs)
+        finally:
+            name, start, nested = stack.pop()
+            cumulative = time.time() - start
+
+            if stack:                       # charge time to parent
+                stack[-1][2] += cumulative
+
+            report.append((int((cumulative - nested)*1e6),
+                                    int(cumulative*1e6), len(stack), name))
+
+    __builtin__.__import__ = timedImport
+
+    try:
+        start = time.time()
+        module = importlib.import_module(modname)
+
+        for attr in attrs:                  # touch each requested attribute
+            getattr(module, attr)
+
+        total = time.time() - start
+    finally:
+        __builtin__.__import__ = realImport
+
+    print 'import time: self [us] | cumulative | imported package'
+
+    for selfus, cumus, depth, name in report:
+        print 'import time: %9d | %10d | %s%s'%(selfus, cumus, '  '*depth, name)
+
+    print 'total: %.1f ms'%(total*1000)
+
+    # say whether the expensive database drivers came along
+    for driver in ('adodbapi', 'pyodbc'):
+        print '%s loaded: %s'%(driver, driver in sys.modules)
+
+    return
+
+def timeit(func, *args):
+    '''
+    Function: timeit
+    Input:
+        func - function to time
+        args - arguments to pass it
+    Output: (seconds, result) - how long func(*args) took and what it returned
+    Functionality: Times a single call
+    '''
+    start = time.time()
+    result = func(*args)
+
+    return (time.time() - start, result)
+
+def joinrows(nrows='1000000', ncols='20'):
+    '''
+    Function: joinrows
+    Input:
+        nrows - number of rows to serialize
+        ncols - number of fields per row
+    Output: none
+    Functionality: Serializes rows of ints, floats, strings and datetimes to
+                   TSV with MyStr.join row by row, and with RowSerializer's
+                   joinRow, joinRows and writeRows, and prints the times
+    '''
+    from org.ghri.shalgrim.util.mystring import MyStr, RowSerializer
+
+    nrows, ncols = int(nrows), int(ncols)
+    dt = datetime.datetime(2012, 7, 27)
+    proto = [(12345, 3.25, 'abc', dt)[i%4] for i in range(ncols)]
+    plain = [v for v in proto if v is not dt] or ['abc']    # no datetimes
+    rows = [proto]*nrows
+    tab = MyStr('\t')
+    ser = RowSerializer()
+
+    print 'rows: %d, fields per row: %d'%(nrows, ncols)
+
+    for name, rowset in (('mixed', rows), ('no dates', [plain]*nrows)):
+        base, expected = timeit(lambda: [tab.join(row) for row in rowset])
+        print '%s MyStr.join: %.2f s'%(name, base)
+
+        secs, result = timeit(lambda: [ser.joinRow(row) for row in rowset])
+        assert result == expected
+        print '%s RowSerializer.joinRow: %.2f s (%.1fx)'%(name, secs, base/secs)
+
+        secs, result = timeit(ser.joinRows, rowset)
+        assert result == '\n'.join(expected) + '\n'
+        print '%s RowSerializer.joinRows: %.2f s (%.1fx)'%(name, secs,
+                                                                base/secs)
+
+        buf = cStringIO.StringIO()
+        secs, result = timeit(ser.writeRows, iter(rowset), buf)
+        print '%s RowSerializer.writeRows: %.2f s (%.1fx)'%(name, secs,
+                                                                base/secs)
+
+    return
+
+def sanitize(mb='16', chunkkb='1024'):
+    '''
+    Function: sanitize
+    Input:
+        mb - size of the document in megabytes
+        chunkkb - sanitizeStream's chunk size in kilobytes
+    Output: none
+    Functionality: Builds a document of text sprinkled with control chars and
+                   their entities, cleans it by substituting
+                   UNICODE_CONTROL_CHARS and CONTROL_CHARS_RE, with sanitize
+                   and with sanitizeStream, checks they agree and prints the
+                   times. The chunk size is deliberately not a multiple of the
+                   line length so entities get split across chunks.
+    '''
+    from org.ghri.shalgrim.util import myre
+
+    line = 'Patient seen\x01 for follow-up &#19;of &amp; BP\x0c &#2;ok\t&#20;\n'
+    doc = line*(int(mb)*(1 << 20)/len(line))
+    chunksize = int(chunkkb)*1024 + 3
+
+    print 'document: %.1f MB, chunk: %d bytes'%(len(doc)/float(1 << 20),
+                                                                    chunksize)
+
+    def regex():
+        return myre.CONTROL_CHARS_RE.sub('', myre.UNICODE_CONTROL_CHARS.sub('',
+                                                                        doc))
+
+    def stream():
+        outfd = cStringIO.StringIO()
+        myre.sanitizeStream(cStringIO.StringIO(doc), outfd, chunksize)
+        return outfd.getvalue()
+
+    base, expected = timeit(regex)
+    print 'regex sub: %.2f s (%.0f MB/sec)'%(base, len(doc)/base/(1 << 20))
+
+    for name, func in (('sanitize', lambda: myre.sanitize(doc)),
+                       ('sanitize memoryview',
+                                lambda: myre.sanitize(memoryview(doc))),
+                       ('sanitizeStream', stream)):
+        secs, result = timeit(func)
+        assert result == expected
+        print '%s: %.2f s (%.0f MB/sec, %.1fx)'%(name, secs,
+                                    len(doc)/secs/(1 << 20), base/secs)
+
+    return
+
+def quantiles(n='1000000', k='200', shards='8'):
+    '''
+    Function: quantiles
+    Input:
+        n - number of values
+        k - sketch size parameter
+        shards - number of sketches to build and merge
+    Output: none
+    Functionality: Sketches skewed integer counts (like reports per patient)
+                   and uniform floats in one sketch and in shards merged
+                   together, and prints, for several quantiles, the sketch's
+                   value, the exact value and the rank error, i.e., how far
+                   the sketch value's true rank is from q*n as a fraction of n
+    '''
+    from org.ghri.shalgrim.util.quantiles import KllSketch, mergeSketches
+
+    n, k, shards = int(n), int(k), int(shards)
+    rand = random.Random(0)
+    datasets = (('counts', [int(rand.expovariate(0.1)) for i in xrange(n)]),
+                ('floats', [rand.random() for i in xrange(n)]))
+    qs = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+    print 'values: %d, k: %d, shards: %d'%(n, k, shards)
+
+    for name, values in datasets:
+        exact = sorted(values)
+
+        def sketchAll():
+            sketch = KllSketch(k, seed=1)
+            sketch.updateMany(values)
+            return sketch
+
+        def sketchShards():
+            parts = []
+
+            for i in range(shards):
+                part = KllSketch(k, seed=i)
+                part.updateMany(values[i::shards])
+                parts.append(part)
+
+            return mergeSketches(parts, k)
+
+        base, result = timeit(sorted, values)
+        print '%s exact sort: %.2f s'%(name, base)
+
+        for how, func in (('one sketch', sketchAll),
+                          ('merged shards', sketchShards)):
+            secs, sketch = timeit(func)
+            print '%s %s: %.2f s, %d items held'%(name, how, secs, sketch.size)
+            worst = 0.0
+
+            for q in qs:
+                est = sketch.quantile(q)
+
+                # est's true ranks span [lo, hi); error is distance to q*n
+                lo = bisect.bisect_left(exact, est)
+                hi = bisect.bisect_right(exact, est)
+                target = q*n
+                err = max(0, lo - target, target - hi)/float(n)
+                worst = max(worst, err)
+                print '    q=%.2f sketch: %s exact: %s rank error: %.4f'%(q,
+                                        est, exact[int(target)], err)
+
+            print '    worst rank error: %.4f'%(worst)
+
+    return
+
+def _writeBgzf(data, fn, blocksize=65280):
+    '''
+    Function: _writeBgzf
+    Input:
+        data - string to compress
+        fn - file to write
+        blocksize - uncompressed bytes per block
+    Output: none
+    Functionality: Writes data as BGZF, as bgzip would, ending with the empty
+                   EOF block
+    '''
+    fd = open(fn, 'wb')
+
+    for start in xrange(0, len(data) + 1, blocksize):
+        block = data[start:start + blocksize]
+        comp = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        cdata = comp.compress(block) + comp.flush()
+        fd.write(struct.pack('<4BI2BH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67,
+                                                    2, len(cdata) + 25))
+        fd.write(cdata)
+        fd.write(struct.pack('<2I', zlib.crc32(block) & 0xffffffff, len(block)))
+
+    fd.close()
+
+    return
+
+def decompress(mb='64', threads='4'):
+    '''
+    Function: decompress
+    Input:
+        mb - size of the uncompressed text in megabytes
+        threads - threads myos.openr decompresses BGZF with
+    Output: none
+    Functionality: Writes tab-separated text as gzip, multi-member gzip, bz2
+                   and BGZF, then reads each by decompressing to a temporary
+                   file and reading that, and with myos.readlines, checks they
+                   agree and prints the times
+    '''
+    from org.ghri.shalgrim.util import myos
+
+    rand = random.Random(0)
+    words = ['pathology', 'report', 'benign', 'tissue', 'margin', 'negative',
+             'carcinoma', 'specimen', 'left', 'right', 'breast', 'biopsy']
+    lines = []
+    size = 0
+
+    while size < int(mb)*(1 << 20):     # vary lines so they don't compress away
+        line = '%07d\t2012-%02d-%02d\t%s\t%d\n'%(rand.randint(0, 9999999),
+                            rand.randint(1, 12), rand.randint(1, 28),
+                            ' '.join(rand.sample(words, 6)), rand.randint(0, 99))
+        lines.append(line)
+        size += len(line)
+
+    text = ''.join(lines)
+    tmpdir = tempfile.mkdtemp(prefix='bench')
+    fns = dict((fmt, os.path.join(tmpdir, 'text.' + fmt))
+                            for fmt in ('gz', 'multi.gz', 'bz2', 'bgzf.gz'))
+
+    try:
+        fd = gzip.open(fns['gz'], 'wb')
+        fd.write(text)
+        fd.close()
+        fd = open(fns['multi.gz'], 'wb')    # a member per 4 MB, as pigz makes
+
+        for start in xrange(0, len(text), 1 << 22):
+            member = cStringIO.StringIO()
+            gz = gzip.GzipFile(fileobj=member, mode='wb')
+            gz.write(text[start:start + (1 << 22)])
+            gz.close()
+            fd.write(member.getvalue())
+
+        fd.close()
+        fd = bz2.BZ2File(fns['bz2'], 'wb')
+        fd.write(text)
+        fd.close()
+        _writeBgzf(text, fns['bgzf.gz'])
+        expected = text.splitlines(True)
+
+        print 'text: %.1f MB, %d lines'%(len(text)/float(1 << 20),
+                                                                len(expected))
+
+        for fmt in ('gz', 'multi.gz', 'bz2', 'bgzf.gz'):
+            fn = fns[fmt]
+            opener = bz2.BZ2File if fmt == 'bz2' else gzip.open
+
+            def decompressThenRead():
+                outfn = os.path.join(tmpdir, 'text')
+                infd, outfd = opener(fn, 'rb'), open(outfn, 'wb')
+                shutil.copyfileobj(infd, outfd, 1 << 20)
+                infd.close()
+                outfd.close()
+                return myos.readlines(outfn)
+
+            base, result = timeit(decompressThenRead)
+            assert result == expected
+            print '%s (%.1f MB) decompress then read: %.2f s'%(fmt,
+                                    os.path.getsize(fn)/float(1 << 20), base)
+
+            secs, result = timeit(myos.readlines, fn)
+            assert result == expected
+            print '%s myos.readlines: %.2f s (%.1fx)'%(fmt, secs, base/secs)
+
+            if fmt == 'bgzf.gz':
+                fd = myos.openr(fn, int(threads))
+                secs, result = timeit(fd.readlines)
+                fd.close()
+                assert result == expected
+                print '%s myos.openr %s threads: %.2f s (%.1fx)'%(fmt,
+                                                    threads, secs, base/secs)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return
+
+def parallelcols(mb='256', processes='', cols='0,2'):
+    '''
+    Function: parallelcols
+    Input:
+        mb - size of the file in megabytes
+        processes - worker processes. Default number of cores
+        cols - comma-separated column indexes to extract
+    Output: none
+    Functionality: Writes a TSV file and extracts columns from it with
+                   getColsFromFile and with getColsFromFileParallel, ordered
+                   and not, checks they agree and prints the times
+    '''
+    from org.ghri.shalgrim.util import myos
+
+    processes = int(processes) if processes else None
+    cols = [int(c) for c in cols.split(',')]
+    line = '%07d\t2012-07-27\tsome words of a pathology report\t%d\n'
+    fd, fn = tempfile.mkstemp(prefix='bench')
+    os.close(fd)
+    fd = open(fn, 'wb')
+    size = 0
+
+    for i in xrange(sys.maxint):
+        if size >= int(mb)*(1 << 20): break
+
+        data = line%(i, i%100)
+        fd.write(data)
+        size += len(data)
+
+    fd.close()
+
+    try:
+        print 'file: %.1f MB, %d lines'%(size/float(1 << 20), i)
+        base, expected = timeit(myos.getColsFromFile, fn, *cols)
+        print 'getColsFromFile: %.2f s'%(base)
+        secs, result = timeit(lambda: myos.getColsFromFileParallel(fn, *cols,
+                                                        processes=processes))
+        assert result == expected
+        print 'getColsFromFileParallel: %.2f s (%.1fx)'%(secs, base/secs)
+        secs, result = timeit(lambda: myos.getColsFromFileParallel(fn, *cols,
+                                        processes=processes, ordered=False))
+        assert sorted(zip(*result)) == sorted(zip(*expected))
+        print 'getColsFromFileParallel unordered: %.2f s (%.1fx)'%(secs,
+                                                                base/secs)
+    finally:
+        os.remove(fn)
+
+    return
+
+def _splitGetColsFromFile(fn, *args, **kwargs):
+    '''
+    Function: _splitGetColsFromFile
+    Input: as for myos.getColsFromFile
+    Output: as for myos.getColsFromFile
+    Functionality: getColsFromFile as it was before it used the csv module,
+                   kept here to compare against
+    '''
+    from org.ghri.shalgrim.util import myos
+
+    colsep = kwargs.get('colsep', '\t')
+    lines = [line.split(colsep) for line in myos.readlines(fn)]
+    answer = []
+
+    for colnum in args:
+        try:
+            answer.append([line[colnum].strip() for line in lines])
+        except IndexError:
+            answer.append([line[colnum].strip() if colnum < len(line) else
+                                                        None for line in lines])
+
+    return answer
+
+def getcols(mb='64', cols='0,2', ncols='12'):
+    '''
+    Function: getcols
+    Input:
+        mb - size of the file in megabytes
+        cols - comma-separated column indexes to extract
+        ncols - number of columns in the file
+    Output: none
+    Functionality: Writes a TSV file and extracts columns from it with the old
+                   split-based getColsFromFile and with the csv-based one, with
+                   and without quoting, checks they agree and prints cells
+                   (requested values) per second
+    '''
+    from org.ghri.shalgrim.util import myos
+
+    cols = [int(c) for c in cols.split(',')]
+    fields = ['%07d', '2012-07-27', 'some words', '%d', '3.25', 'abc'] * \
+                                                            (int(ncols)/6 + 1)
+    line = '\t'.join(fields[:int(ncols)]) + '\n'
+    nfmt = line.count('%')
+    fd, fn = tempfile.mkstemp(prefix='bench')
+    os.close(fd)
+    fd = open(fn, 'wb')
+    size = nlines = 0
+
+    while size < int(mb)*(1 << 20):
+        data = line%((nlines,)*nfmt)
+        fd.write(data)
+        size += len(data)
+        nlines += 1
+
+    fd.close()
+
+    try:
+        cells = nlines*len(cols)
+        print 'file: %.1f MB, %d lines of %s fields, %d cells requested'%(
+                                size/float(1 << 20), nlines, ncols, cells)
+        base, expected = timeit(_splitGetColsFromFile, fn, *cols)
+        print 'split getColsFromFile: %.2f s (%.0f cells/sec)'%(base,
+                                                                cells/base)
+
+        for name, kwargs in (('getColsFromFile', {}),
+                             ('quotechar=\'"\' getColsFromFile',
+                                                    {'quotechar': '"'})):
+            secs, result = timeit(lambda: myos.getColsFromFile(fn, *cols,
+                                                                **kwargs))
+            assert result == expected
+            print '%s: %.2f s (%.0f cells/sec, %.1fx)'%(name, secs,
+                                                    cells/secs, base/secs)
+    finally:
+        os.remove(fn)
+
+    return
+
+def dateindex(nevents='1000000', nptnts='10000', ndays='30'):
+    '''
+    Function: dateindex
+    Input:
+        nevents - number of events
+        nptnts - number of patients they're spread over
+        ndays - window around each patient's diagnosis date
+    Output: none
+    Functionality: Finds each patient's events within ndays of diagnosis by
+                   subtracting MyDatetimes pairwise and with a DateIndex,
+                   checks they agree and prints the times. One in a hundred
+                   dates is a nondate.
+    '''
+    from org.ghri.shalgrim.util.mydate import MyDatetime, DateIndex
+
+    nevents, nptnts, ndays = int(nevents), int(nptnts), int(ndays)
+    rand = random.Random(0)
+    first = datetime.date(1995, 1, 1)
+    logging.disable(logging.WARNING)    # nondates log a warning each
+
+    # one MyDatetime per distinct day so setup doesn't dominate
+    dates = [MyDatetime((first + datetime.timedelta(i)).strftime('%m/%d/%Y'))
+                                                            for i in xrange(7300)]
+    nondate = MyDatetime('unknown')
+
+    def pick():
+        return nondate if rand.random() < 0.01 else rand.choice(dates)
+
+    events = [(rand.randrange(nptnts), pick()) for i in xrange(nevents)]
+    anchors = dict((pid, pick()) for pid in xrange(nptnts))
+    eventsByPtnt = {}
+
+    for pid, date in events:
+        eventsByPtnt.setdefault(pid, []).append(date)
+
+    print 'events: %d, patients: %d, window: %d days'%(nevents, nptnts, ndays)
+
+    def pairwise():
+        answer = {}
+
+        for pid, dx in anchors.iteritems():
+            if not dx.isDate():
+                answer[pid] = None
+                continue
+
+            answer[pid] = sorted([ev for ev in eventsByPtnt.get(pid, [])
+                    if ev.isDate() and abs((ev - dx).days) <= ndays],
+                                                            key=lambda ev: ev.dt)
+
+        return answer
+
+    try:
+        base, expected = timeit(pairwise)
+        print 'pairwise: %.2f s'%(base)
+        secs, index = timeit(DateIndex, events)
+        print 'DateIndex build: %.2f s'%(secs)
+        query, result = timeit(index.withinMany, anchors, ndays)
+        print 'DateIndex first withinMany (sorts): %.2f s'%(query)
+        query, result = timeit(index.withinMany, anchors, ndays)
+        assert result == expected
+        print 'DateIndex withinMany: %.3f s (%.0fx)'%(query, base/query)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return
+
+# benchmark name -> function taking the command line args after the name
+BENCHMARKS = {
+    'importtime': importtime,
+    'joinrows': joinrows,
+    'sanitize': sanitize,
+    'quantiles': quantiles,
+    'decompress': decompress,
+    'parallelcols': parallelcols,
+    'getcols': getcols,
+    'dateindex': dateindex,
+}
+
+if __name__ == '__main__':      # if run as main
+    try:
+        benchmark = BENCHMARKS[sys.argv[1]]     # get benchmark to run
+    except (IndexError, KeyError):              # if not given or not known
+
+        # print usage error message
+        print >> sys.stderr, 'Usage: python bench.py benchmark [args] ' + \
+                             'where benchmark is one of ' + \
+                             ', '.join(sorted(BENCHMARKS))
+        sys.exit()              # and exit
+
+    benchmark(*sys.argv[2:])    # run benchmark with rest of args
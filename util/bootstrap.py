@@ -0,0 +1,257 @@
+'''
+File: bootstrap.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Bootstrap confidence intervals for the median, quartiles, mean
+               and standard deviation of per-patient counts, e.g., reports per
+               patient. Resamples are drawn with NumPy a block at a time, and
+               blocks can be spread over a process pool. Every block has its
+               own seed drawn from the caller's seed, so results are the same
+               however many processes run them.
+Contents:
+    bootstrapCIs - function that gets CIs from an array of per-patient values
+    bootstrapHistCIs - function that gets CIs from a histogram of values, such
+                       as rptstats.RptCountSnapshot.getHist gives
+    getPointEstimates - function that gets the statistics themselves
+    STATS - names of the statistics, in the order they're reported
+NOTE: A resample of n patients from a histogram with k distinct values is one
+      multinomial draw of n over the k values' frequencies, so the work per
+      resample grows with k, not n. Counts like reports per patient have few
+      distinct values and 10,000 resamples of 100,000 patients take seconds.
+      Data with mostly distinct values (e.g., follow-up days) has k close to
+      n, so when k is more than half of n the patients are resampled by index
+      instead, which skips the k-wide multinomial and cumulative counts.
+      Either way blocks are cut so no array in one is over MAX_BLOCK_CELLS, and
+      the quartiles, which need those cumulative counts or a sort, are only
+      computed if asked for.
+NOTE: The median and quartiles use the same index rules as getQuartileVals in
+      onetime/median_iqr_rpts_per_ptnt.py, so the point estimates match what
+      that script reports.
+'''
+import logging, multiprocessing
+import numpy
+
+STATS = ('q1', 'median', 'q3', 'mean', 'sd')
+
+NUM_RESAMPLES = 10000   # default number of bootstrap resamples
+BLOCK_SIZE = 500        # resamples drawn at once
+MAX_BLOCK_CELLS = 2**22 # most values (32 MB of int64) in one array of a block
+ORDER_STATS = frozenset(['q1', 'median', 'q3'])     # stats needing a sort
+ALPHA = 0.05            # default 1 - confidence level
+
+def _orderStats(cum, vals, ks):
+    '''
+    Function: _orderStats
+    Input:
+        cum - 2-d array whose rows are cumulative counts of each value in a
+              resample
+        vals - sorted array of the distinct values
+        ks - indexes into the sorted resample
+    Output: list of arrays, one per k in ks, of the value at index k in each
+            resample
+    Functionality: Finds order statistics of many resamples at once without
+                   sorting them
+    '''
+    return [vals[(cum <= k).sum(axis=1)] for k in ks]
+
+def _quartiles(orderStats, n):
+    '''
+    Function: _quartiles
+    Input:
+        orderStats - function taking a tuple of indexes into the sorted samples
+                     and returning a list of arrays of the values there
+        n - size of each sample
+    Output: dict of q1, median and q3 to arrays of them per sample
+    Functionality: Picks the quartiles out of sorted samples, with the index
+                   rules of getQuartileVals
+    '''
+    medind = n//2
+    q1, q3, hi = orderStats((int(n*0.25) + 1, int(n*0.75), medind))
+
+    if n%2 == 0:
+        med = (hi + orderStats((medind - 1,))[0])/2.0
+    else:
+        med = hi.astype(float)
+
+    return {'q1': q1, 'median': med, 'q3': q3}
+
+def _stats(freqs, vals, n, names=STATS):
+    '''
+    Function: _stats
+    Input:
+        freqs - 2-d array whose rows are how many times each value in vals
+                occurs in a sample
+        vals - sorted array of the distinct values
+        n - size of each sample
+        names - names in STATS of the statistics to compute
+    Output: stats - dict of each name in names to array of that statistic per
+                    row
+    Functionality: Computes the statistics for many samples at once
+    '''
+    stats = {}
+
+    if not ORDER_STATS.isdisjoint(names):
+        cum = freqs.cumsum(axis=1)
+        stats.update(_quartiles(lambda ks: _orderStats(cum, vals, ks), n))
+
+    fvals = vals.astype(float)
+    mean = freqs.dot(fvals)/n
+    var = freqs.dot(fvals*fvals)/n - mean*mean
+    sd = numpy.sqrt(numpy.maximum(var, 0)*n/(n - 1)) if n > 1 else 0*mean
+    stats.update({'mean': mean, 'sd': sd})
+
+    return dict((name, stats[name]) for name in names)
+
+def _sampleStats(samples, names=STATS):
+    '''
+    Function: _sampleStats
+    Input:
+        samples - 2-d array whose rows are samples of values
+        names - names in STATS of the statistics to compute
+    Output: stats - as for _stats
+    Functionality: Computes the statistics for many samples at once from the
+                   samples themselves, sorting them only for the quartiles
+    '''
+    n = samples.shape[1]
+    stats = {}
+
+    if not ORDER_STATS.isdisjoint(names):
+        srtd = numpy.sort(samples, axis=1)
+        stats.update(_quartiles(lambda ks: [srtd[:, k] for k in ks], n))
+
+    fsamples = samples.astype(float)
+    mean = fsamples.mean(axis=1)
+    sd = fsamples.std(axis=1, ddof=1) if n > 1 else 0*mean
+    stats.update({'mean': mean, 'sd': sd})
+
+    return dict((name, stats[name]) for name in names)
+
+def _bootstrapBlock(task):
+    '''
+    Function: _bootstrapBlock
+    Input: task - (vals, probs, n, size, seed, names) where probs is None if
+                  vals holds every patient's value rather than the distinct
+                  values, and the patients are resampled by index
+    Output: stats - dict of each name in names to array of that statistic for
+                    each of size resamples
+    Functionality: Draws a block of resamples and computes their statistics.
+                   Run in a worker process if there's a pool.
+    '''
+    vals, probs, n, size, seed, names = task
+    rs = numpy.random.RandomState(seed)
+
+    if probs is None:
+        return _sampleStats(vals[rs.randint(0, n, (size, n))], names)
+
+    freqs = rs.multinomial(n, probs, size)
+
+    return _stats(freqs, vals, n, names)
+
+def _fromHist(hist):
+    '''
+    Function: _fromHist
+    Input: hist - dict of value to number of patients with that value
+    Output: (vals, freqs, n) - sorted array of values with at least one
+                               patient, array of their numbers of patients and
+                               the total number of patients
+    Functionality: Converts a histogram to arrays
+    '''
+    vals = numpy.array(sorted(v for v, f in hist.items() if f > 0))
+    freqs = numpy.array([hist[v] for v in vals], dtype=numpy.int64)
+
+    return (vals, freqs, int(freqs.sum()))
+
+def getPointEstimates(hist):
+    '''
+    Function: getPointEstimates
+    Input: hist - dict of value to number of patients with that value
+    Output: dict of name in STATS to that statistic of the patients
+    Functionality: Computes the statistics the CIs are for
+    '''
+    vals, freqs, n = _fromHist(hist)
+
+    if not n: raise ValueError('no patients to compute statistics of')
+
+    stats = _stats(freqs.reshape(1, -1), vals, n)
+
+    return dict((name, float(stats[name][0])) for name in STATS)
+
+def bootstrapHistCIs(hist, numResamples=NUM_RESAMPLES, alpha=ALPHA, seed=0,
+                        processes=None, blockSize=BLOCK_SIZE, stats=STATS):
+    '''
+    Function: bootstrapHistCIs
+    Input:
+        hist - dict of value (e.g., number of reports) to number of patients
+               with that value
+        numResamples - number of bootstrap resamples
+        alpha - 1 - confidence level, e.g., 0.05 for 95% CIs
+        seed - seed the block seeds are drawn from
+        processes - number of worker processes. If None, blocks are run in
+                    this process
+        blockSize - resamples drawn at once. Cut down if a block's arrays
+                    would be over MAX_BLOCK_CELLS
+        stats - names in STATS of the statistics to get CIs for. Leaving out
+                q1, median and q3 saves the work of finding them
+    Output: cis - dict of each name in stats to (estimate, lower, upper) where
+                  estimate is the statistic of the patients in hist and lower
+                  and upper are the ends of its percentile bootstrap CI
+    Functionality: Bootstrap CIs for the statistics in STATS
+    '''
+    vals, freqs, n = _fromHist(hist)
+
+    if not n: raise ValueError('no patients to resample')
+
+    if len(vals) > n//2:        # mostly distinct, so resample patients
+        draws, probs = numpy.repeat(vals, freqs), None
+        width = n
+    else:
+        draws, probs = vals, freqs/float(n)
+        width = len(vals)
+
+    blockSize = max(1, min(blockSize, MAX_BLOCK_CELLS//width))
+    sizes = [blockSize]*(numResamples//blockSize)
+
+    if numResamples%blockSize: sizes.append(numResamples%blockSize)
+
+    seeds = numpy.random.RandomState(seed).randint(0, 2**31 - 1, len(sizes))
+    tasks = [(draws, probs, n, size, int(s), stats)
+                                            for size, s in zip(sizes, seeds)]
+
+    if processes is None:
+        blocks = [_bootstrapBlock(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+
+        try:
+            blocks = pool.map(_bootstrapBlock, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    estimates = getPointEstimates(hist)
+    pcts = (100*alpha/2, 100*(1 - alpha/2))
+    cis = {}
+
+    for name in stats:
+        dist = numpy.concatenate([block[name] for block in blocks])
+        lower, upper = numpy.percentile(dist, pcts)
+        cis[name] = (estimates[name], float(lower), float(upper))
+
+    logging.debug('%d resamples of %d patients with %d distinct values in '
+                    'blocks of %d'%(numResamples, n, len(vals), blockSize))
+
+    return cis
+
+def bootstrapCIs(values, **kwargs):
+    '''
+    Function: bootstrapCIs
+    Input:
+        values - sequence or array of per-patient values, e.g., the number of
+                 reports of each patient
+        kwargs - options as for bootstrapHistCIs
+    Output: cis - as for bootstrapHistCIs
+    Functionality: Bootstrap CIs for the statistics in STATS
+    '''
+    vals, freqs = numpy.unique(numpy.asarray(values), return_counts=True)
+
+    return bootstrapHistCIs(dict(zip(vals.tolist(), freqs.tolist())), **kwargs)
@@ -0,0 +1,308 @@
+'''
+File: cohortcache.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Cache of cohort artifacts (patient ID files and the report
+               names of each patient in a directory) that a parent process
+               loads once and a pool of worker processes reads without copying.
+               Everything is kept in flat arrays of shared memory made with
+               multiprocessing.sharedctypes, so the workers don't each re-read
+               PID files and re-list directories, and memory use doesn't grow
+               with the number of workers.
+Contents:
+    CohortCache - class holding the shared arrays, built in the parent
+    SharedStrings - class that is a read-only sequence of strings kept in
+                    shared memory as one blob and an array of offsets
+    SharedRptNames - class that is a read-only dict of patient ID to report
+                     names over shared memory
+    initWorker - function to pass as a Pool initializer to give workers a
+                 CohortCache, or to call to use one in this process
+    getPtntIds - function that looks up a cached PtntIdIndex
+    getRptNames - function that looks up cached report names by patient
+NOTE: Python 2 has no multiprocessing.shared_memory, so the arrays are
+      sharedctypes.RawArrays. They have to be made before the pool starts and
+      handed to the workers by the Pool initializer: forked workers inherit
+      them and spawned (Windows) workers map the same memory.
+NOTE: Entries are stamped with their files' sizes and mtimes (a report dir's
+      changes when reports are added or removed), as myos.readlinesCached
+      does. A lookup whose files have changed since gets None, so the caller
+      reads them itself rather than getting a stale cohort.
+'''
+import os, array, bisect, ctypes, collections, logging
+from multiprocessing import sharedctypes
+from org.ghri.shalgrim.util import pidindex
+
+# typecode of offset arrays: 8 bytes where there is one, as for patient IDs
+OFFSET_TYPECODE = pidindex.TYPECODE
+
+# cache the lookup functions use in this process, set by initWorker
+_CACHE = None
+
+def _key(*paths):
+    '''
+    Function: _key
+    Input: paths - file or directory names
+    Output: tuple of the paths made absolute, so a file is the same key however
+            a script names it
+    Functionality: Makes a cache key
+    '''
+    return tuple(os.path.normcase(os.path.abspath(p)) for p in paths)
+
+def _stamp(*paths):
+    '''
+    Function: _stamp
+    Input: paths - file or directory names
+    Output: tuple of (size, mtime) of each path, or None for one that's gone
+    Functionality: Tells whether paths have changed since they were cached
+    '''
+    stamps = []
+
+    for p in paths:
+        try: st = os.stat(p)
+        except OSError: stamps.append(None)
+        else: stamps.append((st.st_size, st.st_mtime))
+
+    return tuple(stamps)
+
+def _rawCopy(typecode, items):
+    '''
+    Function: _rawCopy
+    Input:
+        typecode - array typecode of the items
+        items - an array.array, or a sequence to make one from
+    Output: raw - a sharedctypes.RawArray holding a copy of items
+    Functionality: Copies an array into shared memory in one memmove
+    '''
+    if not isinstance(items, array.array) or items.typecode != typecode:
+        items = array.array(typecode, items)
+
+    raw = sharedctypes.RawArray(typecode, len(items))
+
+    if items:
+        ctypes.memmove(raw, items.buffer_info()[0],
+                                                len(items)*items.itemsize)
+
+    return raw
+
+class SharedStrings(object):
+    '''
+    Class: SharedStrings
+    Members:
+        blob - RawArray of chars holding every string end to end
+        offsets - RawArray of ints where string i runs from offsets[i] to
+                  offsets[i+1] in blob
+    Functionality: Read-only sequence of strings in shared memory. Indexing
+                   copies out just the string asked for, and bisect works on it
+                   if the strings were sorted.
+    '''
+
+    def __init__(self, strs):
+        '''
+        Method: __init__
+        Input:
+            self - this SharedStrings
+            strs - sequence of (byte) strings
+        Output: self - a new SharedStrings
+        Functionality: constructor. Copies strs into shared memory.
+        '''
+        text = ''.join(strs)
+        offsets = array.array(OFFSET_TYPECODE, [0])
+
+        if len(text) > pidindex.MAX_ID:     # too big for the offsets
+            raise ValueError('%d bytes of strings is too many for %d-byte '
+                                'offsets'%(len(text), offsets.itemsize))
+
+        for s in strs:
+            offsets.append(offsets[-1] + len(s))
+
+        self.blob = sharedctypes.RawArray('c', len(text))
+
+        if text: ctypes.memmove(self.blob, text, len(text))
+
+        self.offsets = _rawCopy(OFFSET_TYPECODE, offsets)
+
+        return
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)                # allow negative indexes
+
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+
+        return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+class SharedRptNames(collections.Mapping):
+    '''
+    Class: SharedRptNames
+    Members:
+        pids - SharedStrings of the patient IDs, sorted
+        starts - RawArray of ints where patient i's report names are
+                 names[starts[i]] up to names[starts[i+1]]
+        names - SharedStrings of the report names, grouped by patient
+    Functionality: Read-only stand-in for the dict of patient ID to list of
+                   report names that getRptNamesByPID in
+                   onetime/median_iqr_rpts_per_ptnt.py returns. Lookups binary
+                   search the IDs; each returns a new list.
+    '''
+
+    def __init__(self, rptNamesByPID):
+        '''
+        Method: __init__
+        Input:
+            self - this SharedRptNames
+            rptNamesByPID - dict of patient ID (string) to list of report names
+        Output: self - a new SharedRptNames
+        Functionality: constructor. Copies rptNamesByPID into shared memory.
+        '''
+        pids = sorted(rptNamesByPID)
+        starts = array.array(OFFSET_TYPECODE, [0])
+        names = []
+
+        for pid in pids:
+            names.extend(rptNamesByPID[pid])
+            starts.append(len(names))
+
+        self.pids = SharedStrings(pids)
+        self.starts = _rawCopy(OFFSET_TYPECODE, starts)
+        self.names = SharedStrings(names)
+
+        return
+
+    def __len__(self):
+        return len(self.pids)
+
+    def __iter__(self):
+        pids = self.pids
+
+        for i in xrange(len(pids)):
+            yield pids[i]
+
+    def __getitem__(self, pid):
+        i = bisect.bisect_left(self.pids, pid)
+
+        if i == len(self.pids) or self.pids[i] != pid:
+            raise KeyError(pid)
+
+        return [self.names[j] for j in xrange(self.starts[i],
+                                                        self.starts[i + 1])]
+
+class CohortCache(object):
+    '''
+    Class: CohortCache
+    Members:
+        ptntIds - dict of key of a PID file to (stamp, RawArray of its sorted
+                  IDs)
+        rptNames - dict of key of (report dir, PID file) to (stamp,
+                   SharedRptNames)
+    Functionality: Built in the parent before a pool is started, then handed to
+                   each worker by passing initWorker and (cache,) as the Pool's
+                   initializer and initargs
+    '''
+
+    def __init__(self):
+        self.ptntIds = {}
+        self.rptNames = {}
+
+        return
+
+    def addPtntIds(self, fn, index):
+        '''
+        Method: addPtntIds
+        Input:
+            self - this CohortCache
+            fn - the PID file index was just read from
+            index - a pidindex.PtntIdIndex
+        Output: none
+        Functionality: Copies index's IDs into shared memory, stamped with
+                       fn's size and mtime
+        '''
+        self.ptntIds[_key(fn)] = (_stamp(fn), _rawCopy(pidindex.TYPECODE,
+                                                                index.ids))
+        logging.debug('cached %d patient IDs from %s'%(len(index), fn))
+
+        return
+
+    def addRptNames(self, adir, pidfn, rptNamesByPID):
+        '''
+        Method: addRptNames
+        Input:
+            self - this CohortCache
+            adir - a directory of reports
+            pidfn - the PID file of the cohort
+            rptNamesByPID - dict of patient ID to list of report names, as
+                            getRptNamesByPID returns for adir and pidfn with
+                            zero-report patients included, just now
+        Output: none
+        Functionality: Copies rptNamesByPID into shared memory, stamped with
+                       adir's and pidfn's sizes and mtimes
+        '''
+        self.rptNames[_key(adir, pidfn)] = (_stamp(adir, pidfn),
+                                                SharedRptNames(rptNamesByPID))
+        logging.debug('cached report names of %d patients in %s'%(
+                                                    len(rptNamesByPID), adir))
+
+        return
+
+def initWorker(cache):
+    '''
+    Function: initWorker
+    Input: cache - a CohortCache, or None for none
+    Output: none
+    Functionality: Makes cache the one getPtntIds and getRptNames use in this
+                   process. Passed as a Pool initializer to do that in each
+                   worker.
+    '''
+    global _CACHE
+    _CACHE = cache
+
+    return
+
+def getPtntIds(fn):
+    '''
+    Function: getPtntIds
+    Input: fn - a PID file
+    Output: a PtntIdIndex over the cached IDs of fn, or None if fn isn't cached
+            or has changed since it was
+    Functionality: Looks up a PID file. The index's IDs are the shared array
+                   itself, not a copy.
+    '''
+    if _CACHE is None or not fn: return None
+
+    entry = _CACHE.ptntIds.get(_key(fn))
+
+    if entry is None: return None
+
+    stamp, ids = entry
+
+    if stamp != _stamp(fn):
+        logging.debug('%s changed since it was cached'%(fn))
+        return None
+
+    return pidindex.PtntIdIndex(ids, True)
+
+def getRptNames(adir, pidfn):
+    '''
+    Function: getRptNames
+    Input:
+        adir - a directory of reports
+        pidfn - the PID file of the cohort
+    Output: the cached SharedRptNames of adir and pidfn, or None if not cached
+            or either has changed since
+    Functionality: Looks up report names by patient
+    '''
+    if _CACHE is None: return None
+
+    entry = _CACHE.rptNames.get(_key(adir, pidfn))
+
+    if entry is None: return None
+
+    stamp, rptNames = entry
+
+    if stamp != _stamp(adir, pidfn):
+        logging.debug('%s or %s changed since cached'%(adir, pidfn))
+        return None
+
+    return rptNames
@@ -17,21 +17,371 @@ Contents:
     - connectToNoNo - function that creates a connection to the ChsDwNoContact
                       database on the ctrhs-sql2k server
     - countRows - (unimplemented/untested) function that executes a select
-                  count(*) query on a supplied table
+                  count(*) query on a supplied table, or estimates the count
+                  from catalog statistics or a sample
+    - connect, pyoconnect - functions that make adodbapi and pyodbc
+                            connections, importing the driver on first use
+    - QueryCache - class that caches query results on disk so repeated
+                   queries don't go back to the database
+    - execQuery - function that runs a query and fetches all its rows, going
+                  through a QueryCache if given one
+    - bulkInsert - function that inserts rows into a table in batches
+    - bulkInsertFile - function that streams a delimited file into a table
+    - makeConverters - function that works out once per query how to convert
+                       each column's values
+    - fetchTyped - function that fetches a query's rows a batch at a time with
+                   NULLs normalized and columns converted a batch at a time
+    - fetchAllTyped - function that fetches all of a query's rows (or columns)
+                      that way
 History:
     12/30/10 - added connectToNlpdev and selColumns
     7/11/11 - added connectToNewClarity
     7/20/11 - added connectToNoNo
     7/27/11 - added countRows
     9/27/11 - added dbDateToDatetime
+    10/19/26 - adodbapi and pyodbc only imported when a connection is made
+             - added QueryCache and execQuery and a cache argument to
+               selColumn, selColumns, selColumnCursor and countRows
+             - added bulkInsert and bulkInsertFile
+             - added mode input to countRows for estimated counts
+             - added makeConverters, fetchTyped and fetchAllTyped
 '''
 
 from std_import import *
-from adodbapi import connect    # see 9/29/10 log for how to install adodbapi
-from pyodbc import connect as pyoconnect    # installed pydobc 7/13/11
-import datetime
+import datetime, os, re, time, hashlib, zlib, cPickle, itertools, random
+import tempfile
+import decimal
 
-def selColumn(table, column, cursor=None, cnctn=None, datasrc=None):
+INSERT_BATCH_SIZE = 1000        # rows bulkInsert sends per executemany
+INSERT_COMMIT_EVERY = 100000    # rows bulkInsert inserts between commits
+
+COUNT_MODES = ('exact', 'metadata', 'sample')   # countRows modes
+SAMPLE_PCT = 1.0            # percent of pages countRows samples in sql server
+SAMPLE_PROBES = 1000        # rowids countRows probes in sqlite
+SQLITE_MAX_VARS = 500       # parameters per statement, under sqlite's limit
+
+FETCH_BATCH_SIZE = 10000    # rows fetchTyped fetches at a time
+NULL_STRS = ('NULL',)       # strings fetchTyped turns into None by default
+
+# description type codes pyodbc gives (python types) for string columns.
+# adodbapi gives ADO type codes, which _typeKind compares against its DB-API
+# type objects, and sqlite3 gives None for every column
+STRING_TYPES = (str, unicode)
+
+# matches single-quoted sql string literals, so normalizeSql can leave them be
+SQL_LITERAL_RE = re.compile(r"('(?:[^']|'')*')")
+
+def connect(*args, **kwargs):
+    '''
+    Function: connect
+    Input: args, kwargs - arguments to adodbapi.connect
+    Output: the connection adodbapi.connect returns
+    Functionality: Imports adodbapi the first time a connection is made with it
+                   so importing db doesn't load the driver
+    History:
+        10/19/26 - created, replacing the module-level import
+    '''
+    import adodbapi             # see 9/29/10 log for how to install adodbapi
+
+    return adodbapi.connect(*args, **kwargs)
+
+def pyoconnect(*args, **kwargs):
+    '''
+    Function: pyoconnect
+    Input: args, kwargs - arguments to pyodbc.connect
+    Output: the connection pyodbc.connect returns
+    Functionality: Imports pyodbc the first time a connection is made with it
+                   so importing db doesn't load the driver
+    History:
+        10/19/26 - created, replacing the module-level import
+    '''
+    import pyodbc               # installed pydobc 7/13/11
+
+    return pyodbc.connect(*args, **kwargs)
+
+def normalizeSql(sql):
+    '''
+    Function: normalizeSql
+    Input: sql - a sql statement
+    Output: answer - sql with runs of whitespace outside of string literals
+                     collapsed to one space
+    Functionality: Puts sql in a canonical form so that queries differing only
+                   in layout share a QueryCache entry. Case is left alone, since
+                   [bracketed] and "quoted" identifiers (and everything else,
+                   under a case-sensitive collation) can differ by case alone.
+    '''
+    parts = SQL_LITERAL_RE.split(sql)   # odd-indexed parts are literals
+
+    for i in range(0, len(parts), 2):   # normalize the parts between them
+        parts[i] = re.sub(r'\s+', ' ', parts[i])
+
+    answer = ''.join(parts).strip()
+
+    return answer
+
+class QueryCache(object):
+    '''
+    Class: QueryCache
+    Members:
+        cachedir - directory entries are stored in
+        target - name of the database the cached queries run against, e.g.,
+                 'epclarity_rpt/Clarity', since connections don't say
+        ttl - seconds an entry stays good
+        maxbytes - size the cache is trimmed back to when it grows past it
+    Functionality: Opt-in on-disk cache of query results. Entries are keyed by
+                   a hash of (target, normalized sql, parameters) and hold the
+                   rows as a zlib-compressed pickle. Entries expire after ttl
+                   seconds and the least recently used are evicted when the
+                   cache grows past maxbytes. Each entry can be tagged with the
+                   tables it read so invalidateTable can drop them all when a
+                   table changes.
+    History:
+        10/19/26 - created
+    '''
+    SUFFIX = '.qc'              # suffix of entry files
+    TABLES_DIR = 'tables'       # subdir holding a dir of entry keys per table
+
+    def __init__(self, cachedir, target, ttl=24*60*60, maxbytes=1<<30):
+        '''
+        Method: __init__
+        Input:
+            self - this QueryCache
+            cachedir - directory to store entries in. Created if necessary
+            target - name of the database queries run against
+            ttl - seconds an entry stays good. Defaults to a day
+            maxbytes - most bytes of entries to keep. Defaults to 1GB
+        Output: self - a new QueryCache
+        Functionality: constructor
+        '''
+        self.cachedir = cachedir
+        self.target = target
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        myos.mkdir_p(os.path.join(cachedir, self.TABLES_DIR))
+
+        return
+
+    def key(self, sql, params=()):
+        '''
+        Method: key
+        Input:
+            self - this QueryCache
+            sql - a sql statement
+            params - its parameters
+        Output: hex digest identifying the query's entry
+        Functionality: Hashes target, normalized sql and params
+        '''
+        return hashlib.sha1(repr((self.target, normalizeSql(sql),
+                                                tuple(params)))).hexdigest()
+
+    def _entryfn(self, key):
+        return os.path.join(self.cachedir, key + self.SUFFIX)
+
+    def get(self, sql, params=()):
+        '''
+        Method: get
+        Input:
+            self - this QueryCache
+            sql - a sql statement
+            params - its parameters
+        Output: (hit, rows) - hit is True and rows the cached list of row
+                              tuples if the query has a good entry. Otherwise
+                              (False, None).
+        Functionality: Looks a query up. Expired entries are removed.
+        '''
+        fn = self._entryfn(self.key(sql, params))
+
+        try:
+            mtime = os.path.getmtime(fn)
+        except OSError:                     # no entry
+            return (False, None)
+
+        now = time.time()
+
+        if now - mtime > self.ttl:          # entry expired
+            self._removeEntry(self.key(sql, params))
+            return (False, None)
+
+        fd = open(fn, 'rb')
+        rows = cPickle.loads(zlib.decompress(fd.read()))
+        fd.close()
+        os.utime(fn, (now, mtime))          # atime marks use for LRU
+        logging.debug('query cache hit for %s'%(sql))
+
+        return (True, rows)
+
+    def put(self, sql, rows, params=(), tables=()):
+        '''
+        Method: put
+        Input:
+            self - this QueryCache
+            sql - a sql statement
+            rows - rows the statement returned
+            params - its parameters
+            tables - names of tables the statement read, for invalidateTable
+        Output: rows - rows as a list of tuples, which is what get returns
+        Functionality: Stores a query's rows, then evicts least recently used
+                       entries if the cache is over maxbytes. Safe to call
+                       from several threads and processes at once: each
+                       writes its own temp file, and if another put of the
+                       same query gets its entry in place first, that one is
+                       kept.
+        '''
+        rows = [tuple(row) for row in rows]     # driver rows may not pickle
+        key = self.key(sql, params)
+        fn = self._entryfn(key)
+
+        # a temp file of our own, so threads writing the same entry don't
+        # write the same file
+        tmpfd, tmpfn = tempfile.mkstemp('.tmp', key, self.cachedir)
+        fd = os.fdopen(tmpfd, 'wb')
+        fd.write(zlib.compress(cPickle.dumps(rows, cPickle.HIGHEST_PROTOCOL), 1))
+        fd.close()
+
+        try:
+            os.rename(tmpfn, fn)        # replaces fn, except on windows
+        except OSError:
+            try:
+                self._remove(fn)        # windows won't rename over it
+                os.rename(tmpfn, fn)
+            except OSError as myerr:    # lost a race with another put
+                logging.debug('myerr: %s'%(str(myerr)))
+                self._remove(tmpfn)
+
+        for table in tables:                    # tag entry with its tables
+            tabledir = os.path.join(self.cachedir, self.TABLES_DIR,
+                                                                table.lower())
+            myos.mkdir_p(tabledir)
+            open(os.path.join(tabledir, key), 'w').close()
+
+        self._evict()
+
+        return rows
+
+    def _remove(self, fn):
+        try: os.remove(fn)
+        except OSError: pass    # someone else got to it first
+
+        return
+
+    def _removeEntry(self, key):
+        '''
+        Method: _removeEntry
+        Input:
+            self - this QueryCache
+            key - key of an entry
+        Output: none
+        Functionality: Removes an entry and the tags that tie it to its tables
+        '''
+        self._remove(self._entryfn(key))
+        tablesdir = os.path.join(self.cachedir, self.TABLES_DIR)
+
+        try: tables = os.listdir(tablesdir)
+        except OSError: tables = []
+
+        for table in tables:
+            self._remove(os.path.join(tablesdir, table, key))
+
+        return
+
+    def _evict(self):
+        '''
+        Method: _evict
+        Input: self - this QueryCache
+        Output: none
+        Functionality: Removes least recently used entries until the cache
+                       holds no more than maxbytes
+        '''
+        entries = []
+        total = 0
+
+        for fn in os.listdir(self.cachedir):
+            if fn.endswith(self.SUFFIX):
+                st = os.stat(os.path.join(self.cachedir, fn))
+                entries.append((st.st_atime, st.st_size, fn))
+                total += st.st_size
+
+        entries.sort()                      # oldest use first
+
+        while total > self.maxbytes and entries:
+            atime, size, fn = entries.pop(0)
+            self._removeEntry(fn[:-len(self.SUFFIX)])
+            total -= size
+
+        return
+
+    def invalidateTable(self, table):
+        '''
+        Method: invalidateTable
+        Input:
+            self - this QueryCache
+            table - name of a table whose data changed
+        Output: n - number of entries removed
+        Functionality: Removes every entry tagged with table
+        '''
+        tabledir = os.path.join(self.cachedir, self.TABLES_DIR, table.lower())
+
+        try: keys = os.listdir(tabledir)
+        except OSError: keys = []       # nothing tagged with table
+
+        for key in keys:
+            self._removeEntry(key)
+
+        logging.info('invalidated %d cached queries on %s'%(len(keys), table))
+
+        return len(keys)
+
+    def clear(self):
+        '''
+        Method: clear
+        Input: self - this QueryCache
+        Output: none
+        Functionality: Removes every entry
+        '''
+        for fn in os.listdir(self.cachedir):
+            if fn.endswith(self.SUFFIX):
+                self._removeEntry(fn[:-len(self.SUFFIX)])
+
+        return
+
+def execQuery(cnctn, sql, params=(), cache=None, tables=(), connector=None):
+    '''
+    Function: execQuery
+    Input:
+        cnctn - database connection. May be None if connector is given
+        sql - sql statement
+        params - sequence of its parameters
+        cache - a QueryCache, or None to always query
+        tables - tables sql reads, to tag its cache entry with
+        connector - function that returns a connection, called only if
+                    cnctn is None and the cache can't answer, so cache hits
+                    don't connect at all
+    Output: rows - the rows the query returned
+    Functionality: Runs a query and fetches all its rows, answering from
+                   cache without touching the database if it can
+    History:
+        10/19/26 - created
+    '''
+    if cache:
+        hit, rows = cache.get(sql, params)
+
+        if hit: return rows
+
+    if cnctn is None: cnctn = connector()   # connect only now that we must
+
+    crsr = cnctn.cursor()                   # get cursor from connection
+
+    if params: crsr.execute(sql, params)    # execute query
+    else: crsr.execute(sql)
+
+    rows = crsr.fetchall()                  # get all rows from query
+
+    if cache: rows = cache.put(sql, rows, params, tables)
+
+    return rows                             # return output
+
+def selColumn(table, column, cursor=None, cnctn=None, datasrc=None,
+                                                                cache=None):
     '''
     Function: selColumn
     Input:
@@ -40,10 +390,18 @@ def selColumn(table, column, cursor=None, cnctn=None, datasrc=None):
         cusror - database cursor
         cntn - database connection
         datsrc - data source name (e.g., odbc connection name)
+        cache - a QueryCache. If the query is in it, nothing is connected to
     Output: valuelist - a list of values of column in table
     Functionality: Selects a column from a table given a cursor or, barring
                    that, a connection or, barring that, a data source.
+    History:
+        10/19/26 - added cache input
     '''
+    if cache:                       # answer from cache if we can
+        hit, rows = cache.get('SELECT %s FROM %s'%(column, table))
+
+        if hit: return [row[0] for row in rows]
+
     # if the user provided a cursor, we'll want to use that, but if not
     if not cursor:
 
@@ -56,41 +414,55 @@ def selColumn(table, column, cursor=None, cnctn=None, datasrc=None):
         cursor = cnctn.cursor()     # get cursor from connection
 
     # select column from table
-    valuelist = selColumnCursor(cursor, table, column)
+    valuelist = selColumnCursor(cursor, table, column, cache)
 
     return valuelist            # return output
 
-def selColumns(cnctn, tbl, cols):
+def selColumns(cnctn, tbl, cols, cache=None):
     '''
     Function: selColumns
     Input:
         cnctn - database connection
         tbl - table to select from
         cols - list of columns to select
+        cache - a QueryCache to answer from if possible
     Output: rows - the rowset returned by the query
     Functionality: Queries cols from tbl using cnctn.
     History:
         12/30/10 - created
+        10/19/26 - added cache input
     '''
     colstring = ','.join(cols)  # convert list of columns to string for all cols
-    crsr = cnctn.cursor()       # get cursor from connection
-    crsr.execute('SELECT %s FROM %s'%(colstring, tbl))      # execute query
-    rows = crsr.fetchall()                          # get all rows from query
+
+    # execute query and get all rows from it
+    rows = execQuery(cnctn, 'SELECT %s FROM %s'%(colstring, tbl), cache=cache,
+                                                                tables=[tbl])
 
     return rows                                     # return output
 
-def selColumnCursor(crsr, tbl, clm):
+def selColumnCursor(crsr, tbl, clm, cache=None):
     '''
     Function: selColumnCursor
     Input:
         crsr - database cursor
         tbl - table to select from
         clm - column to select
+        cache - a QueryCache to answer from if possible
     Output: valuelist - a list of the values in tbl.clm
     Functionality: Queries clm from table using crsr.
+    History:
+        10/19/26 - added cache input
     '''
-    crsr.execute('SELECT %s FROM %s'%(clm, tbl))    # execute query
-    rows = crsr.fetchall()                          # get all rows from query
+    sql = 'SELECT %s FROM %s'%(clm, tbl)
+    hit = False
+
+    if cache: hit, rows = cache.get(sql)        # answer from cache if we can
+
+    if not hit:
+        crsr.execute(sql)                       # execute query
+        rows = crsr.fetchall()                  # get all rows from query
+
+        if cache: cache.put(sql, rows, tables=[tbl])
     valuelist = [row[0] for row in rows]   # convert to list of values in column
 
     return valuelist                    # return output
@@ -221,30 +593,249 @@ def connectToNewClarity(api='pyodbc'):
 
     return cnctn            # return output
 
-def countRows(table, conn=None):
+def countRows(table, conn=None, cache=None, mode='exact',
+                                                        samplePct=SAMPLE_PCT):
     '''
     Function: countRows
     Input:
         table - table name
         conn - database connection, defaults to Nlpdev if not given
-    Output: answer - the number of rows in table in conn
+        cache - a QueryCache to answer exact counts from if possible
+        mode - how to count, trading accuracy for speed:
+               'exact' - select count(*), a full scan on big tables. Cached
+                         in cache if given one
+               'metadata' - the row count the database keeps in its catalog
+                            (sys.partitions in sql server, sqlite_stat1 in
+                            sqlite, which is only there after ANALYZE). Nearly
+                            free but can lag behind recent changes. Falls back
+                            to 'sample' if the catalog has nothing
+               'sample' - counts a sample and scales up. In sql server that's
+                          samplePct percent of the table's pages via
+                          TABLESAMPLE; in sqlite it's SAMPLE_PROBES random
+                          rowids looked up between the lowest and highest
+        samplePct - percent of pages to sample in sql server in 'sample' mode
+    Output: answer - the (possibly estimated) number of rows in table in conn
     Functionality: Counts the number of rows in table using conn
     Note: This is unused, and therefore untested, as of 7/27/11
     History:
         7/27/11 - created
+        10/19/26 - added cache input
+                 - added mode and samplePct inputs
     '''
     # until this is implemented, log warning message that it's unused/untested
     logging.warning('Using countRows, an untested function')
-    
-    if not conn:                            # if no connection provided
-        conn = connectToNlpdev('pyodbc')    # connect to Nlpdev using pyodbc
-        
-    cursor = conn.cursor()                              # get db cursor
-    cursor.execute('SELECT COUNT(*) FROM %s'%(table))   # query select count(*)
-    answer = cursor.fetchall()[0][0]                    # get count from cursor
+
+    if mode not in COUNT_MODES:
+        raise ValueError('Unrecognized count mode %s'%(mode))
+
+    # if no connection provided, connect to Nlpdev using pyodbc, but only if
+    # cache can't answer
+    connector = lambda: connectToNlpdev('pyodbc')
+
+    if mode == 'exact':
+        # query select count(*) and get count from results
+        answer = execQuery(conn or None, 'SELECT COUNT(*) FROM %s'%(table),
+                    cache=cache, tables=[table], connector=connector)[0][0]
+    else:
+        if not conn: conn = connector()
+        answer = None
+
+        if mode == 'metadata':
+            answer = _metadataRowCount(conn, table)
+
+            if answer is None:
+                logging.warning('No catalog row count for %s, sampling'%(table))
+
+        if answer is None:
+            answer = _sampledRowCount(conn, table, samplePct)
 
     return answer                                       # return output
 
+def _isSqlite(conn):
+    '''
+    Function: _isSqlite
+    Input: conn - database connection
+    Output: True if conn is a sqlite3 connection. Everything else we connect
+            to is sql server
+    '''
+    return type(conn).__module__.startswith('sqlite3')
+
+def _metadataRowCount(conn, table):
+    '''
+    Function: _metadataRowCount
+    Input:
+        conn - database connection
+        table - table name
+    Output: answer - row count from the database catalog, or None if there
+                     isn't one
+    Functionality: Looks up a table's row count in the catalog instead of
+                   counting
+    '''
+    crsr = conn.cursor()
+
+    if _isSqlite(conn):
+        try:
+            crsr.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = ?', (table,))
+        except Exception as myerr:      # no sqlite_stat1 until ANALYZE
+            logging.debug('myerr: %s'%(str(myerr)))
+            return None
+
+        # stat starts with the table's row count, whichever index it's for
+        stats = [int(row[0].split()[0]) for row in crsr.fetchall()]
+        answer = max(stats) if stats else None
+    else:
+        # heap (0) or clustered index (1) partitions hold every row once
+        crsr.execute('SELECT SUM(rows) FROM sys.partitions ' + \
+                     'WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1)',
+                                                                    (table,))
+        answer = crsr.fetchall()[0][0]
+
+    return answer
+
+def _sampledRowCount(conn, table, samplePct):
+    '''
+    Function: _sampledRowCount
+    Input:
+        conn - database connection
+        table - table name
+        samplePct - percent of pages to sample in sql server
+    Output: answer - estimated row count
+    Functionality: Estimates a table's row count by counting a sample of it.
+                   See countRows for how.
+    '''
+    crsr = conn.cursor()
+
+    if not _isSqlite(conn):
+        crsr.execute('SELECT COUNT(*) FROM %s TABLESAMPLE (%f PERCENT)'%(table,
+                                                                    samplePct))
+        return int(round(crsr.fetchall()[0][0]*100.0/samplePct))
+
+    crsr.execute('SELECT MIN(rowid), MAX(rowid) FROM %s'%(table))
+    lo, hi = crsr.fetchall()[0]
+
+    if lo is None:                      # empty table
+        return 0
+
+    span = hi - lo + 1
+
+    if span <= SAMPLE_PROBES:           # small enough to just count
+        crsr.execute('SELECT COUNT(*) FROM %s'%(table))
+        return crsr.fetchall()[0][0]
+
+    # look up random rowids in [lo, hi] and scale the hit rate up to the span.
+    # randint, not sample over an xrange, since rowids can pass a C long. A
+    # set, since IN counts a repeated rowid once
+    probes = set()
+
+    while len(probes) < SAMPLE_PROBES:
+        probes.add(random.randint(lo, hi))
+
+    probes = list(probes)
+    hits = 0
+
+    for i in range(0, len(probes), SQLITE_MAX_VARS):
+        chunk = probes[i:i + SQLITE_MAX_VARS]
+        marks = ','.join('?'*len(chunk))
+        crsr.execute('SELECT COUNT(*) FROM %s WHERE rowid IN (%s)'%(table,
+                                                                marks), chunk)
+        hits += crsr.fetchall()[0][0]
+
+    return int(round(hits*float(span)/len(probes)))
+
+def bulkInsert(cnctn, tbl, cols, rows, batchsize=INSERT_BATCH_SIZE,
+                                        commitEvery=INSERT_COMMIT_EVERY):
+    '''
+    Function: bulkInsert
+    Input:
+        cnctn - database connection
+        tbl - table to insert into
+        cols - list of columns to insert
+        rows - iterable of rows, each a sequence of values for cols. May be a
+               generator, which is consumed a batch at a time
+        batchsize - rows to send per executemany call
+        commitEvery - rows to insert between commits. Rounded up to a whole
+                      number of batches
+    Output: n - number of rows inserted
+    Functionality: Inserts rows into tbl with executemany a batch at a time
+                   instead of a cursor.execute per row. With pyodbc,
+                   fast_executemany is turned on so each batch goes to the
+                   server as one array of parameters. Logs rows/sec.
+    History:
+        10/19/26 - created
+    '''
+    sql = 'INSERT INTO %s (%s) VALUES (%s)'%(tbl, ','.join(cols),
+                                                    ','.join('?'*len(cols)))
+    crsr = cnctn.cursor()               # get cursor from connection
+
+    # pyodbc 4.0.19+ can send a whole batch at once. other drivers (e.g.,
+    # sqlite3) don't let you set attributes they don't have
+    try: crsr.fast_executemany = True
+    except AttributeError: pass
+
+    rows = iter(rows)
+    n = uncommitted = 0
+    start = time.time()
+
+    while True:
+        batch = list(itertools.islice(rows, batchsize))   # get next batch
+
+        if not batch:                   # out of rows
+            break
+
+        crsr.executemany(sql, batch)    # insert batch
+        n += len(batch)
+        uncommitted += len(batch)
+
+        if uncommitted >= commitEvery:  # commit if it's been long enough
+            cnctn.commit()
+            uncommitted = 0
+            logging.debug('inserted %d rows into %s'%(n, tbl))
+
+    cnctn.commit()                      # commit the rest
+
+    seconds = time.time() - start
+    logging.info('inserted %d rows into %s in %.2f s (%.0f rows/sec)'%(n, tbl,
+                                seconds, n/seconds if seconds else 0))
+
+    return n                            # return output
+
+def bulkInsertFile(cnctn, tbl, cols, fn, colsep='\t', skipHeader=False,
+                                                    nullstr=None, **kwargs):
+    '''
+    Function: bulkInsertFile
+    Input:
+        cnctn - database connection
+        tbl - table to insert into
+        cols - list of columns to insert, in the order they are in the file
+        fn - delimited file, e.g., one written with myos.writelines
+        colsep - column separator
+        skipHeader - True if the first line is a header to skip
+        nullstr - if not None, values equal to it are inserted as NULL
+        kwargs - passed on to bulkInsert, e.g., batchsize
+    Output: n - number of rows inserted
+    Functionality: Streams a delimited file into tbl with bulkInsert, reading
+                   it a line at a time so it's never all in memory
+    History:
+        10/19/26 - created
+    '''
+    fd = open(fn)
+
+    try:
+        lines = iter(fd)
+
+        if skipHeader: next(lines, None)        # skip header line
+
+        rows = (line.rstrip('\r\n').split(colsep) for line in lines)
+
+        if nullstr is not None:                 # map nullstr to None
+            rows = ([None if v == nullstr else v for v in row] for row in rows)
+
+        n = bulkInsert(cnctn, tbl, cols, rows, **kwargs)
+    finally:
+        fd.close()
+
+    return n
+
 # I created and used connectToNewClarity when I thought there was still an old
 # clarity that could be used. But there's only one, so we'll just use the same
 # function to be both connectToClarity and connectToNewClarity for now
@@ -273,3 +864,238 @@ def dbDateToDatetime(dbdate, fmat='%Y-%m-%d'):
         answer = datetime.datetime.strptime(dbdate.split()[0], fmat)
 
     return answer               # return output
+
+def _mapNonNull(func, col):
+    '''
+    Function: _mapNonNull
+    Input:
+        func - conversion function
+        col - sequence of values
+    Output: list of func of each value in col, leaving Nones alone
+    Functionality: Applies func to a column with one C-level map when the
+                   column has no NULLs
+    '''
+    if None in col:
+        return [v if v is None else func(v) for v in col]
+
+    return map(func, col)
+
+def _mapDistinct(func, col):
+    '''
+    Function: _mapDistinct
+    Input:
+        func - conversion function
+        col - sequence of hashable values
+    Output: list of func of each value in col, leaving Nones alone
+    Functionality: Calls func once per distinct value in col and looks the rest
+                   up. Good for slow conversions of values that repeat a lot,
+                   like parsing dates.
+    '''
+    lookup = dict.fromkeys(col)
+
+    for v in lookup:
+        if v is not None: lookup[v] = func(v)
+
+    return map(lookup.__getitem__, col)
+
+def _toDatetime(v, fmat):
+    '''
+    Function: _toDatetime
+    Input:
+        v - a value from a date column
+        fmat - format of v if it's a string
+    Output: v as a datetime, or None if it's NULL
+    Functionality: Converts date strings with dbDateToDatetime, but passes
+                   through values the driver already made datetimes (and
+                   makes dates datetimes)
+    '''
+    if isinstance(v, datetime.datetime):
+        return v
+
+    if isinstance(v, datetime.date):
+        return datetime.datetime.combine(v, datetime.time())
+
+    return dbDateToDatetime(v, fmat)
+
+def _typeKind(typeCode):
+    '''
+    Function: _typeKind
+    Input: typeCode - a column's type code from a cursor's description
+    Output: kind - 'string' for string columns, 'decimal' for decimal ones,
+                   'number' for number columns that may hold decimals,
+                   'other' for other known types, or None if the driver
+                   doesn't say
+    Functionality: Reads the type codes of the drivers we use: pyodbc's python
+                   types, adodbapi's ADO type codes, and sqlite3's None
+    '''
+    if typeCode is None:                # sqlite3, or a driver that won't say
+        kind = None
+    elif isinstance(typeCode, type):    # pyodbc
+        if issubclass(typeCode, STRING_TYPES): kind = 'string'
+        elif issubclass(typeCode, decimal.Decimal): kind = 'decimal'
+        else: kind = 'other'
+    else:                               # ADO type code from adodbapi
+        try:
+            import adodbapi
+        except ImportError:             # not adodbapi's then
+            return None
+
+        # DB-API type objects compare equal to each type code they cover.
+        # NUMBER covers integer, float and decimal columns alike
+        if adodbapi.STRING == typeCode: kind = 'string'
+        elif adodbapi.NUMBER == typeCode: kind = 'number'
+        else: kind = 'other'
+
+    return kind
+
+def _mapNulls(nulls, vals):
+    '''
+    Function: _mapNulls
+    Input:
+        nulls - dict of null string to None
+        vals - values of a column of unknown type
+    Output: list of vals with the strings in nulls changed to None
+    Functionality: Maps null strings a value at a time, leaving non-strings
+                   alone, for drivers that don't say which columns are strings
+    '''
+    return [nulls.get(v, v) if isinstance(v, basestring) else v for v in vals]
+
+def _mapDecimals(vals):
+    '''
+    Function: _mapDecimals
+    Input: vals - values of a number column that may hold decimals
+    Output: list of vals with the decimals changed to floats
+    Functionality: Converts decimals a value at a time, for drivers that don't
+                   say which number columns are decimal
+    '''
+    return [float(v) if isinstance(v, decimal.Decimal) else v for v in vals]
+
+def makeConverters(description, converters=None, dateCols=(), datefmt='%Y-%m-%d',
+                                nullstrs=NULL_STRS, decimalsAsFloat=False):
+    '''
+    Function: makeConverters
+    Input:
+        description - a cursor's description after executing a query
+        converters - dict of column name to function converting a value of it
+        dateCols - names of columns holding dates as strings, as
+                   dbDateToDatetime handles, to convert to datetimes. Values
+                   that are already datetimes are left as they are
+        datefmt - format of the date strings in dateCols
+        nullstrs - strings that mean NULL in string columns, e.g., 'NULL'
+        decimalsAsFloat - if True, decimal columns are converted to floats
+    Output: convs - list with, for each column, None if its values come back
+                    fine as is, or a function that converts a whole column of
+                    values from one batch
+    Functionality: Works out from the description once per query how each
+                   column needs converting, so the work per value is as small
+                   as it can be. Column names are matched case-insensitively.
+                   Where the driver doesn't give column types (sqlite3),
+                   null strings and decimals are found a value at a time.
+    '''
+    converters = dict((k.lower(), v) for k, v in (converters or {}).items())
+    dateCols = set(c.lower() for c in dateCols)
+    nulls = dict.fromkeys(nullstrs)     # nullstr -> None, for nulls.get
+    convs = []
+
+    for col in description:
+        name, typeCode = col[0].lower(), col[1]
+        kind = _typeKind(typeCode)
+        steps = []                      # column conversions, in order
+
+        if nulls and kind == 'string':
+            # one C-level lookup per value, returning the value if not a null
+            steps.append(lambda vals: map(nulls.get, vals, vals))
+        elif nulls and kind is None:
+            steps.append(lambda vals: _mapNulls(nulls, vals))
+
+        if name in converters:
+            func = converters[name]
+            steps.append(lambda vals, func=func: _mapNonNull(func, vals))
+        elif name in dateCols:
+            func = lambda v: _toDatetime(v, datefmt)
+            steps.append(lambda vals, func=func: _mapDistinct(func, vals))
+        elif decimalsAsFloat and kind == 'decimal':
+            steps.append(lambda vals: _mapNonNull(float, vals))
+        elif decimalsAsFloat and kind in ('number', None):
+            steps.append(_mapDecimals)
+
+        if not steps:
+            convs.append(None)
+        elif len(steps) == 1:
+            convs.append(steps[0])
+        else:
+            convs.append(lambda vals, steps=steps: reduce(lambda acc, step:
+                                                        step(acc), steps, vals))
+
+    return convs
+
+def _convertBatch(batch, convs, columnar):
+    '''
+    Function: _convertBatch
+    Input:
+        batch - list of rows
+        convs - list from makeConverters
+        columnar - if True return columns rather than rows
+    Output: the batch's rows as tuples, or its columns as lists
+    Functionality: Converts a batch a column at a time
+    '''
+    cols = [list(col) for col in zip(*batch)] if batch else [[] for c in convs]
+
+    for i, conv in enumerate(convs):
+        if conv: cols[i] = conv(cols[i])
+
+    if columnar:
+        return cols
+
+    return zip(*cols)
+
+def fetchTyped(crsr, batchsize=FETCH_BATCH_SIZE, columnar=False, **kwargs):
+    '''
+    Function: fetchTyped
+    Input:
+        crsr - cursor a query has been executed on
+        batchsize - rows to fetch at a time
+        columnar - if True each batch is a list of columns (lists of values)
+                   rather than a list of rows
+        kwargs - passed to makeConverters, e.g., dateCols
+    Output: generator of batches of converted rows (tuples) or columns
+    Functionality: Reads crsr.description once to build the column
+                   converters, then fetches and converts a batch at a time,
+                   so callers get None for NULLs and real types without
+                   checking every value in their own loops
+    History:
+        10/19/26 - created
+    '''
+    convs = makeConverters(crsr.description, **kwargs)
+
+    while True:
+        batch = crsr.fetchmany(batchsize)
+
+        if not batch:
+            break
+
+        yield _convertBatch(batch, convs, columnar)
+
+def fetchAllTyped(crsr, columnar=False, **kwargs):
+    '''
+    Function: fetchAllTyped
+    Input:
+        crsr - cursor a query has been executed on
+        columnar - if True, return a list of columns instead of rows
+        kwargs - passed to makeConverters, e.g., dateCols
+    Output: answer - list of converted rows, or list of lists of each column's
+                     converted values
+    Functionality: fetchall with fetchTyped's conversions
+    History:
+        10/19/26 - created
+    '''
+    if not columnar:
+        return [row for batch in fetchTyped(crsr, **kwargs) for row in batch]
+
+    answer = [[] for col in crsr.description]
+
+    for batch in fetchTyped(crsr, columnar=True, **kwargs):
+        for col, vals in zip(answer, batch):
+            col.extend(vals)
+
+    return answer
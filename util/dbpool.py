@@ -0,0 +1,286 @@
+'''
+File: dbpool.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Runs db queries concurrently on a bounded pool of threads, each
+               with its own connection, so one process can have many queries
+               in flight and keep writing files while they run. The DB-API
+               drivers we use block, but they let go of the GIL while waiting
+               on the server, so threads overlap fine.
+Contents:
+    DbExecutor - class that runs selColumns, selColumn and countRows on a
+                 thread pool and returns handles to their results, and
+                 iterates over query results a batch at a time while the next
+                 batches are fetched in the background, and exports query
+                 results to a file with fetching and writing overlapped
+Notes:
+    - This is the python 2.7 version of an async interface: instead of asyncio
+      coroutines, calls return multiprocessing.pool.AsyncResults, whose get()
+      waits for and returns the result (or raises the query's error).
+'''
+import os, threading, logging, Queue, time, itertools
+from multiprocessing.pool import ThreadPool
+from org.ghri.shalgrim.util import db, myos
+from org.ghri.shalgrim.util.mystring import RowSerializer
+
+NUM_WORKERS = 4         # default number of queries to run at once
+BATCH_SIZE = 10000      # default rows per fetchmany in iterBatches
+PREFETCH = 2            # default batches iterBatches fetches ahead
+POLL_SECONDS = 0.5      # how often a blocked fetch checks if it should stop
+
+class _Done(object):
+    '''
+    Class: _Done
+    Members: error - exception that ended the fetch, or None if it finished
+    Functionality: Marks the end of iterBatches' queue of batches
+    '''
+    def __init__(self, error=None):
+        self.error = error
+
+class DbExecutor(object):
+    '''
+    Class: DbExecutor
+    Members:
+        connector - function that returns a new database connection, e.g.,
+                    db.connectToClarity or lambda: sqlite3.connect(fn)
+        pool - ThreadPool the queries run on
+        local - thread-local storage holding each worker's connection
+        cnctns - every connection the workers opened, so close can close them
+    Functionality: Runs queries on a bounded pool of worker threads. Each
+                   worker opens its own connection the first time it needs
+                   one, since DB-API connections generally can't be shared
+                   between threads (sqlite3's refuse to be).
+    '''
+
+    def __init__(self, connector, numWorkers=NUM_WORKERS):
+        '''
+        Method: __init__
+        Input:
+            self - this DbExecutor
+            connector - function that returns a new database connection
+            numWorkers - most queries to run at once
+        Output: self - a new DbExecutor
+        Functionality: constructor
+        '''
+        self.connector = connector
+        self.pool = ThreadPool(numWorkers)
+        self.local = threading.local()
+        self.cnctns = []
+        self.lock = threading.Lock()
+
+        return
+
+    def _cnctn(self):
+        '''
+        Method: _cnctn
+        Input: self - this DbExecutor
+        Output: cnctn - the calling worker thread's connection
+        Functionality: Connects the calling worker the first time it's called
+        '''
+        try:
+            cnctn = self.local.cnctn
+        except AttributeError:
+            cnctn = self.local.cnctn = self.connector()
+
+            with self.lock:
+                self.cnctns.append(cnctn)
+
+        return cnctn
+
+    def submit(self, func, *args, **kwargs):
+        '''
+        Method: submit
+        Input:
+            self - this DbExecutor
+            func - function whose first argument is a connection
+            args, kwargs - its other arguments
+        Output: AsyncResult for func(connection, *args, **kwargs)
+        Functionality: Runs func on a worker with that worker's connection
+        '''
+        return self.pool.apply_async(lambda: func(self._cnctn(), *args,
+                                                                    **kwargs))
+
+    def selColumns(self, tbl, cols, cache=None):
+        '''
+        Method: selColumns
+        Input: as for db.selColumns, minus the connection
+        Output: AsyncResult for the rows
+        Functionality: db.selColumns on a worker
+        '''
+        return self.submit(db.selColumns, tbl, cols, cache)
+
+    def selColumn(self, tbl, clm, cache=None):
+        '''
+        Method: selColumn
+        Input: as for db.selColumnCursor, minus the cursor
+        Output: AsyncResult for the list of values
+        Functionality: db.selColumnCursor on a worker
+        '''
+        return self.submit(lambda cnctn: db.selColumnCursor(cnctn.cursor(),
+                                                            tbl, clm, cache))
+
+    def countRows(self, table, cache=None, mode='exact'):
+        '''
+        Method: countRows
+        Input: as for db.countRows, minus the connection
+        Output: AsyncResult for the count
+        Functionality: db.countRows on a worker
+        '''
+        return self.submit(lambda cnctn: db.countRows(table, cnctn, cache,
+                                                                        mode))
+
+    def iterBatches(self, sql, params=(), batchsize=BATCH_SIZE,
+                                                            prefetch=PREFETCH):
+        '''
+        Method: iterBatches
+        Input:
+            self - this DbExecutor
+            sql - sql statement
+            params - its parameters
+            batchsize - rows per batch
+            prefetch - most batches to fetch ahead of the caller
+        Output: generator of lists of up to batchsize rows
+        Functionality: Runs sql on a worker that fetches batches into a
+                       bounded queue while the caller works through earlier
+                       ones, so fetching and e.g. writing overlap. If the
+                       caller stops early, the worker stops fetching too.
+                       A query error is raised in the caller.
+        '''
+        batches = Queue.Queue(prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            '''
+            put item on the queue, giving up if the caller went away
+            '''
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=POLL_SECONDS)
+                    return True
+                except Queue.Full:
+                    pass
+
+            return False
+
+        def fetch():
+            '''
+            run sql and queue its rows a batch at a time. Connecting is in the
+            try too, so a connection error reaches the caller instead of
+            leaving it waiting on an empty queue
+            '''
+            try:
+                crsr = self._cnctn().cursor()
+
+                if params: crsr.execute(sql, params)
+                else: crsr.execute(sql)
+
+                while True:
+                    batch = crsr.fetchmany(batchsize)
+
+                    if not batch or not put(batch):
+                        break
+
+                put(_Done())
+            except Exception as myerr:
+                logging.error('myerr: %s'%(str(myerr)))
+                put(_Done(myerr))
+
+        self.pool.apply_async(fetch)
+
+        try:
+            while True:
+                batch = batches.get()
+
+                if isinstance(batch, _Done):
+                    if batch.error: raise batch.error
+                    break
+
+                yield batch
+        finally:
+            stop.set()                  # let worker go if we quit early
+
+    def export(self, sql, outfn='', params=(), batchsize=BATCH_SIZE,
+                            prefetch=PREFETCH, colsep='\t', nullstr='',
+                                                        nshards=0, key=None):
+        '''
+        Method: export
+        Input:
+            self - this DbExecutor
+            sql - sql statement
+            outfn - file to write its rows to. stdout if ''
+            params - its parameters
+            batchsize - rows per fetchmany
+            prefetch - most fetched batches to hold waiting to be written. When
+                       the queue is full the fetching worker waits, so a slow
+                       disk holds back the fetch rather than filling memory
+            colsep - column separator of the output
+            nullstr - what to write for None in the output
+            nshards - if given, rows are split over this many shard files
+                      by myos.writeShards instead of written to outfn itself
+            key - with nshards, index of the column whose hash picks a row's
+                  shard. If None, rows are dealt to the shards round-robin
+        Output: n - number of rows written
+        Functionality: Writes sql's rows to outfn as delimited lines. A worker
+                       fetches batches with iterBatches while this thread
+                       serializes and writes the ones before them, so the
+                       export takes about as long as the slower of fetching
+                       and writing rather than both added up. Logs how long
+                       was spent waiting on each side. If connecting or the
+                       query fails, the error is raised here and outfn is
+                       removed rather than left looking like a short export.
+        '''
+        start = time.time()
+
+        if nshards:
+            rows = itertools.chain.from_iterable(self.iterBatches(sql, params,
+                                                        batchsize, prefetch))
+            n = myos.writeShards(rows, outfn, nshards, key, colsep, nullstr)
+            logging.info('exported %d rows to %d shards in %.2f s'%(n,
+                                                nshards, time.time() - start))
+
+            return n
+
+        serializer = RowSerializer(colsep, nullstr)
+        writeSecs = 0.0
+        n = 0
+        fd = myos.openw(outfn)
+
+        try:
+            for batch in self.iterBatches(sql, params, batchsize, prefetch):
+                writeStart = time.time()
+                fd.write(serializer.joinRows(batch))
+                writeSecs += time.time() - writeStart
+                n += len(batch)
+        except Exception:
+            if outfn:                   # leave stdout open for caller
+                myos.close(fd)
+                os.remove(outfn)        # don't leave a partial export
+
+            raise
+
+        if outfn: myos.close(fd)        # leave stdout open for caller
+
+        secs = time.time() - start
+        logging.info('exported %d rows in %.2f s (%.2f s writing, %.2f s '
+                    'waiting on fetches)'%(n, secs, writeSecs, secs - writeSecs))
+
+        return n
+
+    def close(self):
+        '''
+        Method: close
+        Input: self - this DbExecutor
+        Output: none
+        Functionality: Waits for submitted queries to finish, then closes the
+                       pool and the workers' connections
+        '''
+        self.pool.close()
+        self.pool.join()
+
+        for cnctn in self.cnctns:
+            # sqlite3 won't close a connection from another thread unless it
+            # was made with check_same_thread=False
+            try: cnctn.close()
+            except Exception as myerr: logging.debug('myerr: %s'%(str(myerr)))
+
+        return
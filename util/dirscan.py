@@ -0,0 +1,119 @@
+'''
+File: dirscan.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Scans several directories of reports at once with a pool of
+               threads, grouping each directory's filenames by the patient ID
+               encoded in them. On network file systems most of the time in
+               os.listdir is spent waiting, so listing directories side by
+               side instead of one after another is much faster.
+Contents:
+    scanDirs - function that lists directories (and their hash-sharded
+               subdirectories) concurrently and groups filenames by patient ID
+    ScanStats - class recording how many files a scan saw and how fast
+'''
+import os, time
+from multiprocessing.pool import ThreadPool
+from org.ghri.shalgrim.util import myre
+
+NUM_THREADS = 8         # default number of directories to list at once
+
+class ScanStats(object):
+    '''
+    Class: ScanStats
+    Members:
+        numDirs - number of directories listed, counting shards
+        numFiles - number of filenames seen
+        seconds - wall clock time of the scan
+    Functionality: Records the size and speed of a scan
+    '''
+
+    def __init__(self, numDirs, numFiles, seconds):
+        self.numDirs = numDirs
+        self.numFiles = numFiles
+        self.seconds = seconds
+
+        return
+
+    def filesPerSec(self):
+        '''
+        Method: filesPerSec
+        Input: self - this ScanStats
+        Output: throughput of the scan in files per second
+        Functionality: accessor
+        '''
+        return self.numFiles/self.seconds if self.seconds else float('inf')
+
+    def __str__(self):
+        return '%d files in %d dirs in %.2f s (%.0f files/sec)'%(self.numFiles,
+                                self.numDirs, self.seconds, self.filesPerSec())
+
+def _scanOne(task):
+    '''
+    Function: _scanOne
+    Input: task - (top, sub, pidre) where top is a directory given to scanDirs,
+                  sub is '' or the name of a shard subdirectory of top, and
+                  pidre finds the patient ID in a filename
+    Output: (top, fnsByPID) - fnsByPID is a dict of patient ID to the
+                              filenames (relative to top) of that patient
+    Functionality: Lists one directory and groups its filenames by patient ID.
+                   Run in a worker thread.
+    '''
+    top, sub, pidre = task
+    fnsByPID = {}
+
+    for fn in os.listdir(os.path.join(top, sub)):
+        pid = pidre.search(fn).group()          # get patient ID
+
+        if sub: fn = os.path.join(sub, fn)      # keep shard in the name
+        fnsByPID.setdefault(pid, []).append(fn)
+
+    return (top, fnsByPID)
+
+def scanDirs(dirs, pidre=myre.NUMRE, numThreads=NUM_THREADS, sharded=False):
+    '''
+    Function: scanDirs
+    Input:
+        dirs - list of directories of reports
+        pidre - compiled regex whose first match in a filename is the patient ID
+        numThreads - number of directories to list at once
+        sharded - if True, dirs hold only subdirectories (e.g., 00 through ff
+                  named by a hash) and the reports are in those. Each shard is
+                  listed as its own task.
+    Output:
+        fnsByPIDByDir - dict of each directory in dirs to a dict of patient ID
+                        to the list of that patient's filenames, relative to
+                        the directory
+        stats - ScanStats for the scan, for the caller to log
+    Functionality: Lists directories concurrently and groups filenames by
+                   patient ID, like getRptNamesByPID does one directory at a
+                   time
+    '''
+    start = time.time()
+    pool = ThreadPool(numThreads)
+
+    try:
+        if sharded:     # list the tops, then every shard under all of them
+            subsByDir = pool.map(os.listdir, dirs)
+            tasks = [(d, sub, pidre) for d, subs in zip(dirs, subsByDir)
+                                                            for sub in subs]
+        else:
+            tasks = [(d, '', pidre) for d in dirs]
+
+        fnsByPIDByDir = dict((d, {}) for d in dirs)
+        numFiles = 0
+
+        # merge each listing into its directory's results as it comes in
+        for top, fnsByPID in pool.imap_unordered(_scanOne, tasks):
+            merged = fnsByPIDByDir[top]
+
+            for pid, fns in fnsByPID.iteritems():
+                merged.setdefault(pid, []).extend(fns)
+                numFiles += len(fns)
+    finally:
+        pool.close()
+        pool.join()
+
+    stats = ScanStats(len(tasks), numFiles, time.time() - start)
+
+    return fnsByPIDByDir, stats
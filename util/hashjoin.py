@@ -0,0 +1,251 @@
+'''
+File: hashjoin.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Joins two sets of rows on a key column, e.g., a cohort file
+               read with myos.iterRows and rows from db.selColumns, instead of
+               hand-built dicts and nested loops. The right side is hashed and
+               the left side streamed past it. If the right side is bigger than
+               the memory budget, both sides are spilled to disk in hash
+               partitions, which are joined in a process pool.
+Contents:
+    hashJoin - function that joins two iterables of rows on a key column and
+               writes the joined rows out
+'''
+import os, shutil, tempfile, logging, cPickle, itertools
+import multiprocessing
+from org.ghri.shalgrim.util import myos
+from org.ghri.shalgrim.util.mystring import RowSerializer
+
+JOIN_TYPES = ('inner', 'left')
+MEM_BUDGET = 1000000    # default most right-side rows to hold in memory
+NUM_PARTITIONS = 16     # default partitions to spill to over the budget
+
+def _dumpRows(rows, fd):
+    '''
+    Function: _dumpRows
+    Input:
+        rows - list of rows
+        fd - file opened for binary write
+    Output: none
+    Functionality: Appends a batch of rows to a spill file
+    '''
+    cPickle.dump(rows, fd, cPickle.HIGHEST_PROTOCOL)
+
+    return
+
+def _loadRows(fn):
+    '''
+    Function: _loadRows
+    Input: fn - a spill file written with _dumpRows
+    Output: generator of the rows in fn
+    Functionality: Streams a spill file back a batch at a time
+    '''
+    fd = open(fn, 'rb')
+
+    try:
+        while True:
+            try: rows = cPickle.load(fd)
+            except EOFError: break
+
+            for row in rows: yield row
+    finally:
+        fd.close()
+
+def _buildTable(rows, rkey, keyfunc):
+    '''
+    Function: _buildTable
+    Input:
+        rows - iterable of right-side rows
+        rkey - index of key column
+        keyfunc - function applied to keys before comparing, or None
+    Output: table - dict of key to list of the rows with that key, minus the
+                    key column
+    Functionality: Builds the hash table for the in-memory join
+    '''
+    table = {}
+
+    for row in rows:
+        key = row[rkey]
+
+        if keyfunc: key = keyfunc(key)
+
+        table.setdefault(key, []).append(tuple(row[:rkey]) +
+                                                        tuple(row[rkey+1:]))
+
+    return table
+
+def _probe(rows, table, lkey, keyfunc, how, rwidth):
+    '''
+    Function: _probe
+    Input:
+        rows - iterable of left-side rows
+        table - hash table from _buildTable
+        lkey - index of key column
+        keyfunc - function applied to keys before comparing, or None
+        how - 'inner' or 'left'
+        rwidth - number of columns in a right row minus its key, used to pad
+                 unmatched rows in a left join
+    Output: generator of joined rows
+    Functionality: Streams the left side past the hash table
+    '''
+    padding = (None,)*rwidth
+
+    for row in rows:
+        key = row[lkey]
+
+        if keyfunc: key = keyfunc(key)
+
+        matches = table.get(key)
+
+        if matches:
+            row = tuple(row)
+
+            for match in matches:
+                yield row + match
+        elif how == 'left':
+            yield tuple(row) + padding
+
+def _joinPartition(args):
+    '''
+    Function: _joinPartition
+    Input: args - (leftfn, rightfn, outfn, lkey, rkey, keyfunc, how, rwidth,
+                   colsep, nullstr)
+    Output: n - number of joined rows written to outfn
+    Functionality: Joins one pair of spilled partitions in memory. Run in a
+                   worker process.
+    '''
+    leftfn, rightfn, outfn, lkey, rkey, keyfunc, how, rwidth, colsep, \
+                                                                nullstr = args
+    table = _buildTable(_loadRows(rightfn), rkey, keyfunc)
+    joined = _probe(_loadRows(leftfn), table, lkey, keyfunc, how, rwidth)
+    fd = open(outfn, 'w')
+    n = RowSerializer(colsep, nullstr).writeRows(joined, fd)
+    fd.close()
+
+    return n
+
+def _partition(rows, key, keyfunc, fns, batchsize=10000):
+    '''
+    Function: _partition
+    Input:
+        rows - iterable of rows
+        key - index of key column
+        keyfunc - function applied to keys before hashing, or None
+        fns - partition filenames to append rows to
+        batchsize - rows to buffer per partition before writing
+    Output: n - number of rows partitioned
+    Functionality: Spills rows to partition files by hash of their key
+    '''
+    fds = [open(fn, 'ab') for fn in fns]
+    buffers = [[] for fn in fns]
+    n = 0
+
+    try:
+        for row in rows:
+            k = row[key]
+
+            if keyfunc: k = keyfunc(k)
+
+            i = hash(k)%len(fns)
+            buf = buffers[i]
+            buf.append(row)
+            n += 1
+
+            if len(buf) >= batchsize:
+                _dumpRows(buf, fds[i])
+                del buf[:]
+
+        for buf, fd in zip(buffers, fds):   # write what's left
+            if buf: _dumpRows(buf, fd)
+    finally:
+        for fd in fds: fd.close()
+
+    return n
+
+def hashJoin(left, right, lkey=0, rkey=0, how='inner', outfn='', colsep='\t',
+             nullstr='', keyfunc=None, memBudget=MEM_BUDGET,
+             numPartitions=NUM_PARTITIONS, processes=None, spilldir=None):
+    '''
+    Function: hashJoin
+    Input:
+        left - iterable of rows (sequences), e.g., myos.iterRows(fn). Streamed
+        right - iterable of rows, e.g., the rows from db.selColumns. Hashed
+        lkey, rkey - indexes of the key column in left and right rows
+        how - 'inner' or 'left'. In a left join, left rows with no match get
+              None for each right column
+        outfn - file to write joined rows to. stdout if ''
+        colsep - column separator of the output
+        nullstr - what to write for None in the output
+        keyfunc - function applied to both sides' keys before comparing, e.g.,
+                  int when one side's keys are strings read from a file and
+                  the other's are ints from the database. Must be picklable
+                  (a builtin or module-level function) if the join spills
+        memBudget - most right rows to hold in memory before spilling
+        numPartitions - number of partitions to spill to
+        processes - worker processes for joining spilled partitions. Defaults
+                    to the number of cores
+        spilldir - directory for spill files. Defaults to the system temp dir
+    Output: n - number of joined rows written
+    Functionality: Joins left and right on their key columns and writes each
+                   joined row, the left row followed by the right row without
+                   its key, to outfn as a delimited line. When right fits in
+                   memBudget rows the output is in left's order; when it
+                   spills, rows come out grouped by partition.
+    '''
+    if how not in JOIN_TYPES:
+        raise ValueError('Unrecognized join type %s'%(how))
+
+    right = iter(right)
+    head = list(itertools.islice(right, memBudget + 1))    # try to fit right
+    rwidth = len(head[0]) - 1 if head else 0
+    serializer = RowSerializer(colsep, nullstr)
+
+    if len(head) <= memBudget:              # fits, so join in memory
+        table = _buildTable(head, rkey, keyfunc)
+        fd = myos.openw(outfn)
+        n = serializer.writeRows(_probe(left, table, lkey, keyfunc, how,
+                                                                rwidth), fd)
+        if outfn: myos.close(fd)              # leave stdout open for caller
+
+        return n
+
+    logging.info('right side over %d rows, spilling to %d partitions'%(
+                                                    memBudget, numPartitions))
+    tmpdir = tempfile.mkdtemp(prefix='hashjoin', dir=spilldir)
+
+    try:
+        names = ['%03d'%(i) for i in range(numPartitions)]
+        rightfns = [os.path.join(tmpdir, 'r' + name) for name in names]
+        leftfns = [os.path.join(tmpdir, 'l' + name) for name in names]
+        outfns = [os.path.join(tmpdir, 'o' + name) for name in names]
+
+        # spill both sides, then join matching partitions in parallel
+        _partition(itertools.chain(head, right), rkey, keyfunc, rightfns)
+        del head
+        _partition(left, lkey, keyfunc, leftfns)
+
+        tasks = [(lfn, rfn, ofn, lkey, rkey, keyfunc, how, rwidth, colsep,
+                    nullstr) for lfn, rfn, ofn in zip(leftfns, rightfns, outfns)
+                                                        if os.path.exists(lfn)]
+        pool = multiprocessing.Pool(processes)
+
+        try:
+            n = sum(pool.map(_joinPartition, tasks, 1))
+        finally:
+            pool.close()
+            pool.join()
+
+        # stream the partitions' output into the output file
+        fd = myos.openw(outfn)
+
+        for task in tasks:
+            partfd = open(task[2])
+            shutil.copyfileobj(partfd, fd)
+            partfd.close()
+
+        if outfn: myos.close(fd)              # leave stdout open for caller
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return n
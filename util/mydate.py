@@ -6,13 +6,17 @@ Functionality: wrappers for classes in datetime module
 Contents:
     MyDatetime - wrapper class for datetime.datetime that makes formatting calls
                  easier and also handles strings that are not dates
+    toDayNum - function that converts a date to an int day number
+    DateIndex - class that indexes patients' event dates for range and
+                nearest-event queries
 History:
     8/18/11: udpated MyDatetime.__sub__ to include warnings if you try to
              subtract a nondate
     10/10/11: added calcAge function
+    10/19/26: added toDayNum and DateIndex
 '''
 
-import datetime, logging
+import datetime, logging, array, bisect
 
 DEFAULT_FORMAT='%m/%d/%Y'   # default date format
 DEFAULT_DATE='01/01/1900'   # default date
@@ -144,3 +148,232 @@ class MyDatetime:
         if other.nondate: logging.warning('subtracting nondate')
 
         return self.dt - other.dt   # return difference of date members
+
+def toDayNum(date):
+    '''
+    Function: toDayNum
+    Input: date - a MyDatetime, datetime.datetime or datetime.date
+    Output: answer - the date's proleptic Gregorian ordinal (days since
+                     1/1/0001), or None if date is a nondate MyDatetime
+    Functionality: Converts a date to an int so dates can be compared and
+                   subtracted as ints
+    '''
+    if isinstance(date, MyDatetime):
+        if date.nondate: answer = None
+        else: answer = date.dt.toordinal()
+    else:
+        answer = date.toordinal()
+
+    return answer
+
+class DateIndex(object):
+    '''
+    Class: DateIndex
+    Members:
+        days - dict of patient ID to array of the day numbers of the patient's
+               dated events, sorted
+        items - dict of patient ID to list of the patient's dated events, in
+                the same order as days
+        nondates - dict of patient ID to list of the patient's events whose
+                   dates are nondates. These are never in a query's answer.
+        pending - dict of patient ID to list of (day number, event) added
+                  since the patient was last sorted
+    Functionality: Indexes events (e.g., reports or encounters) by date per
+                   patient so that questions like "which events are within 30
+                   days of diagnosis" take a binary search per patient instead
+                   of subtracting MyDatetimes for every event. Dates are kept
+                   as int day numbers, so times of day are ignored.
+    History:
+        10/19/26 - created
+    '''
+
+    def __init__(self, events=()):
+        '''
+        Method: __init__
+        Input:
+            self - this DateIndex
+            events - iterable of (pid, date) or (pid, date, event) to add
+        Output: self - a new DateIndex
+        Functionality: constructor
+        '''
+        self.days = {}
+        self.items = {}
+        self.nondates = {}
+        self.pending = {}
+
+        for event in events:
+            self.add(*event)
+
+        return
+
+    def add(self, pid, date, event=None):
+        '''
+        Method: add
+        Input:
+            self - this DateIndex
+            pid - patient ID
+            date - a MyDatetime, datetime.datetime or datetime.date
+            event - what to return for this date in answers. date if None
+        Output: none
+        Functionality: Adds an event. Events are sorted in when the patient is
+                       next queried.
+        '''
+        if event is None: event = date
+
+        day = toDayNum(date)
+
+        if day is None:                 # keep nondates out of the arrays
+            self.nondates.setdefault(pid, []).append(event)
+        else:
+            self.pending.setdefault(pid, []).append((day, event))
+
+        return
+
+    def _sorted(self, pid):
+        '''
+        Method: _sorted
+        Input:
+            self - this DateIndex
+            pid - patient ID
+        Output: (days, items) - pid's sorted day numbers and events, both
+                                empty if pid has no dated events
+        Functionality: Merges in events added since pid was last sorted
+        '''
+        new = self.pending.pop(pid, None)
+
+        if new:
+            pairs = sorted(zip(self.days.get(pid, ()),
+                               self.items.get(pid, ())) + new,
+                                                key=lambda pair: pair[0])
+            self.days[pid] = array.array('l', [day for day, event in pairs])
+            self.items[pid] = [event for day, event in pairs]
+
+        return (self.days.get(pid, ()), self.items.get(pid, ()))
+
+    def _anchor(self, date):
+        '''
+        Method: _anchor
+        Input:
+            self - this DateIndex
+            date - date a query is about
+        Output: its day number
+        Functionality: Raises ValueError for a nondate, which has no place on
+                       the calendar to search from
+        '''
+        day = toDayNum(date)
+
+        if day is None:
+            raise ValueError('cannot query around nondate %s'%(date.repr))
+
+        return day
+
+    def between(self, pid, start, end):
+        '''
+        Method: between
+        Input:
+            self - this DateIndex
+            pid - patient ID
+            start, end - dates
+        Output: list of pid's events dated from start through end, inclusive,
+                in date order
+        Functionality: Range query
+        '''
+        lo, hi = self._anchor(start), self._anchor(end)
+        days, items = self._sorted(pid)
+
+        return items[bisect.bisect_left(days, lo):bisect.bisect_right(days, hi)]
+
+    def within(self, pid, date, ndays, before=True, after=True):
+        '''
+        Method: within
+        Input:
+            self - this DateIndex
+            pid - patient ID
+            date - date to search around, e.g., diagnosis date
+            ndays - most days from date an event can be
+            before, after - whether to include events before and after date
+        Output: list of pid's events within ndays of date, in date order
+        Functionality: Window query
+        '''
+        day = self._anchor(date)
+        days, items = self._sorted(pid)
+        lo = bisect.bisect_left(days, day - ndays if before else day)
+        hi = bisect.bisect_right(days, day + ndays if after else day)
+
+        return items[lo:hi]
+
+    def nearest(self, pid, date):
+        '''
+        Method: nearest
+        Input:
+            self - this DateIndex
+            pid - patient ID
+            date - a date
+        Output: (event, ndays) - pid's event nearest date and how many days
+                                 after date it is (negative if before), or
+                                 None if pid has no dated events. Ties go to
+                                 the earlier event.
+        Functionality: Nearest-event query
+        '''
+        day = self._anchor(date)
+        days, items = self._sorted(pid)
+
+        if not days: return None
+
+        i = bisect.bisect_left(days, day)
+
+        # pick between the events on either side of where day would go
+        if i == len(days) or (i > 0 and day - days[i-1] <= days[i] - day):
+            i -= 1
+
+        return (items[i], days[i] - day)
+
+    def getNondates(self, pid):
+        '''
+        Method: getNondates
+        Input:
+            self - this DateIndex
+            pid - patient ID
+        Output: list of pid's events whose dates are nondates
+        Functionality: accessor
+        '''
+        return list(self.nondates.get(pid, ()))
+
+    def withinMany(self, anchors, ndays, before=True, after=True):
+        '''
+        Method: withinMany
+        Input:
+            self - this DateIndex
+            anchors - dict of patient ID to the date to search around, e.g.,
+                      each patient's diagnosis date
+            ndays, before, after - as for within
+        Output: answer - dict of patient ID in anchors to the list within
+                         returns, or None if the patient's anchor is a
+                         nondate
+        Functionality: Window query for a whole cohort
+        '''
+        answer = {}
+
+        for pid, date in anchors.iteritems():
+            if toDayNum(date) is None: answer[pid] = None
+            else: answer[pid] = self.within(pid, date, ndays, before, after)
+
+        return answer
+
+    def nearestMany(self, anchors):
+        '''
+        Method: nearestMany
+        Input:
+            self - this DateIndex
+            anchors - dict of patient ID to a date
+        Output: answer - dict of patient ID in anchors to what nearest returns,
+                         or None if the patient's anchor is a nondate
+        Functionality: Nearest-event query for a whole cohort
+        '''
+        answer = {}
+
+        for pid, date in anchors.iteritems():
+            if toDayNum(date) is None: answer[pid] = None
+            else: answer[pid] = self.nearest(pid, date)
+
+        return answer
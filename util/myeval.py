@@ -0,0 +1,404 @@
+'''
+File: myeval.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Evaluates system output against a gold standard, where each is
+               a char-separated txt file with a key column (e.g., document or
+               patient ID) and a label column, in one streaming pass instead of
+               reading both files into lists and comparing them in loops. One
+               file is indexed in a dict and the other streamed past it, or if
+               both are sorted by key they're merged without an index. Many
+               system files can be evaluated against one gold file in parallel.
+Contents:
+    EvalResult - class holding a confusion matrix and giving precision,
+                 recall and F1 per class, micro- and macro-averaged
+    evaluate - function that evaluates a system file against a gold file
+    evaluateMany - function that evaluates several system files against a gold
+                   file in a process pool
+NOTE: A key in one file but not the other counts as the label None in the file
+      it's missing from, so a missing system answer is a false negative for
+      the gold label and a spurious one a false positive for the system label.
+NOTE: A key may appear only once per file. A repeated key raises ValueError,
+      whichever file it's in and whichever way the files are compared.
+'''
+import os, logging, multiprocessing
+from org.ghri.shalgrim.util import myos
+
+def _iterPairs(fn, keycol=0, labelcol=1, colsep='\t', header=False):
+    '''
+    Function: _iterPairs
+    Input:
+        fn - a char-separated txt file
+        keycol, labelcol - indexes of the key and label columns
+        colsep - column separator
+        header - True if the first line is a header to skip
+    Output: generator of (key, label) for each non-blank line of fn
+    Functionality: Streams the key and label out of a file
+    '''
+    for row in myos.iterRows(fn, colsep, header):
+        if row == ['']: continue            # skip blank lines
+
+        try:
+            yield (row[keycol], row[labelcol])
+        except IndexError:
+            logging.warning('line in %s too short for index %d'%(fn,
+                                                    max(keycol, labelcol)))
+
+def _index(fn, **kwargs):
+    '''
+    Function: _index
+    Input:
+        fn - a char-separated txt file
+        kwargs - column options as for _iterPairs
+    Output: index - dict of key to label
+    Functionality: Reads a file into a dict. Raises ValueError if a key repeats.
+    '''
+    index = {}
+
+    for key, label in _iterPairs(fn, **kwargs):
+        if key in index:
+            raise ValueError('duplicate key %s in %s'%(key, fn))
+
+        index[key] = label
+
+    return index
+
+class EvalResult(object):
+    '''
+    Class: EvalResult
+    Members:
+        confusion - dict of (gold label, system label) to count. None stands
+                    for a key missing from that side.
+        name - name of what was evaluated, e.g., the system filename
+    Functionality: Holds the counts an evaluation makes in its one pass and
+                   computes the usual measures from them
+    '''
+
+    def __init__(self, name=''):
+        self.confusion = {}
+        self.name = name
+
+        return
+
+    def add(self, gold, system, n=1):
+        '''
+        Method: add
+        Input:
+            self - this EvalResult
+            gold, system - gold and system labels of a key
+            n - number of keys to count
+        Output: none
+        Functionality: Counts a key
+        '''
+        pair = (gold, system)
+        self.confusion[pair] = self.confusion.get(pair, 0) + n
+
+        return
+
+    def classes(self):
+        '''
+        Method: classes
+        Input: self - this EvalResult
+        Output: sorted list of every label seen on either side, except None
+        Functionality: accessor
+        '''
+        labels = set()
+
+        for gold, system in self.confusion:
+            labels.add(gold)
+            labels.add(system)
+
+        labels.discard(None)
+
+        return sorted(labels)
+
+    def counts(self, label):
+        '''
+        Method: counts
+        Input:
+            self - this EvalResult
+            label - a class label
+        Output: (tp, fp, fn) for label
+        Functionality: Sums the confusion matrix for one class
+        '''
+        tp = fp = fn = 0
+
+        for (gold, system), n in self.confusion.iteritems():
+            if gold == label and system == label: tp += n
+            elif system == label: fp += n
+            elif gold == label: fn += n
+
+        return (tp, fp, fn)
+
+    def total(self):
+        '''
+        Method: total
+        Input: self - this EvalResult
+        Output: number of keys counted
+        Functionality: accessor
+        '''
+        return sum(self.confusion.itervalues())
+
+    def accuracy(self):
+        '''
+        Method: accuracy
+        Input: self - this EvalResult
+        Output: fraction of keys whose labels agree
+        Functionality: accessor
+        '''
+        total = self.total()
+        agree = sum(n for (gold, system), n in self.confusion.iteritems()
+                                                if gold == system)
+
+        return float(agree)/total if total else 0.0
+
+    def prf(self, label=None):
+        '''
+        Method: prf
+        Input:
+            self - this EvalResult
+            label - a class label, or None for the micro-average over all
+                    classes
+        Output: (precision, recall, f1)
+        Functionality: Computes the measures for one class or all of them
+        '''
+        if label is None:
+            tp = fp = fn = 0
+
+            for c in self.classes():
+                ctp, cfp, cfn = self.counts(c)
+                tp += ctp
+                fp += cfp
+                fn += cfn
+        else:
+            tp, fp, fn = self.counts(label)
+
+        return _prf(tp, fp, fn)
+
+    def macro(self):
+        '''
+        Method: macro
+        Input: self - this EvalResult
+        Output: (precision, recall, f1) averaged over classes
+        Functionality: Macro-averages prf
+        '''
+        classes = self.classes()
+
+        if not classes: return (0.0, 0.0, 0.0)
+
+        prfs = [self.prf(c) for c in classes]
+
+        return tuple(sum(m)/len(classes) for m in zip(*prfs))
+
+    def report(self, fd, header=True):
+        '''
+        Method: report
+        Input:
+            self - this EvalResult
+            fd - file to write to
+            header - if True, a line of column names is written first
+        Output: none
+        Functionality: Writes a tab-separated line per class with its counts
+                       and measures, then micro and macro lines and accuracy
+        '''
+        if header:
+            print >> fd, '\t'.join(['name', 'class', 'tp', 'fp', 'fn',
+                                            'precision', 'recall', 'f1'])
+
+        for c in self.classes():
+            counts = self.counts(c)
+            print >> fd, '\t'.join([self.name, c] + [str(n) for n in counts] +
+                                ['%.4f'%(m) for m in _prf(*counts)])
+
+        print >> fd, '\t'.join([self.name, 'MICRO', '', '', ''] +
+                                        ['%.4f'%(m) for m in self.prf()])
+        print >> fd, '\t'.join([self.name, 'MACRO', '', '', ''] +
+                                        ['%.4f'%(m) for m in self.macro()])
+        print >> fd, '\t'.join([self.name, 'ACCURACY', str(self.total()), '',
+                                        '', '', '', '%.4f'%(self.accuracy())])
+
+        return
+
+def _prf(tp, fp, fn):
+    '''
+    Function: _prf
+    Input: tp, fp, fn - true positive, false positive and false negative counts
+    Output: (precision, recall, f1) - 0.0 for any that would divide by zero
+    Functionality: Computes precision, recall and F1
+    '''
+    precision = float(tp)/(tp + fp) if tp + fp else 0.0
+    recall = float(tp)/(tp + fn) if tp + fn else 0.0
+
+    if precision + recall:
+        f1 = 2*precision*recall/(precision + recall)
+    else:
+        f1 = 0.0
+
+    return (precision, recall, f1)
+
+def _countIndexed(result, index, pairs, indexIsGold, fn):
+    '''
+    Function: _countIndexed
+    Input:
+        result - EvalResult to count into
+        index - dict of key to label for one side
+        pairs - iterable of (key, label) for the other side
+        indexIsGold - True if index is the gold side
+        fn - file pairs come from, for error messages
+    Output: none
+    Functionality: Streams pairs past index, counting each key once. Keys of
+                   index never seen in pairs are counted as missing at the end.
+                   Raises ValueError if a key in pairs repeats, so every key
+                   streamed is kept, as well as index.
+    '''
+    seen = set()            # streamed keys
+
+    for key, label in pairs:
+        if key in seen:
+            raise ValueError('duplicate key %s in %s'%(key, fn))
+
+        seen.add(key)
+        other = index.get(key)
+
+        if indexIsGold: result.add(other, label)
+        else: result.add(label, other)
+
+    for key, label in index.iteritems():
+        if key not in seen:
+            if indexIsGold: result.add(label, None)
+            else: result.add(None, label)
+
+    return
+
+def _unique(pairs, fn):
+    '''
+    Function: _unique
+    Input:
+        pairs - iterable of (key, label) sorted by key
+        fn - file pairs come from, for error messages
+    Output: generator of pairs
+    Functionality: Passes sorted pairs through, raising ValueError if a key
+                   repeats
+    '''
+    last = None
+
+    for i, pair in enumerate(pairs):
+        if i and pair[0] == last:
+            raise ValueError('duplicate key %s in %s'%(last, fn))
+
+        last = pair[0]
+        yield pair
+
+def _countMerged(result, goldPairs, sysPairs):
+    '''
+    Function: _countMerged
+    Input:
+        result - EvalResult to count into
+        goldPairs, sysPairs - iterables of (key, label) sorted by key
+    Output: none
+    Functionality: Merges two key-sorted streams, so neither side is held in
+                   memory
+    '''
+    done = (None, None)
+    gold = next(goldPairs, done)
+    system = next(sysPairs, done)
+
+    while gold is not done or system is not done:
+        if system is done or (gold is not done and gold[0] < system[0]):
+            result.add(gold[1], None)       # missing from system
+            gold = next(goldPairs, done)
+        elif gold is done or system[0] < gold[0]:
+            result.add(None, system[1])        # spurious
+            system = next(sysPairs, done)
+        else:
+            result.add(gold[1], system[1])
+            gold = next(goldPairs, done)
+            system = next(sysPairs, done)
+
+    return
+
+def evaluate(goldfn, sysfn, presorted=False, **kwargs):
+    '''
+    Function: evaluate
+    Input:
+        goldfn - gold standard file
+        sysfn - system output file
+        presorted - True if both files are sorted by key (e.g., by
+                    sort_file.py with the key in the first column), so they
+                    can be merged without indexing either
+        kwargs - keycol, labelcol, colsep and header as for the columns of
+                 both files
+    Output: result - EvalResult of sysfn against goldfn
+    Functionality: Evaluates in one pass. Unless presorted, the smaller file
+                   is indexed and the larger one streamed.
+    '''
+    result = EvalResult(sysfn)
+
+    if presorted:
+        _countMerged(result, _unique(_iterPairs(goldfn, **kwargs), goldfn),
+                            _unique(_iterPairs(sysfn, **kwargs), sysfn))
+    elif os.path.getsize(goldfn) <= os.path.getsize(sysfn):
+        _countIndexed(result, _index(goldfn, **kwargs),
+                                _iterPairs(sysfn, **kwargs), True, sysfn)
+    else:
+        _countIndexed(result, _index(sysfn, **kwargs),
+                                _iterPairs(goldfn, **kwargs), False, goldfn)
+
+    return result
+
+# gold index shared with evaluateMany's workers
+_GOLD = {}
+
+def _initWorker(gold):
+    '''
+    Function: _initWorker
+    Input: gold - dict of key to gold label
+    Output: none
+    Functionality: Gives a worker the gold index once rather than per task
+    '''
+    _GOLD.clear()
+    _GOLD.update(gold)
+
+    return
+
+def _evaluateOne(task):
+    '''
+    Function: _evaluateOne
+    Input: task - (sysfn, kwargs)
+    Output: result - EvalResult of sysfn against the gold index
+    Functionality: Evaluates one system file. Run in a worker process.
+    '''
+    sysfn, kwargs = task
+    result = EvalResult(sysfn)
+    _countIndexed(result, _GOLD, _iterPairs(sysfn, **kwargs), True, sysfn)
+
+    return result
+
+def evaluateMany(goldfn, sysfns, processes=None, **kwargs):
+    '''
+    Function: evaluateMany
+    Input:
+        goldfn - gold standard file
+        sysfns - list of system output files
+        processes - number of worker processes. Defaults to number of cores
+        kwargs - column options as for evaluate
+    Output: results - list of EvalResult, in order of sysfns
+    Functionality: Indexes the gold file once and evaluates each system file
+                   against it in a process pool
+    '''
+    gold = _index(goldfn, **kwargs)
+    tasks = [(sysfn, kwargs) for sysfn in sysfns]
+
+    if len(tasks) < 2 or processes == 1:    # not worth starting a pool
+        _initWorker(gold)
+        return [_evaluateOne(task) for task in tasks]
+
+    pool = multiprocessing.Pool(processes, _initWorker, (gold,))
+
+    try:
+        results = pool.map(_evaluateOne, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
@@ -6,6 +6,8 @@ Functionality: Encapsulates frequently used os-related functionality
 Contents:
     getColsFromFile - Gets column lists out of some kind of char-separated txt
                       file
+    getColsFromFileParallel - Same as getColsFromFile, but splits the file into
+                              byte ranges parsed in a pool of processes
     mkdir_p - function that emulates Unix's mkdir -p functionality
     remSuffixes - function that removes the suffixes from a filename so that
                   a file's parallel files can be found in other directories
@@ -13,6 +15,23 @@ Contents:
                  directories
     writeTokenizedLines - function that writes tokenized lines to output file
     write - function that Writes text to a file taking advantage of openw
+    listdirCached - function that lists a directory, reusing the last listing
+                    if the directory has not changed
+    readlinesCached - function that reads lines from a file, reusing the last
+                      read if the file has not changed
+    iterRows - function that streams the rows of a char-separated txt file
+    DirIndex - class that indexes the files in a list of directories so that
+               files and their parallel files can be located without probing
+               each directory
+    locateFileCached - function that does what locateFile does using a
+                       DirIndex kept for the list of directories
+    openr - function that opens a file for reading, decompressing it if it's
+            gzip, bz2 or zstd compressed
+    DecompressedFile - class that is a read-only file object over the
+                       decompressed contents of a compressed file
+    writeShards - function that writes rows to several shard files at once,
+                  with a manifest of the shards' row counts and checksums
+    readManifest - function that reads the manifest writeShards writes
 History:
     9/28/10 - added read and writelines
     9/29/10 - added openw
@@ -24,8 +43,119 @@ History:
     10/25/10 - modified getColsFromFile so that it could handle some (or all)
                lines not having enough columns
     12/14/10 - added write
+    10/19/26 - added listdirCached and readlinesCached so that batch runs of
+               onetime scripts don't re-scan the same directories and files
+             - added iterRows
+             - added DirIndex and locateFileCached
+             - added openr and modified read, readlines (so getColsFromFile)
+               and iterRows to use it, so they read compressed files too
+             - added getColsFromFileParallel
+             - added writeShards and readManifest, and nshards input to
+               writelines
 '''
-import os, errno, sys, logging
+import os, errno, sys, logging, time, zlib, bz2, struct, multiprocessing
+import csv, operator, itertools, cStringIO, hashlib, io
+from multiprocessing.pool import ThreadPool
+from org.ghri.shalgrim.util.mystring import RowSerializer, ROWS_PER_WRITE
+
+# caches used by listdirCached and readlinesCached. Keys are paths and values
+# are (stamp, contents) tuples where stamp tells us if the path has changed
+_LISTDIR_CACHE = {}
+_READLINES_CACHE = {}
+
+# DirIndexes used by locateFileCached, keyed by tuple of directories
+_DIR_INDEXES = {}
+
+MAX_AGE = 1.0       # default seconds a DirIndex trusts its listings
+
+# first bytes of compressed files openr recognizes
+GZIP_MAGIC = '\x1f\x8b'
+BZ2_MAGIC = 'BZh'
+ZSTD_MAGIC = '\x28\xb5\x2f\xfd'
+
+# BGZF block header: gzip header with FEXTRA, then the BC subfield holding the
+# block's size - 1
+BGZF_HEADER = struct.Struct('<4BI2BH2BHH')
+
+DECOMPRESS_CHUNK_SIZE = 1 << 20 # compressed bytes openr reads at a time
+DECOMPRESS_THREADS = 4          # default threads for BGZF files
+BGZF_BATCH_BLOCKS = 64          # BGZF blocks handed to the threads at once
+
+RANGE_SIZE = 1 << 26    # default most bytes getColsFromFileParallel parses
+                        # in one task
+RANGES_PER_WORKER = 4   # fewest tasks per worker, to even out the load
+
+SNIFF_BYTES = 1 << 16   # bytes getColsFromFile sniffs the dialect from
+
+SHARD_THREADS = 4       # default most shard writes writeShards runs at once
+MANIFEST_SUFFIX = '.manifest'   # added to writeShards' outfn for its manifest
+MANIFEST_HEADER = ['shard', 'rows', 'md5']
+
+def _projectRows(rows, cols):
+    '''
+    Function: _projectRows
+    Input:
+        rows - iterable of lists of field values
+        cols - tuple of column indexes
+    Output: columns - list of tuples, one per index in cols, of the values in
+                      that column of each row. None where a row is too short.
+    Functionality: Keeps just the requested columns of each row as it's read,
+                   instead of holding every field of every row
+    '''
+    getter = operator.itemgetter(*cols)
+    need = max(cols)
+    single = len(cols) == 1
+
+    def pad(row):
+        '''
+        the requested values of a row too short for some of them
+        '''
+        row = row or ['']           # csv gives [] for a blank line
+        values = tuple(row[c] if c < len(row) else None for c in cols)
+        return values[0] if single else values
+
+    projected = [getter(row) if len(row) > need else pad(row) for row in rows]
+
+    if not projected: return [() for c in cols]
+
+    return [tuple(projected)] if single else zip(*projected)
+
+def _readProjected(fn, cols, colsep, quotechar, sniff):
+    '''
+    Function: _readProjected
+    Input: as for getColsFromFile
+    Output: columns - as from _projectRows for the rows of fn
+    Functionality: Reads fn's rows with the csv module's reader, or with split
+                   if quotechar is None or colsep is more than one char
+    '''
+    fd = openr(fn)
+
+    try:
+        lines = fd
+
+        if sniff:                       # guess delimiter and quoting
+            sample = fd.read(SNIFF_BYTES)
+            sample += fd.readline()     # finish the last line
+
+            try:
+                dialect = csv.Sniffer().sniff(sample)
+                colsep, quotechar = dialect.delimiter, dialect.quotechar
+            except csv.Error:
+                logging.warning('could not sniff dialect of %s, using colsep '
+                                                        '%r'%(fn, colsep))
+
+            lines = itertools.chain(cStringIO.StringIO(sample), fd)
+
+        if quotechar is None or len(colsep) != 1:
+            rows = (line.split(colsep) for line in lines)
+        else:
+            rows = csv.reader(lines, delimiter=colsep, quotechar=quotechar)
+
+        columns = _projectRows(rows, cols)
+    finally:
+        fd.close()
+
+    return columns
 
 def getColsFromFile(fn, *args, **kwargs):
     '''
@@ -33,50 +163,203 @@ def getColsFromFile(fn, *args, **kwargs):
     Input:
         fn - a filename
         args - a tuple of column indexes we want to extract
-        kwargs - dict of keyword args.  We only look for colsep, the column
-                 separator in the column now. It's assumed to be '\t'
+        kwargs - dict of keyword args:
+            colsep - the column separator. Default '\t'
+            quotechar - char that quotes fields, e.g., '"', so a quoted
+                        field can hold colsep or a newline. Default None:
+                        lines are just split on colsep, as they always were.
+                        Only give it for files known to quote fields, since
+                        a field that merely starts with an unbalanced quote
+                        (common in clinical text) swallows every line after
+                        it up to the next quote
+            sniff - if True, colsep and quotechar are guessed from the start of
+                    the file with csv.Sniffer
     Output: answer - a list of lists where the inner lists' values are the
                      values of the columns requested in args
     Functionality: Gets column lists out of some kind of char-separated txt file
+    Note: Lines end at '\\n' only, as the file reads them, so a lone '\\r' stays
+          in its value. getColsFromFileParallel splits lines the same way.
     History:
         10/13/10 - created
         10/25/10 - Modified so that it could handle some (or all) lines not
                    having enough columns
+        10/19/26 - Modified to parse with the csv module so quoted fields
+                   are handled, to keep only the requested columns while
+                   reading, and to take quotechar and sniff. Quoting is off
+                   unless asked for. Values are still stripped and short
+                   lines still get None.
     '''
+    colsep = kwargs.get('colsep', '\t')        # get column separator
+    quotechar = kwargs.get('quotechar')
+    sniff = kwargs.get('sniff', False)
 
-    try: colsep = kwargs['colsep']  # get column separator
-    except KeyError: colsep='\t'    # if not there, default to \t
+    if not args: return []
 
-    # read in the file's lines and separate into columns
-    lines = [line.split(colsep) for line in readlines(fn)]
-    
-    answer = []         # initialize output
-    
-    for colnum in args: # for each desired column number
+    try:
+        columns = _readProjected(fn, args, colsep, quotechar, sniff)
 
-        try:
-            # put that column's values in a list and append to output
-            answer.append([line[colnum].strip() for line in lines])
+    # csv won't take a lone \r in a field, which splitting never minded
+    except csv.Error, myerr:
+        logging.warning('csv could not parse %s (%s), splitting lines '
+                                                'instead'%(fn, str(myerr)))
+        columns = _readProjected(fn, args, colsep, None, False)
+
+    answer = []         # initialize output
 
-        # but if at least one line does not have the right number of columns
-        # 10/25 update: put line above in try and added this except block
-        except IndexError:
+    for colnum, column in zip(args, columns):
+        if None in column:          # if some lines too short for colnum
 
             # log a warning message
             logging.warning('At least one line in %s too short for index %d'%(fn, colnum))
-            column = []             # then initialize the column
+            answer.append([v if v is None else v.strip() for v in column])
+        else:
+            answer.append([v.strip() for v in column])
 
-            for line in lines:      # and for each line
+    return answer                   # return output
 
-                # add that line's colnumth element to the column
-                try: column.append(line[colnum].strip())
+def _alignedRanges(fn, numRanges):
+    '''
+    Function: _alignedRanges
+    Input:
+        fn - a filename
+        numRanges - number of ranges to split fn into
+    Output: ranges - list of (start, end) byte offsets covering fn, each
+                     starting at the beginning of a line. Fewer than numRanges
+                     if lines are long enough that some splits land together.
+    Functionality: Splits a file into byte ranges on line boundaries by
+                   seeking to evenly spaced offsets and moving each to just
+                   past the next newline
+    '''
+    size = os.path.getsize(fn)
+    starts = [0]
+    fd = open(fn, 'rb')
+
+    try:
+        for i in xrange(1, numRanges):
+            fd.seek(max(i*size/numRanges - 1, starts[-1]))
+            fd.readline()               # finish the line we landed in
+            start = fd.tell()
 
-                # and if it's not there, add None
-                except IndexError: column.append(None)
-                
-            answer.append(column)   # then append column to output
+            if start >= size: break
+            if start > starts[-1]: starts.append(start)
+    finally:
+        fd.close()
 
-    return answer                   # return output
+    return zip(starts, starts[1:] + [size])
+
+def _parseRange(task):
+    '''
+    Function: _parseRange
+    Input: task - (i, fn, start, end, cols, colsep)
+    Output: (i, n, answer) - n is the number of lines of fn from byte start to
+                             byte end and answer has, for each column in cols,
+                             (values, short) where values is the column's
+                             values joined by newlines and short is the list
+                             of indexes of lines too short to have the column
+    Functionality: Parses one byte range. Run in a worker process. Lines are
+                   split on '\\n' only, as getColsFromFile's plain open reads
+                   them; the '\\r' of a '\\r\\n' is stripped off the last value
+                   like any other trailing whitespace. A column goes back to
+                   the parent as one string because pickling a list of
+                   millions of little strings costs more than the parsing did.
+    '''
+    i, fn, start, end, cols, colsep = task
+    fd = open(fn, 'rb')
+
+    try:
+        fd.seek(start)
+        lines = fd.read(end - start).split('\n')
+    finally:
+        fd.close()
+
+    if lines[-1] == '': lines.pop()     # piece after the last newline
+
+    lines = [line.split(colsep) for line in lines]
+    answer = []
+
+    for colnum in cols:
+        try:
+            answer.append(('\n'.join([line[colnum].strip() for line in lines]),
+                                                                        []))
+        except IndexError:              # note short lines, to pad with None
+            short = [j for j, line in enumerate(lines) if colnum >= len(line)]
+            answer.append(('\n'.join([line[colnum].strip() if colnum <
+                                len(line) else '' for line in lines]), short))
+
+    return (i, len(lines), answer)
+
+def getColsFromFileParallel(fn, *args, **kwargs):
+    '''
+    Function: getColsFromFileParallel
+    Input:
+        fn - a filename
+        args - a tuple of column indexes we want to extract
+        kwargs - dict of keyword args:
+            colsep - column separator. Default '\t'
+            processes - number of worker processes. Default number of cores
+            ordered - if True (the default) rows are in the file's order. If
+                      False they come in whatever order the ranges finish,
+                      which is fine for counts and other aggregations and
+                      saves holding finished ranges until earlier ones are in.
+                      Either way a row's values line up across columns.
+            rangeSize - most bytes to parse in one task. Default RANGE_SIZE
+    Output: answer - a list of lists where the inner lists' values are the
+                     values of the columns requested in args, as
+                     getColsFromFile returns
+    Functionality: Splits a char-separated txt file into byte ranges that
+                   start and end on line boundaries and parses the ranges in
+                   a process pool, so a big file is parsed on every core.
+                   Lines end at '\\n' only and are split on colsep, as
+                   getColsFromFile does by default (quotechar=None), since a
+                   range boundary can't tell if it's inside a quoted field.
+                   With quotechar or sniff, getColsFromFile can give different
+                   rows for the same file. A compressed file can't be
+                   split, so it's read by getColsFromFile.
+    History:
+        10/19/26 - created
+    '''
+    colsep = kwargs.get('colsep', '\t')
+    processes = kwargs.get('processes') or multiprocessing.cpu_count()
+    ordered = kwargs.get('ordered', True)
+    rangeSize = kwargs.get('rangeSize', RANGE_SIZE)
+
+    fd = open(fn, 'rb')
+    magic = fd.read(4)
+    fd.close()
+
+    if magic.startswith((GZIP_MAGIC, BZ2_MAGIC, ZSTD_MAGIC)):
+        return getColsFromFile(fn, *args, colsep=colsep, quotechar=None)
+
+    numRanges = max(processes*RANGES_PER_WORKER,
+                                    os.path.getsize(fn)/rangeSize + 1)
+    tasks = [(i, fn, start, end, args, colsep) for i, (start, end) in
+                                    enumerate(_alignedRanges(fn, numRanges))]
+    answer = [[] for colnum in args]
+    pool = multiprocessing.Pool(processes)
+
+    try:
+        if ordered: results = pool.imap(_parseRange, tasks, 1)
+        else: results = pool.imap_unordered(_parseRange, tasks, 1)
+
+        for i, n, cols in results:      # append each range's rows
+            if not n: continue
+
+            for column, (values, short) in zip(answer, cols):
+                values = values.split('\n')
+
+                for j in short: values[j] = None
+
+                column.extend(values)
+    finally:
+        pool.close()
+        pool.join()
+
+    for colnum, column in zip(args, answer):
+        if None in column:
+            logging.warning('At least one line in %s too short for index %d'%(
+                                                                fn, colnum))
+
+    return answer
 
 def remSuffixes(basename):
     '''
@@ -150,6 +433,191 @@ def locateFile(dirs, basename):
     return answer                               # return output
 
 
+class DirIndex(object):
+    '''
+    Class: DirIndex
+    Members:
+        dirs - list of directories, in the order locateFile would search them
+        maxAge - seconds lookups trust the listings before checking the
+                 directories' mtimes again
+        stamps - dict of directory to its mtime when last listed, or None if it
+                 didn't exist
+        namesByDir - dict of directory to list of its entries
+        dirByName - dict of base name to first directory in dirs containing it
+        locsByStem - dict of base name without suffixes (from remSuffixes) to
+                     list of full names of the files with that stem, in order
+                     of dirs
+        checked - time the mtimes were last checked
+    Functionality: Lists each directory once and answers locateFile's question,
+                   and finds parallel files, with dict lookups instead of an
+                   os.access probe per directory per lookup. A directory is
+                   listed again only when its mtime changes.
+    Note: Adding or removing a file updates a directory's mtime, but on file
+          systems with coarse timestamps a change made within a second or two
+          of the last listing can be missed. A lookup that misses always
+          checks the mtimes before giving up.
+    Note: Names are keyed and looked up by os.path.normcase, so lookups are
+          case-insensitive on Windows, as locateFile's os.access probes are.
+    History:
+        10/19/26 - created
+    '''
+
+    def __init__(self, dirs, maxAge=MAX_AGE):
+        '''
+        Method: __init__
+        Input:
+            self - this DirIndex
+            dirs - list of directories
+            maxAge - seconds to trust listings before checking mtimes again
+        Output: self - a new DirIndex with every directory listed
+        Functionality: constructor
+        '''
+        self.dirs = list(dirs)
+        self.maxAge = maxAge
+        self.stamps = {}
+        self.namesByDir = {}
+        self.dirByName = {}
+        self.locsByStem = {}
+        self.checked = 0
+        self.refresh()
+
+        return
+
+    def refresh(self):
+        '''
+        Method: refresh
+        Input: self - this DirIndex
+        Output: changed - number of directories listed again
+        Functionality: Lists again each directory whose mtime changed since it
+                       was last listed and rebuilds the lookup dicts if any did
+        '''
+        changed = 0
+
+        for d in self.dirs:
+            try: stamp = os.stat(d).st_mtime    # get dir's modification time
+            except OSError: stamp = None        # dir doesn't exist (anymore)
+
+            if d in self.stamps and self.stamps[d] == stamp:
+                continue                        # unchanged since last listing
+
+            self.namesByDir[d] = os.listdir(d) if stamp is not None else []
+            self.stamps[d] = stamp
+            changed += 1
+
+        if changed:                             # rebuild lookup dicts
+            self.dirByName = {}
+            self.locsByStem = {}
+
+            for d in reversed(self.dirs):       # so earlier dirs win
+                self.dirByName.update(dict.fromkeys(
+                            map(os.path.normcase, self.namesByDir[d]), d))
+
+            for d in self.dirs:
+                for name in self.namesByDir[d]:
+                    self.locsByStem.setdefault(remSuffixes(
+                                                    os.path.normcase(name)),
+                                            []).append(os.path.join(d, name))
+
+        self.checked = time.time()
+
+        return changed
+
+    def _check(self):
+        '''
+        Method: _check
+        Input: self - this DirIndex
+        Output: none
+        Functionality: Refreshes if the listings are older than maxAge
+        '''
+        if time.time() - self.checked >= self.maxAge:
+            self.refresh()
+
+        return
+
+    def locate(self, basename):
+        '''
+        Method: locate
+        Input:
+            self - this DirIndex
+            basename - the base filename of a file
+        Output: answer - the first directory in dirs that contains basename
+        Functionality: Same as locateFile
+        '''
+        self._check()
+        key = os.path.normcase(basename)
+
+        try:
+            answer = self.dirByName[key]
+        except KeyError:
+            if not self.refresh() or key not in self.dirByName:
+                # raise same exception as locateFile
+                raise Exception(basename + ' does not exist in ' +
+                                                            str(self.dirs))
+
+            answer = self.dirByName[key]
+
+        return answer
+
+    def locateMany(self, basenames):
+        '''
+        Method: locateMany
+        Input:
+            self - this DirIndex
+            basenames - list of base filenames
+        Output: answer - list of the first directory in dirs that contains each
+                         of basenames, with None for those not found
+        Functionality: Batch version of locate that checks the directories
+                       once for the whole list
+        '''
+        self._check()
+        keys = map(os.path.normcase, basenames)
+        answer = map(self.dirByName.get, keys)
+
+        if None in answer and self.refresh():   # look again if dirs changed
+            answer = map(self.dirByName.get, keys)
+
+        return answer
+
+    def parallelFiles(self, basename):
+        '''
+        Method: parallelFiles
+        Input:
+            self - this DirIndex
+            basename - a filename, base name (no path) only
+        Output: answer - list of the full names of the files in dirs whose
+                         names match basename once remSuffixes takes their
+                         suffixes off, in order of dirs
+        Functionality: Finds a file's parallel files in the other directories
+        '''
+        self._check()
+
+        return list(self.locsByStem.get(remSuffixes(os.path.normcase(
+                                                            basename)), []))
+
+def locateFileCached(dirs, basename):
+    '''
+    Function: locateFileCached
+    Input:
+        dirs - a list of directories
+        basename - the base filename of a file
+    Output: answer - the first directory in dirs that contains basename
+    Functionality: Same as locateFile, but looks basename up in a DirIndex kept
+                   for dirs across calls, so calling it for each of many files
+                   lists the directories once instead of probing each one for
+                   every file
+    History:
+        10/19/26 - created
+    '''
+    key = tuple(dirs)
+
+    try:
+        index = _DIR_INDEXES[key]               # get index for these dirs
+    except KeyError:
+        index = _DIR_INDEXES[key] = DirIndex(dirs)  # or build it
+
+    return index.locate(basename)
+
+
 def writeTokenizedLines(tlines, outfn):
     '''
     Function: writeTokenizedLines
@@ -171,47 +639,420 @@ def writeTokenizedLines(tlines, outfn):
 
     return
 
+def iterRows(fn, colsep='\t', skipHeader=False):
+    '''
+    Function: iterRows
+    Input:
+        fn - a filename
+        colsep - column separator
+        skipHeader - True if the first line is a header to skip
+    Output: generator of lists of the stripped column values of each line
+    Functionality: Streams a char-separated txt file a row at a time, for
+                   files too big for getColsFromFile to hold. The file may be
+                   compressed.
+    History:
+        10/19/26 - created
+    '''
+    fd = openr(fn)
+
+    try:
+        if skipHeader: next(fd, None)       # skip header line
+
+        for line in fd:
+            yield [v.strip() for v in line.split(colsep)]
+    finally:
+        fd.close()
+
+class DecompressedFile(object):
+    '''
+    Class: DecompressedFile
+    Members:
+        fd - the underlying compressed file
+        chunks - iterator over the decompressed data a chunk at a time
+        buf - decompressed data not yet returned
+    Functionality: Read-only file object over decompressed data, with the
+                   read, readline, readlines and line iteration that readers
+                   of plain files use. Lines end in '\\n' as in a plain file,
+                   and the data is returned as it was compressed. If
+                   universalNewlines is True, line endings ('\\r\\n' or '\\r')
+                   are changed to '\\n', as 'rU' mode does for plain files.
+                   Like a python 2 file, don't mix iterating with the other
+                   read methods.
+    History:
+        10/19/26 - created
+    '''
+
+    def __init__(self, fd, chunks, universalNewlines=False):
+        self.fd = fd
+        self.chunks = _universalNewlines(chunks) if universalNewlines else \
+                                                                iter(chunks)
+        self.buf = ''
+
+        return
+
+    def _fill(self):
+        '''
+        Method: _fill
+        Input: self - this DecompressedFile
+        Output: False if there's no more data, otherwise True
+        Functionality: Decompresses the next chunk onto buf
+        '''
+        try:
+            self.buf += next(self.chunks)
+        except StopIteration:
+            return False
+
+        return True
+
+    def read(self, size=-1):
+        if size < 0:                    # read it all
+            data = ''.join([self.buf] + list(self.chunks))
+            self.buf = ''
+        else:
+            while len(self.buf) < size and self._fill(): pass
+
+            data, self.buf = self.buf[:size], self.buf[size:]
+
+        return data
+
+    def readline(self):
+        while '\n' not in self.buf and self._fill(): pass
+
+        end = self.buf.find('\n') + 1 or len(self.buf)
+        line, self.buf = self.buf[:end], self.buf[end:]
+
+        return line
+
+    def __iter__(self):
+        while True:
+            end = self.buf.rfind('\n') + 1     # keep partial last line
+
+            if end:
+                complete, self.buf = self.buf[:end - 1], self.buf[end:]
+
+                for line in complete.split('\n'):  # not splitlines, which
+                    yield line + '\n'              # breaks on '\r' too
+
+            if not self._fill():                # end of data
+                if self.buf: yield self.buf
+                self.buf = ''
+                break
+
+    def readlines(self):
+        return list(self)
+
+    def close(self):
+        self.fd.close()
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excinfo):
+        self.close()
+
+        return False
+
+def _universalNewlines(chunks):
+    '''
+    Function: _universalNewlines
+    Input: chunks - iterable of text
+    Output: generator of the text with '\\r\\n' and '\\r' changed to '\\n'
+    Functionality: Does what 'rU' mode does for plain files, holding back a
+                   '\\r' at the end of a chunk in case the next starts with
+                   '\\n'
+    '''
+    carry = ''
+
+    for chunk in chunks:
+        if carry: chunk = carry + chunk
+
+        if chunk.endswith('\r'): chunk, carry = chunk[:-1], '\r'
+        else: carry = ''
+
+        if '\r' in chunk:
+            chunk = chunk.replace('\r\n', '\n').replace('\r', '\n')
+
+        if chunk: yield chunk
+
+    if carry: yield '\n'
+
+def _streamChunks(fd, newDecompressor, chunksize=DECOMPRESS_CHUNK_SIZE):
+    '''
+    Function: _streamChunks
+    Input:
+        fd - compressed file opened for binary read
+        newDecompressor - function returning a new decompressor object with
+                          decompress and unused_data, e.g., bz2.BZ2Decompressor
+        chunksize - compressed bytes to read at a time
+    Output: generator of decompressed data
+    Functionality: Stream-decompresses a file. A file of several concatenated
+                   members (as pigz, pbzip2 and cat make) is decompressed
+                   member after member: whatever follows the end of one is fed
+                   to a new decompressor.
+    '''
+    decomp = newDecompressor()
+
+    while True:
+        data = fd.read(chunksize)
+
+        if not data: break
+
+        while data:
+            try:
+                out = decomp.decompress(data)
+            except EOFError:            # bz2 member ended with the last chunk
+                decomp = newDecompressor()
+                out = decomp.decompress(data)
+
+            if out: yield out
+
+            # if a member ended in this data, start over on what's left
+            data = decomp.unused_data
+
+            if data: decomp = newDecompressor()
+
+    out = decomp.flush() if hasattr(decomp, 'flush') else ''
+
+    if out: yield out
+
+def _isBgzf(header):
+    '''
+    Function: _isBgzf
+    Input: header - first bytes of a gzip file
+    Output: True if the file is BGZF (block gzip, as bgzip makes): gzip members
+            of at most 64 KB whose extra field records their compressed size
+    Functionality: Tells whether the blocks can be found without decompressing
+    '''
+    if len(header) < BGZF_HEADER.size: return False
+
+    fields = BGZF_HEADER.unpack(header[:BGZF_HEADER.size])
+
+    return bool(fields[3] & 4) and fields[8:10] == (66, 67)  # FEXTRA and BC
+
+def _inflateBlock(block):
+    '''
+    Function: _inflateBlock
+    Input: block - one BGZF block
+    Output: the block's decompressed data
+    Functionality: Decompresses the raw deflate data between a block's header
+                   and its CRC and size. Run in a worker thread; zlib lets go
+                   of the GIL while it works.
+    '''
+    xlen = BGZF_HEADER.unpack(block[:BGZF_HEADER.size])[7]
+
+    return zlib.decompress(block[12 + xlen:-8], -zlib.MAX_WBITS)
+
+def _bgzfChunks(fd, numThreads=DECOMPRESS_THREADS,
+                                            blocksPerBatch=BGZF_BATCH_BLOCKS):
+    '''
+    Function: _bgzfChunks
+    Input:
+        fd - BGZF file opened for binary read
+        numThreads - number of blocks to decompress at once
+        blocksPerBatch - blocks to read before handing them to the threads
+    Output: generator of decompressed data, in order
+    Functionality: Splits a BGZF file into blocks from their headers and
+                   decompresses batches of blocks in a thread pool
+    '''
+    from multiprocessing.pool import ThreadPool
+
+    pool = ThreadPool(numThreads)
+
+    try:
+        while True:
+            blocks = []
+
+            for i in xrange(blocksPerBatch):
+                header = fd.read(BGZF_HEADER.size)
+
+                if not header: break
+
+                if not _isBgzf(header):
+                    raise IOError('bad BGZF block header in %s'%(fd.name))
+
+                bsize = BGZF_HEADER.unpack(header)[11] + 1
+                blocks.append(header + fd.read(bsize - BGZF_HEADER.size))
+
+            if not blocks: break
+
+            yield ''.join(pool.map(_inflateBlock, blocks))
+    finally:
+        pool.close()
+        pool.join()
+
+def _newZstdDecompressor():
+    '''
+    Function: _newZstdDecompressor
+    Input: none
+    Output: a zstandard decompressobj
+    Functionality: Imports the optional zstandard package only when a zstd
+                   file is read
+    '''
+    try:
+        import zstandard
+    except ImportError:
+        raise IOError('the zstandard package is needed to read zstd files')
+
+    return zstandard.ZstdDecompressor().decompressobj()
+
+def openr(filename, numThreads=DECOMPRESS_THREADS, universalNewlines=False):
+    '''
+    Function: openr
+    Input:
+        filename - absolute path of a file, compressed or not
+        numThreads - number of threads to decompress a BGZF file with
+        universalNewlines - if True, '\\r\\n' and '\\r' line endings are
+                            changed to '\\n', as open's 'rU' mode does.
+                            Default False: the text is read as open(filename)
+                            reads it, so offsets into it are unchanged.
+    Output: descriptor - file object to read filename's (decompressed) text
+                         from
+    Functionality: Opens a file for reading, telling gzip, bz2 and zstd files
+                   by their first bytes (not their suffixes) and decompressing
+                   them as they're read. BGZF files, a kind of gzip file split
+                   into independent blocks, are decompressed by several
+                   threads at once. The first bytes are peeked at through a
+                   buffer rather than read and sought back over, so pipes
+                   work too. Plain files are opened with open(filename), as
+                   read and readlines always did.
+    History:
+        10/19/26 - created
+    '''
+    fd = io.open(filename, 'rb')
+    magic = fd.peek(BGZF_HEADER.size)[:BGZF_HEADER.size]
+
+    if magic.startswith(GZIP_MAGIC):
+        if numThreads > 1 and _isBgzf(magic):
+            chunks = _bgzfChunks(fd, numThreads)
+        else:
+            chunks = _streamChunks(fd,
+                            lambda: zlib.decompressobj(16 + zlib.MAX_WBITS))
+    elif magic.startswith(BZ2_MAGIC):
+        chunks = _streamChunks(fd, bz2.BZ2Decompressor)
+    elif magic.startswith(ZSTD_MAGIC):
+        chunks = _streamChunks(fd, _newZstdDecompressor)
+    elif fd.seekable():                 # plain file
+        fd.close()
+
+        return open(filename, 'rU' if universalNewlines else 'r')
+    else:                               # plain pipe, which can't be reopened
+        chunks = iter(lambda: fd.read(DECOMPRESS_CHUNK_SIZE), '')
+
+    descriptor = DecompressedFile(fd, chunks, universalNewlines)
+
+    return descriptor
+
 def readlines(filename):
     '''
     Function: readlines
     Input: filename - absolute path of a file
     Output: lines - list of lines in the file
-    Functionality: Reads in a file into a list of lines
+    Functionality: Reads in a file into a list of lines. The file may be
+                   compressed.
+    History:
+        10/19/26 - modified to use openr
     '''
-    filedescriptor = open(filename)     # open file
+    filedescriptor = openr(filename)    # open file
     lines = filedescriptor.readlines()  # read in lines
     filedescriptor.close()              # close file
 
     return lines                        # return output
 
+def listdirCached(d):
+    '''
+    Function: listdirCached
+    Input: d - a directory
+    Output: fns - list of the names of the entries in d, as from os.listdir
+    Functionality: Lists a directory, but if it was already listed in this
+                   process and its modification time has not changed since, the
+                   earlier listing is reused instead of re-scanning the
+                   directory
+    Note: Adding or removing a file updates a directory's mtime, but on file
+          systems with coarse timestamps (e.g., FAT) a change made within the
+          same second or two as the earlier listing can be missed
+    History:
+        10/19/26 - created
+    '''
+    stamp = os.stat(d).st_mtime             # get dir's modification time
+
+    try:
+        cachedStamp, fns = _LISTDIR_CACHE[d]    # get previous listing
+
+        if cachedStamp != stamp:                # if dir changed since then
+            raise KeyError(d)                   # treat it like it's not there
+    except KeyError:
+        fns = os.listdir(d)                     # list the directory
+        _LISTDIR_CACHE[d] = (stamp, fns)        # and cache the listing
+
+    return list(fns)        # return copy so callers can't change the cache
+
+def readlinesCached(filename):
+    '''
+    Function: readlinesCached
+    Input: filename - absolute path of a file
+    Output: lines - list of lines in the file
+    Functionality: Same as readlines, but if the file was already read in this
+                   process and its size and modification time have not changed
+                   since, the earlier lines are reused instead of re-reading
+    History:
+        10/19/26 - created
+    '''
+    st = os.stat(filename)                  # get file's size and mtime
+    stamp = (st.st_size, st.st_mtime)
+
+    try:
+        cachedStamp, lines = _READLINES_CACHE[filename]  # get previous read
+
+        if cachedStamp != stamp:                # if file changed since then
+            raise KeyError(filename)            # treat it like it's not there
+    except KeyError:
+        lines = readlines(filename)             # read the file
+        _READLINES_CACHE[filename] = (stamp, lines) # and cache the lines
+
+    return list(lines)      # return copy so callers can't change the cache
+
 def read(filename):
     '''
     Function: read
     Input: filename - absolute path of a file
     Output: text - text of file
-    Functionality: Reads in a file in one line
+    Functionality: Reads in a file in one line. The file may be compressed.
     History:
         9/28/10 - created
+        10/19/26 - modified to use openr
     '''
-    filedescriptor = open(filename)     # open file
+    filedescriptor = openr(filename)    # open file
     text = filedescriptor.read()        # read in file
     filedescriptor.close()              # close file
 
     return text                         # return output
 
-def writelines(lines, filename):
+def writelines(lines, filename, nshards=0):
     '''
     Function: writelines
     Input:
         lines - a list of strings to be written to filenaem
         filename - absolute path of a file
+        nshards - if given, lines are dealt round-robin to this many shards,
+                  with a manifest, as writeShards does, instead of written to
+                  filename itself. Each line gets a '\\n' either way, but
+                  shards are written in binary so their md5s match the
+                  bytes on disk, while filename is written in text mode, so
+                  on Windows its lines end in '\\r\\n'
     Output: None
     Functionality: Writes a list of strings to a file, one per line
     History:
         9/28/10 - created
         9/29/10 - modified to use openw below instead of open
         12/30/10 - modified to use close below instead of method on file object
+        10/19/26 - added nshards input
     '''
+    if nshards:
+        _writeShards(lines, filename, nshards, None, _joinLines)
+        return
+
     filedescriptor = openw(filename)    # open file, creating path if necessary
 
     for line in lines:                      # for each line in input
@@ -221,6 +1062,194 @@ def writelines(lines, filename):
 
     return
 
+def _shardNames(outfn, nshards):
+    '''
+    Function: _shardNames
+    Input:
+        outfn - filename the shards stand in for, e.g., /data/out.txt
+        nshards - number of shards
+    Output: list of shard filenames, e.g., /data/out.000.txt, /data/out.001.txt
+    Functionality: Names the shards of a file
+    '''
+    root, ext = os.path.splitext(outfn)
+
+    return ['%s.%03d%s'%(root, i, ext) for i in range(nshards)]
+
+def _joinLines(lines):
+    '''
+    Function: _joinLines
+    Input: lines - list of strings
+    Output: the lines joined into one string as writelines writes them
+    Functionality: Serializes a batch of writelines' lines for _writeShards
+    '''
+    return ''.join([line + '\n' for line in lines])
+
+def _writeChunk(fd, md5, text):
+    '''
+    Function: _writeChunk
+    Input:
+        fd - a shard's file
+        md5 - the shard's running hashlib md5
+        text - serialized rows to append to the shard
+    Output: none
+    Functionality: Writes to a shard and updates its checksum. Run on one of
+                   _writeShards' threads; both calls let go of the GIL. fd is
+                   opened in binary, so the bytes hashed are the bytes written
+                   (no '\\r\\n' translation on Windows).
+    '''
+    fd.write(text)
+    md5.update(text)
+
+    return
+
+def writeShards(rows, outfn, nshards, key=None, colsep='\t', nullstr='',
+                    rowsPerWrite=ROWS_PER_WRITE, numThreads=SHARD_THREADS):
+    '''
+    Function: writeShards
+    Input:
+        rows - iterable of rows (sequences), which can be a generator too big
+               to hold
+        outfn - filename the shards stand in for. Shards are named by
+                _shardNames and the manifest is outfn + MANIFEST_SUFFIX
+        nshards - number of shards
+        key - index of the column whose value picks a row's shard, so rows
+              with the same key land in the same shard. If None, ranges of
+              rowsPerWrite rows are dealt to the shards round-robin.
+        colsep - column separator of the output
+        nullstr - what to write for None in the output
+        rowsPerWrite - rows serialized into each write
+        numThreads - most shard writes to run at once
+    Output: n - number of rows written
+    Functionality: Splits rows over nshards files so downstream readers can
+                   read them in parallel. Rows are serialized here and the
+                   writes run on a thread pool, one at a time per shard so
+                   each shard's rows stay in order. Then writes the manifest,
+                   a tab-separated file with a line per shard of its base
+                   name, number of rows and md5, for readManifest. Shards are
+                   written in binary, so lines end in '\\n' on every platform.
+                   A manifest from an earlier run is removed first, and if
+                   anything fails the partial shards are removed too, so a
+                   manifest is only ever next to the shards it describes.
+    NOTE: Keys are hashed with crc32 of their str, so a key's shard is the same
+          from run to run and machine to machine, and 5 and '5' land together.
+    '''
+    keyOf = None if key is None else operator.itemgetter(key)
+
+    return _writeShards(rows, outfn, nshards, keyOf,
+                        RowSerializer(colsep, nullstr).joinRows, rowsPerWrite,
+                        numThreads)
+
+def _writeShards(items, outfn, nshards, keyOf, join,
+                    rowsPerWrite=ROWS_PER_WRITE, numThreads=SHARD_THREADS):
+    '''
+    Function: _writeShards
+    Input:
+        items - iterable of rows or lines
+        outfn, nshards, rowsPerWrite, numThreads - as for writeShards
+        keyOf - function from an item to the value that picks its shard, or
+                None for round-robin
+        join - function that serializes a list of items into one string
+    Output: n - number of items written
+    Functionality: Does the work of writeShards and of writelines' nshards
+    '''
+    if not outfn:
+        raise ValueError('writeShards needs a filename to name shards after')
+
+    fns = _shardNames(outfn, nshards)
+    manifestfn = outfn + MANIFEST_SUFFIX
+    mkdir_p(os.path.dirname(outfn))
+
+    try:
+        os.remove(manifestfn)       # it describes an earlier run's shards
+    except OSError, exc:
+        if exc.errno != errno.ENOENT: raise
+
+    fds = []
+    md5s = [hashlib.md5() for fn in fns]
+    counts = [0]*nshards
+    buffers = [[] for fn in fns]
+    pending = [None]*nshards        # each shard's write in progress
+    pool = ThreadPool(min(nshards, numThreads))
+
+    def flush(i):
+        '''
+        hand shard i's buffered rows to the pool once its last write is done
+        '''
+        if pending[i]: pending[i].get()
+
+        text = join(buffers[i])
+        counts[i] += len(buffers[i])
+        buffers[i] = []
+        pending[i] = pool.apply_async(_writeChunk, (fds[i], md5s[i], text))
+
+    done = False
+
+    try:
+        for fn in fns: fds.append(open(fn, 'wb'))
+
+        if keyOf is None:                   # round-robin by ranges of rows
+            items = iter(items)
+
+            for i in itertools.cycle(range(nshards)):
+                buffers[i] = list(itertools.islice(items, rowsPerWrite))
+
+                if not buffers[i]:
+                    break
+
+                flush(i)
+        else:
+            for item in items:
+                i = (zlib.crc32(str(keyOf(item))) & 0xffffffff)%nshards
+                buf = buffers[i]
+                buf.append(item)
+
+                if len(buf) >= rowsPerWrite:
+                    flush(i)
+
+            for i in range(nshards):        # write what's left
+                if buffers[i]: flush(i)
+
+        for result in pending:
+            if result: result.get()         # raise any write's error
+
+        done = True
+    finally:
+        pool.close()
+        pool.join()
+
+        for fd in fds: fd.close()
+
+        if not done:                        # don't leave partial shards
+            for fn in fns[:len(fds)]:
+                try: os.remove(fn)
+                except OSError: pass
+
+    fd = openw(manifestfn)
+    print >> fd, '\t'.join(MANIFEST_HEADER)
+
+    for fn, count, md5 in zip(fns, counts, md5s):
+        print >> fd, '\t'.join([os.path.basename(fn), str(count),
+                                                            md5.hexdigest()])
+
+    close(fd)
+    logging.info('wrote %d rows to %d shards of %s'%(sum(counts), nshards,
+                                                                        outfn))
+
+    return sum(counts)
+
+def readManifest(manifestfn):
+    '''
+    Function: readManifest
+    Input: manifestfn - a manifest writeShards wrote
+    Output: shards - list of (filename, rows, md5) for each shard, in shard
+                     order. Filenames are in the manifest's directory.
+    Functionality: Gets the shards to read, e.g., one per worker process
+    '''
+    d = os.path.dirname(manifestfn)
+
+    return [(os.path.join(d, name), int(rows), md5) for name, rows, md5
+                                in iterRows(manifestfn, skipHeader=True)]
+
 def write(txt, filename):
     '''
     Function: write
@@ -9,9 +9,15 @@ Contents:
     CONTROL_CHARS_RE - reg ex string recognizing any control character XML is
                        found not to like in my work
     getFirstNum - function that returns the first int from a string
+    CONTROL_ENTITIES_RE - reg ex recognizing just the entity forms of the
+                          control chars in CONTROL_CHARS_RE
+    sanitize - function that removes control chars and their entities from a
+               string or buffer without a regex pass over every byte
+    sanitizeStream - function that sanitizes a file a chunk at a time
 History:
     4/7/11 - added CONTROL_CHARS_RE
     9/13/11 - added UNICODE_CONTROL_CHARS
+    10/19/26 - added CONTROL_ENTITIES_RE, sanitize and sanitizeStream
 '''
 import re
 
@@ -26,6 +32,19 @@ CONTROL_CHARS_RE = re.compile('\x01|(&#((1[29])|(20?)|(31));)')
 # with those
 UNICODE_CONTROL_CHARS = re.compile('[\x00-\x08\x0b-\x1f]')
 
+# the bytes UNICODE_CONTROL_CHARS matches (this includes the \x01 in
+# CONTROL_CHARS_RE), for deleting with str.translate, and the same as a table
+# for unicode.translate
+CONTROL_BYTES = ''.join(chr(i) for i in range(32) if chr(i) not in '\t\n')
+UNICODE_CONTROL_TABLE = dict.fromkeys(ord(c) for c in CONTROL_BYTES)
+
+# regex pattern recognizing the entities in CONTROL_CHARS_RE: &#12; &#19; &#2;
+# &#20; and &#31;
+CONTROL_ENTITIES_RE = re.compile('&#(?:1[29]|20?|31);')
+MAX_ENTITY_LEN = 5      # length of the longest entity it matches
+
+SANITIZE_CHUNK_SIZE = 1 << 20   # default bytes sanitizeStream reads at a time
+
 def getFirstNum(s):
     '''
     Function: getFirstNum
@@ -41,3 +60,87 @@ def getFirstNum(s):
         anwer = ''                  # set output to empty string
 
     return answer                   # return output
+
+def _removeEntities(s):
+    '''
+    Function: _removeEntities
+    Input: s - a string
+    Output: s without the entities CONTROL_ENTITIES_RE matches
+    Functionality: Skips the regex altogether when s has no entities at all
+    '''
+    if '&#' not in s: return s      # usual case, and much faster than re.sub
+
+    return CONTROL_ENTITIES_RE.sub('', s)
+
+def sanitize(s, deletechars=CONTROL_BYTES):
+    '''
+    Function: sanitize
+    Input:
+        s - a str, unicode, bytearray, buffer or memoryview
+        deletechars - single-byte chars to delete
+    Output: answer - s with the chars in deletechars and the entities in
+                     CONTROL_ENTITIES_RE removed, as a str (unicode if s is)
+    Functionality: Does what substituting UNICODE_CONTROL_CHARS and then
+                   CONTROL_CHARS_RE with '' does, but deletes the single-byte
+                   chars with a translate, which makes one copy in C instead
+                   of a regex pass, and only runs a regex for the entities
+                   when there are any
+    '''
+    if isinstance(s, unicode):
+        if deletechars is CONTROL_BYTES: table = UNICODE_CONTROL_TABLE
+        else: table = dict.fromkeys(ord(c) for c in deletechars)
+
+        answer = s.translate(table)
+    else:
+        if isinstance(s, memoryview): s = s.tobytes()
+        elif isinstance(s, buffer): s = str(s)
+
+        answer = str(s.translate(None, deletechars))
+
+    return _removeEntities(answer)
+
+def sanitizeStream(infd, outfd, chunksize=SANITIZE_CHUNK_SIZE,
+                                                    deletechars=CONTROL_BYTES):
+    '''
+    Function: sanitizeStream
+    Input:
+        infd - file opened for binary read
+        outfd - file opened for binary write
+        chunksize - bytes to read at a time
+        deletechars - single-byte chars to delete
+    Output: n - number of bytes written
+    Functionality: Writes what sanitize would return for infd's contents to
+                   outfd without ever holding more than a chunk. An entity
+                   split across two chunks is still removed: if one of the last
+                   few bytes of a chunk is an &, everything from it on is
+                   carried over to the front of the next chunk.
+    '''
+    carry = ''
+    n = 0
+
+    while True:
+        chunk = infd.read(chunksize)
+
+        if not chunk: break
+
+        data = carry + chunk.translate(None, deletechars)
+
+        # hold back a trailing & that could start an entity cut off by the
+        # end of the chunk
+        amp = data.rfind('&', max(0, len(data) - MAX_ENTITY_LEN + 1))
+
+        if amp == -1:
+            carry = ''
+        else:
+            carry = data[amp:]
+            data = data[:amp]
+
+        data = _removeEntities(data)
+        outfd.write(data)
+        n += len(data)
+
+    carry = _removeEntities(carry)          # whatever's left at the end
+    outfd.write(carry)
+    n += len(carry)
+
+    return n
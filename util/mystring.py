@@ -7,7 +7,27 @@ Functionality: Extends str so that join can handle sequences containing non-
 Contents:
     MyStr - class that extends str so that join can handle sequences containing
             non-strings
+    RowSerializer - class that turns rows of mixed types into delimited lines,
+                    one row, a batch of rows or a stream of rows at a time
+History:
+    10/19/26 - added RowSerializer
 '''
+import datetime, types, itertools
+
+# types whose str() is slow enough that it pays to format each distinct value
+# in a column once and look the rest up
+DEDUPE_TYPES = frozenset([datetime.datetime, datetime.date])
+
+# types whose equal values always format the same, so columns of only these can
+# have their distinct values formatted once. Not float (0.0 == -0.0) or Decimal
+# (Decimal('1') == Decimal('1.0')). Values are keyed by type too, since e.g.
+# 1 == 1.0 == True, and datetimes by tzinfo too, since aware datetimes in
+# different zones can be equal but format differently, and comparing a naive
+# one to an aware one raises TypeError
+DEDUPE_SAFE_TYPES = frozenset([types.NoneType, str, int, long, bool,
+                               datetime.datetime, datetime.date])
+
+ROWS_PER_WRITE = 10000  # rows RowSerializer.writeRows joins per write call
 
 class MyStr(str):
     '''
@@ -31,3 +51,205 @@ class MyStr(str):
 
         # convert each item in seq to a string and join with self and return
         return str.join(self, [str(v) for v in seq])
+
+class RowSerializer(object):
+    '''
+    Class: RowSerializer
+    Members:
+        sep - column separator
+        formatters - dict of type to function that formats a value of that type
+                     as a string. Types not in it are formatted with str(),
+                     which for old-style classes like MyDatetime calls their
+                     __str__.
+        formattedTypes - frozenset of the types in formatters
+        formatsDates - True if dates have a formatter, i.e., datefmt was given
+    Functionality: Serializes rows of mixed types to delimited lines, e.g., for
+                   TSV output. Gives the same strings MyStr(sep).join(row)
+                   would except for None, which is written as nullstr, and
+                   dates, which can be given a format.
+                   Rows are converted with C-level map(str, ...) without
+                   looking at each value's type first. None is the only other
+                   type formatted unless datefmt is given, and str(None) is
+                   'None', so only lines with 'None' in them are redone value
+                   by value. joinRows also has each distinct value of a date
+                   column (one whose first value is a date) formatted once and
+                   the rest looked up, since str() of a date is slow.
+    '''
+
+    def __init__(self, sep='\t', nullstr='', datefmt=None):
+        '''
+        Method: __init__
+        Input:
+            self - this RowSerializer
+            sep - column separator
+            nullstr - string to write for None
+            datefmt - strftime format for datetime.datetime and datetime.date
+                      values. If None they are written with str()
+        Output: self - a new RowSerializer
+        Functionality: constructor
+        '''
+        self.sep = sep
+
+        self.formatters = {types.NoneType: lambda v: nullstr}
+
+        if datefmt:
+            fmtDate = lambda v: v.strftime(datefmt)
+            self.formatters[datetime.datetime] = fmtDate
+            self.formatters[datetime.date] = fmtDate
+
+        self.formattedTypes = frozenset(self.formatters)
+        self.formatsDates = not DEDUPE_TYPES.isdisjoint(self.formattedTypes)
+
+        return
+
+    def format(self, v):
+        '''
+        Method: format
+        Input:
+            self - this RowSerializer
+            v - a value
+        Output: v as a string
+        Functionality: Formats v with the formatter for its type
+        '''
+        return self.formatters.get(type(v), str)(v)
+
+    def joinRow(self, row):
+        '''
+        Method: joinRow
+        Input:
+            self - this RowSerializer
+            row - sequence of values
+        Output: the values of row as strings joined by sep
+        Functionality: Serializes one row. It's converted with one
+                       map(str, row) and only redone value by value if that
+                       could have put a None in it, or it has dates to format.
+        '''
+        if self.formatsDates and not DEDUPE_TYPES.isdisjoint(map(type, row)):
+            return self.sep.join(map(self.format, row))
+
+        line = self.sep.join(map(str, row))
+
+        if 'None' in line:                  # maybe str(None), so redo it
+            line = self.sep.join(map(self.format, row))
+
+        return line
+
+    def formatColumn(self, col):
+        '''
+        Method: formatColumn
+        Input:
+            self - this RowSerializer
+            col - sequence of the values in one column of a batch of rows
+        Output: list of the values of col as strings
+        Functionality: Formats a column, picking the cheapest way from the set
+                       of types in it
+        '''
+        coltypes = set(map(type, col))
+
+        if coltypes == set([str]):                  # already strings
+            return col
+        elif self.formattedTypes.isdisjoint(coltypes) and \
+                                        DEDUPE_TYPES.isdisjoint(coltypes):
+            return map(str, col)                    # all format with str()
+        elif not coltypes <= DEDUPE_SAFE_TYPES:     # can't dedupe safely
+            return map(self.format, col)
+
+        # format each distinct (type, value) once, then look the rest up
+        n = len(col)
+        datetypes = coltypes - set([types.NoneType])
+
+        if datetime.datetime in datetypes:
+            tzinfos = map(getattr, col, ['tzinfo']*n, [None]*n)
+
+        if len(datetypes) == 1 and datetypes <= DEDUPE_TYPES and \
+                (datetime.date in datetypes or set(tzinfos) == set([None])):
+            keys = col          # one naive date type, so values key alone
+        elif datetime.datetime in coltypes:
+            # tzinfo before value, so values are only compared within a zone
+            keys = zip(map(type, col), tzinfos, col)
+        else:
+            keys = zip(map(type, col), col)
+
+        lookup = dict.fromkeys(keys)
+
+        for key in lookup:
+            lookup[key] = self.format(key if keys is col else key[-1])
+
+        return map(lookup.__getitem__, keys)
+
+    def joinRows(self, rows, linesep='\n'):
+        '''
+        Method: joinRows
+        Input:
+            self - this RowSerializer
+            rows - sequence of rows
+            linesep - line separator
+        Output: one string holding every row of rows, each ended by linesep
+        Functionality: Serializes a batch of rows into one buffer. If the
+                       first row has dates and the rows are all the same
+                       length, it's converted a column at a time: date
+                       columns, and columns with dates to format, go through
+                       formatColumn and the rest through one map(str, col).
+                       Otherwise it's converted a row at a time like joinRow.
+                       Either way, lines that could hold str(None) are redone
+                       with joinRow.
+        '''
+        if not rows:
+            return ''
+
+        if not DEDUPE_TYPES.isdisjoint(map(type, rows[0])) and \
+                                    len(set(map(len, rows))) == 1:
+            cols = zip(*rows)
+
+            for i, col in enumerate(cols):
+                if type(col[0]) in DEDUPE_TYPES or (self.formatsDates and
+                                not DEDUPE_TYPES.isdisjoint(map(type, col))):
+                    cols[i] = self.formatColumn(col)
+                else:
+                    cols[i] = map(str, col)
+
+            lines = map(self.sep.join, itertools.izip(*cols))
+        elif self.formatsDates:             # any row could have dates
+            lines = map(self.joinRow, rows)
+        else:
+            lines = map(self.sep.join,
+                        itertools.imap(map, itertools.repeat(str), rows))
+
+        lines.append('')            # so the last row gets a linesep too
+        buf = linesep.join(lines)
+
+        if 'None' in buf:                   # maybe str(None), so redo those
+            for i, line in enumerate(lines[:-1]):
+                if 'None' in line:
+                    lines[i] = self.joinRow(rows[i])
+
+            buf = linesep.join(lines)
+
+        return buf
+
+    def writeRows(self, rows, fd, linesep='\n', rowsPerWrite=ROWS_PER_WRITE):
+        '''
+        Method: writeRows
+        Input:
+            self - this RowSerializer
+            rows - iterable of rows, which can be a generator too big to hold
+            fd - file object to write to, e.g., from myos.openw
+            linesep - line separator
+            rowsPerWrite - number of rows to serialize into each write
+        Output: n - number of rows written
+        Functionality: Streams rows to fd a batch at a time, so large inputs
+                       are never held in memory whole
+        '''
+        rows = iter(rows)
+        n = 0
+
+        while True:
+            batch = list(itertools.islice(rows, rowsPerWrite))
+
+            if not batch:
+                break
+
+            fd.write(self.joinRows(batch, linesep))
+            n += len(batch)
+
+        return n
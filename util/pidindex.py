@@ -0,0 +1,303 @@
+'''
+File: pidindex.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Compact index of a cohort's patient IDs. IDs are kept as a
+               sorted array of machine ints rather than a set of strings, which
+               takes a fraction of the memory with millions of IDs, and can be
+               saved to disk and memory-mapped back in by later runs.
+Contents:
+    PtntIdIndex - class holding a sorted, duplicate-free sequence of patient
+                  IDs with membership, intersection and union
+    readPtntIdIndex - function that builds a PtntIdIndex from a file with a
+                      patient ID on each line
+    savePtntIdIndex - function that writes a PtntIdIndex to disk
+    loadPtntIdIndex - function that reads (or memory-maps) a saved PtntIdIndex
+NOTE: IDs are ints, so an index can't keep '00123' apart from '123' the way a
+      set of strings does. IDs with leading zeros are rejected rather than
+      merged. onetime/num_rpts_ptnts_w_reports.getPtntIdFilter and batch.py
+      fall back to a set of strings for a cohort that has them, or has IDs
+      bigger than MAX_ID (2**31 - 1 where the widest array int is 4 bytes,
+      e.g., python 2 on Windows).
+'''
+import array, bisect, heapq, itertools, mmap, os, struct, logging
+
+def _intTypecode():
+    '''
+    Function: _intTypecode
+    Input: none
+    Output: typecode of the widest int array available, 8 bytes if possible
+    Functionality: 'l' is 8 bytes on 64-bit linux but 4 on Windows, and python
+                   2's array has no 'q'
+    '''
+    for typecode in ('q', 'l'):
+        try:
+            if array.array(typecode).itemsize == 8: return typecode
+        except ValueError:              # no 'q' in python 2
+            pass
+
+    return 'l'
+
+TYPECODE = _intTypecode()   # array typecode for patient IDs
+MAX_ID = 2**(8*array.array(TYPECODE).itemsize - 1) - 1     # biggest it holds
+MAGIC = 'PIDX'          # first bytes of a saved index
+
+# saved index header: MAGIC, item size in bytes, number of IDs
+HEADER = struct.Struct('<4sBQ')
+
+# struct format for reading a single ID of a given size from a saved index
+ITEM_FORMATS = {4: '<i', 8: '<q'}
+
+def toPtntId(pid):
+    '''
+    Function: toPtntId
+    Input: pid - a patient ID as an int or a string of an int
+    Output: the ID as an int
+    Functionality: Converts an ID for an index, raising ValueError if it's not
+                   all digits, has leading zeros (which the int would lose) or
+                   is bigger than MAX_ID
+    '''
+    if not isinstance(pid, (int, long)):
+        s = pid.strip()
+
+        if not s.isdigit():
+            raise ValueError('%r is not a patient ID'%(pid))
+
+        if len(s) > 1 and s[0] == '0':
+            raise ValueError('patient ID %r has leading zeros, which an index '
+                                    'would lose'%(pid))
+
+        pid = int(s)
+
+    if not 0 <= pid <= MAX_ID:
+        raise ValueError('patient ID %r is out of range for a %d-byte index'%(
+                                    pid, array.array(TYPECODE).itemsize))
+
+    return pid
+
+class MappedIds(object):
+    '''
+    Class: MappedIds
+    Members:
+        mm - memory map of a saved index
+        itemstruct - struct.Struct for one ID
+        n - number of IDs
+    Functionality: Read-only sequence over the IDs in a memory-mapped saved
+                   index, so that bisect can search it without reading it in
+    '''
+
+    def __init__(self, mm, itemsize, n):
+        self.mm = mm
+        self.itemstruct = struct.Struct(ITEM_FORMATS[itemsize])
+        self.n = n
+
+        return
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if i < 0: i += self.n                   # allow negative indexes
+
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+
+        size = self.itemstruct.size
+        return self.itemstruct.unpack_from(self.mm, HEADER.size + i*size)[0]
+
+    def __iter__(self):
+        size = self.itemstruct.size
+        chunk = 65536                           # IDs to unpack at a time
+
+        for start in xrange(0, self.n, chunk):  # read the map chunk by chunk
+            stop = min(start + chunk, self.n)
+            ids = array.array(TYPECODE)
+
+            # take the slow path if the array's ints aren't the saved size
+            if ids.itemsize != size:
+                for i in xrange(start, stop): yield self[i]
+                continue
+
+            ids.fromstring(self.mm[HEADER.size + start*size:
+                                   HEADER.size + stop*size])
+
+            for pid in ids: yield pid
+
+class PtntIdIndex(object):
+    '''
+    Class: PtntIdIndex
+    Members:
+        ids - sorted sequence of distinct int patient IDs. An array.array when
+              built in memory or a MappedIds when memory-mapped
+    Functionality: Holds a cohort's patient IDs compactly. Supports in (with
+                   int IDs or strings of ints, so it can stand in for the sets
+                   getPtntIdSet returns), len, iteration in ID order,
+                   intersection and union.
+    '''
+
+    def __init__(self, ids=(), presorted=False):
+        '''
+        Method: __init__
+        Input:
+            self - this PtntIdIndex
+            ids - iterable of patient IDs as ints or strings of ints, as
+                  toPtntId takes
+            presorted - True if ids is already a sorted, duplicate-free
+                        sequence to be used as is (e.g., a MappedIds)
+        Output: self - a new PtntIdIndex
+        Functionality: constructor
+        '''
+        if presorted:
+            self.ids = ids
+        else:
+            self.ids = array.array(TYPECODE, sorted(set(toPtntId(pid)
+                                                            for pid in ids)))
+
+        return
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, pid):
+        '''
+        Method: __contains__
+        Input:
+            self - this PtntIdIndex
+            pid - a patient ID as an int or a string of an int
+        Output: answer - True if pid is in the index
+        Functionality: Binary search for pid. '00123' isn't in an index with
+                       123, as it wouldn't be in a set with '123'.
+        '''
+        try: pid = toPtntId(pid)        # convert strings of ints
+        except ValueError: return False # something not an ID can't be here
+
+        i = bisect.bisect_left(self.ids, pid)
+        answer = i < len(self.ids) and self.ids[i] == pid
+
+        return answer
+
+    def intersection(self, other):
+        '''
+        Method: intersection
+        Input:
+            self - this PtntIdIndex
+            other - another PtntIdIndex
+        Output: a new PtntIdIndex of the IDs in both
+        Functionality: Walks the smaller index and binary searches the larger
+        '''
+        small, large = sorted([self, other], key=len)
+
+        return PtntIdIndex(array.array(TYPECODE,
+                            (pid for pid in small if pid in large)), True)
+
+    def union(self, other):
+        '''
+        Method: union
+        Input:
+            self - this PtntIdIndex
+            other - another PtntIdIndex
+        Output: a new PtntIdIndex of the IDs in either
+        Functionality: Merges the two sorted ID sequences, dropping duplicates
+        '''
+        merged = heapq.merge(self.ids, other.ids)
+
+        return PtntIdIndex(array.array(TYPECODE,
+                            (pid for pid, _ in itertools.groupby(merged))), True)
+
+    __and__ = intersection
+    __or__ = union
+
+def readPtntIdIndex(fn):
+    '''
+    Function: readPtntIdIndex
+    Input: fn - name of a file with one patient ID per line
+    Output: a PtntIdIndex of the IDs in fn. Blank lines are skipped, and so
+            are lines that aren't numbers (e.g., a header), with a warning.
+    Functionality: Builds a PtntIdIndex from a file, as getPtntIdSet builds a
+                   set. Raises ValueError if an ID has leading zeros or is too
+                   big, since the index can't hold it as getPtntIdSet would.
+    '''
+    ids = []
+    fd = open(fn)
+
+    try:
+        for lineno, line in enumerate(fd, 1):
+            if not line.strip(): continue       # skip blank lines
+
+            try:
+                ids.append(toPtntId(line))
+            except ValueError as myerr:
+                if line.strip().isdigit():      # an ID we can't hold
+                    raise ValueError('%s line %d: %s'%(fn, lineno, myerr))
+
+                logging.warning('skipping line %d of %s: %s'%(lineno, fn,
+                                                                str(myerr)))
+    finally:
+        fd.close()
+
+    return PtntIdIndex(ids)
+
+def savePtntIdIndex(index, fn):
+    '''
+    Function: savePtntIdIndex
+    Input:
+        index - a PtntIdIndex
+        fn - name of file to save it to
+    Output: none
+    Functionality: Writes a header and then the IDs as little-endian ints
+    '''
+    ids = index.ids
+
+    if not isinstance(ids, array.array):    # e.g., a MappedIds
+        ids = array.array(TYPECODE, ids)
+
+    fd = open(fn, 'wb')
+
+    try:
+        fd.write(HEADER.pack(MAGIC, ids.itemsize, len(ids)))
+
+        if struct.pack('=i', 1) != struct.pack('<i', 1):   # big-endian box
+            ids = array.array(TYPECODE, ids)
+            ids.byteswap()
+
+        ids.tofile(fd)
+    finally:
+        fd.close()
+
+    return
+
+def loadPtntIdIndex(fn, usemmap=True):
+    '''
+    Function: loadPtntIdIndex
+    Input:
+        fn - name of a file written by savePtntIdIndex
+        usemmap - if True the file is memory-mapped rather than read in, so
+                  lookups only touch the pages they need and several processes
+                  loading the same index share its memory
+    Output: index - the PtntIdIndex saved in fn
+    Functionality: Loads a saved PtntIdIndex
+    '''
+    fd = open(fn, 'rb')
+
+    try:
+        magic, itemsize, n = HEADER.unpack(fd.read(HEADER.size))
+
+        if magic != MAGIC:
+            raise ValueError('%s is not a saved PtntIdIndex'%(fn))
+
+        if usemmap and n:           # can't map an empty index
+            mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            index = PtntIdIndex(MappedIds(mm, itemsize, n), True)
+        else:
+            unpacker = struct.Struct('<%d%s'%(n, ITEM_FORMATS[itemsize][1]))
+            ids = array.array(TYPECODE, unpacker.unpack(fd.read(unpacker.size)))
+            index = PtntIdIndex(ids, True)
+    finally:
+        fd.close()
+
+    logging.debug('loaded %d patient IDs from %s'%(n, fn))
+
+    return index
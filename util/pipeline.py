@@ -0,0 +1,180 @@
+'''
+File: pipeline.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Runs a per-file transformation (strip control characters,
+               tokenize, etc.) over a directory tree of text files in a pool of
+               processes, writing a parallel tree of output files. Output
+               directories are made once each up front, outputs newer than
+               their inputs are skipped, and files are handed to workers in
+               chunks so many small files keep every core busy.
+Contents:
+    mapDir - function that maps a per-file function over a directory tree
+    PipelineStats - class recording how many files a run did and how fast
+'''
+import os, time, fnmatch, logging
+import multiprocessing
+from org.ghri.shalgrim.util import myos
+
+CHUNKS_PER_WORKER = 4   # default number of chunks each worker gets
+
+class PipelineStats(object):
+    '''
+    Class: PipelineStats
+    Members:
+        numFiles - number of files transformed
+        numSkipped - number of files skipped because their outputs were newer
+        numFailed - number of files whose transformation raised an exception
+        numBytes - total size of the input files transformed
+        seconds - wall clock time of the run
+    Functionality: Records the size and speed of a run
+    '''
+
+    def __init__(self, numFiles, numSkipped, numFailed, numBytes, seconds):
+        self.numFiles = numFiles
+        self.numSkipped = numSkipped
+        self.numFailed = numFailed
+        self.numBytes = numBytes
+        self.seconds = seconds
+
+        return
+
+    def filesPerSec(self):
+        '''
+        Method: filesPerSec
+        Input: self - this PipelineStats
+        Output: throughput of the run in files per second
+        Functionality: accessor
+        '''
+        return self.numFiles/self.seconds if self.seconds else float('inf')
+
+    def mbPerSec(self):
+        '''
+        Method: mbPerSec
+        Input: self - this PipelineStats
+        Output: throughput of the run in megabytes of input per second
+        Functionality: accessor
+        '''
+        mb = self.numBytes/float(1 << 20)
+
+        return mb/self.seconds if self.seconds else float('inf')
+
+    def __str__(self):
+        return ('%d files (%d skipped, %d failed) in %.2f s (%.0f files/sec, '
+                '%.1f MB/sec)')%(self.numFiles, self.numSkipped,
+                                 self.numFailed, self.seconds,
+                                 self.filesPerSec(), self.mbPerSec())
+
+def _runOne(task):
+    '''
+    Function: _runOne
+    Input: task - (func, infn, outfn)
+    Output: (infn, size, error) - size is infn's size in bytes and error is ''
+                                  or the message of the exception func raised
+    Functionality: Runs func on one file. Run in a worker process.
+    '''
+    func, infn, outfn = task
+
+    try:
+        func(infn, outfn)
+    except Exception as myerr:
+        return (infn, 0, '%s: %s'%(type(myerr).__name__, str(myerr)))
+
+    return (infn, os.path.getsize(infn), '')
+
+def _isUpToDate(infn, outfn):
+    '''
+    Function: _isUpToDate
+    Input:
+        infn - an input file
+        outfn - its output file
+    Output: answer - True if outfn exists and is at least as new as infn
+    Functionality: Tells whether a file can be skipped
+    '''
+    try:
+        answer = os.path.getmtime(outfn) >= os.path.getmtime(infn)
+    except OSError:                 # outfn not there
+        answer = False
+
+    return answer
+
+def mapDir(func, indir, outdir, pattern='*', rename=None, force=False,
+                                            processes=None, chunksize=None):
+    '''
+    Function: mapDir
+    Input:
+        func - function taking an input filename and an output filename that
+               transforms the one into the other, e.g., one that reads the
+               input, runs it through myre and writeTokenizedLines. Must be
+               module-level so the workers can unpickle it
+        indir - top of the directory tree of input files
+        outdir - top of the tree to write output files to. It mirrors indir
+        pattern - fnmatch pattern input filenames must match
+        rename - function from an input file's base name to its output file's
+                 base name, e.g., to change the suffix. Same name if None
+        force - if True, transform files even if their outputs are newer
+        processes - number of worker processes. Defaults to number of cores
+        chunksize - files handed to a worker at a time. Defaults to enough to
+                    give each worker CHUNKS_PER_WORKER chunks, which cuts
+                    the per-file messaging that leaves cores idle when files
+                    are small
+    Output: stats - PipelineStats for the run
+    Functionality: Maps func over every file in indir matching pattern in a
+                   process pool. Output directories are made once each before
+                   any work is handed out, rather than by every worker for
+                   every file. A failing file is logged and doesn't stop the
+                   others.
+    '''
+    start = time.time()
+    tasks = []
+    numSkipped = 0
+
+    for d, subdirs, fns in os.walk(indir):
+        subdirs.sort()                          # walk in a stable order
+        outsub = os.path.join(outdir, os.path.relpath(d, indir))
+        madeDir = False
+
+        for fn in sorted(fnmatch.filter(fns, pattern)):
+            infn = os.path.join(d, fn)
+            outfn = os.path.join(outsub, rename(fn) if rename else fn)
+
+            if not force and _isUpToDate(infn, outfn):
+                numSkipped += 1
+                continue
+
+            if not madeDir:                     # make each out dir once
+                myos.mkdir_p(outsub)
+                madeDir = True
+
+            tasks.append((func, infn, outfn))
+
+    processes = processes or multiprocessing.cpu_count()
+
+    if not chunksize:
+        chunksize = max(1, len(tasks)/(processes*CHUNKS_PER_WORKER))
+
+    logging.info('transforming %d files from %s in %d processes, %d files '
+                        'per chunk'%(len(tasks), indir, processes, chunksize))
+    numBytes = 0
+    numFailed = 0
+
+    if tasks:
+        pool = multiprocessing.Pool(processes)
+
+        try:
+            for infn, size, error in pool.imap_unordered(_runOne, tasks,
+                                                                    chunksize):
+                if error:
+                    logging.error('%s failed: %s'%(infn, error))
+                    numFailed += 1
+                else:
+                    numBytes += size
+        finally:
+            pool.close()
+            pool.join()
+
+    stats = PipelineStats(len(tasks) - numFailed, numSkipped, numFailed,
+                                                numBytes, time.time() - start)
+    logging.info('transformed %s'%(stats))
+
+    return stats
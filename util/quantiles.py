@@ -0,0 +1,283 @@
+'''
+File: quantiles.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Approximate quantiles of a stream of values in bounded memory,
+               for when there are too many values (e.g., report counts from
+               tens of millions of files) to hold them all and sort them the
+               way getQuartileVals does. Sketches can be built per shard or per
+               process and merged.
+Contents:
+    KllSketch - class implementing the KLL quantile sketch
+    mergeSketches - function that merges sketches into a new one
+NOTE: KLL (Karnin, Lang and Liberty, "Optimal Quantile Approximation in
+      Streams", 2016) keeps a stack of compactors. When a level fills up it is
+      sorted and every other item, starting at a random one of the first two,
+      moves up a level with twice the weight. Level capacities shrink by a
+      factor of 2/3 going down from the top, so the sketch holds about 3k
+      items no matter how many values it's seen.
+NOTE: Error is in rank, not value: the value a sketch gives for quantile q has
+      a rank in the data within about eps*n of q*n, where eps is about 1.65% at
+      the default k=200 (the figure Apache DataSketches documents for 99%
+      confidence) and shrinks in proportion to 1/k. Until the first compaction,
+      i.e., for fewer than about k values, the sketch is exact.
+      tests/test_quantiles.py checks it against exact quantiles and bench.py
+      quantiles measures it.
+'''
+import math, random, itertools
+
+K = 200                 # default size parameter
+C = 2.0/3.0             # ratio of a level's capacity to the one above it
+MIN_CAPACITY = 2        # smallest any level gets
+
+class KllSketch(object):
+    '''
+    Class: KllSketch
+    Members:
+        k - size parameter. Larger is more accurate and takes more memory
+        compactors - list of lists of items. An item at level h stands for 2**h
+                     values
+        n - number of values seen
+        size - number of items held
+        maxSize - number of items that triggers a compaction
+        rand - random.Random used to pick which items move up
+    Functionality: Mergeable quantile sketch. Values can be anything that
+                   sorts, but are usually ints or floats.
+    '''
+
+    def __init__(self, k=K, seed=None):
+        '''
+        Method: __init__
+        Input:
+            self - this KllSketch
+            k - size parameter
+            seed - seed for the random choices, for repeatable sketches
+        Output: self - a new, empty KllSketch
+        Functionality: constructor
+        '''
+        self.k = k
+        self.compactors = []
+        self.n = 0
+        self.size = 0
+        self.maxSize = 0
+        self.rand = random.Random(seed)
+        self._grow()
+
+        return
+
+    def __len__(self):
+        return self.n
+
+    def _capacity(self, h):
+        '''
+        Method: _capacity
+        Input:
+            self - this KllSketch
+            h - a level
+        Output: number of items level h holds before it's compacted
+        Functionality: Capacities are k at the top level and shrink by C for
+                       each level down
+        '''
+        depth = len(self.compactors) - h - 1
+
+        return max(int(math.ceil(self.k*C**depth)), MIN_CAPACITY)
+
+    def _grow(self):
+        '''
+        Method: _grow
+        Input: self - this KllSketch
+        Output: none
+        Functionality: Adds a level on top
+        '''
+        self.compactors.append([])
+        self.maxSize = sum(self._capacity(h)
+                                    for h in range(len(self.compactors)))
+
+        return
+
+    def _compact(self, h):
+        '''
+        Method: _compact
+        Input:
+            self - this KllSketch
+            h - a level that's full
+        Output: none
+        Functionality: Sorts level h and moves every other item up a level. If
+                       the level has an odd number of items the largest stays.
+        '''
+        if h + 1 == len(self.compactors): self._grow()
+
+        items = self.compactors[h]
+        items.sort()
+        keep = [items.pop()] if len(items)%2 else []
+        self.compactors[h + 1].extend(items[self.rand.randint(0, 1)::2])
+        self.compactors[h] = keep
+
+        return
+
+    def _compress(self):
+        '''
+        Method: _compress
+        Input: self - this KllSketch
+        Output: none
+        Functionality: Compacts full levels, lowest first, until the sketch
+                       is back under maxSize
+        '''
+        for h in itertools.count():
+            if self.size < self.maxSize or h == len(self.compactors): break
+
+            if len(self.compactors[h]) >= self._capacity(h):
+                self._compact(h)
+                self.size = sum(len(items) for items in self.compactors)
+
+        return
+
+    def update(self, value):
+        '''
+        Method: update
+        Input:
+            self - this KllSketch
+            value - a value from the stream
+        Output: none
+        Functionality: Adds a value
+        '''
+        self.compactors[0].append(value)
+        self.size += 1
+        self.n += 1
+
+        if self.size >= self.maxSize: self._compress()
+
+        return
+
+    def updateMany(self, values):
+        '''
+        Method: updateMany
+        Input:
+            self - this KllSketch
+            values - iterable of values
+        Output: none
+        Functionality: Adds each value
+        '''
+        for value in values: self.update(value)
+
+        return
+
+    def merge(self, other):
+        '''
+        Method: merge
+        Input:
+            self - this KllSketch
+            other - another KllSketch, e.g., from another shard or process
+        Output: none
+        Functionality: Adds other's values to this sketch. Other is unchanged.
+        '''
+        while len(self.compactors) < len(other.compactors): self._grow()
+
+        for h, items in enumerate(other.compactors):
+            self.compactors[h].extend(items)
+
+        self.n += other.n
+        self.size = sum(len(items) for items in self.compactors)
+
+        while self.size >= self.maxSize:
+            self._compress()
+
+        return
+
+    def isExact(self):
+        '''
+        Method: isExact
+        Input: self - this KllSketch
+        Output: True if nothing has been compacted, so answers are exact
+        Functionality: accessor
+        '''
+        return self.size == self.n
+
+    def _weighted(self):
+        '''
+        Method: _weighted
+        Input: self - this KllSketch
+        Output: list of (value, weight) sorted by value
+        Functionality: Gets the items with the number of values each stands for
+        '''
+        return sorted((value, 2**h) for h, items in enumerate(self.compactors)
+                                                        for value in items)
+
+    def kth(self, k):
+        '''
+        Method: kth
+        Input:
+            self - this KllSketch
+            k - an index into the sorted values, 0 to n-1
+        Output: approximately the value at index k of the sorted values.
+                Exact if isExact.
+        Functionality: Approximate order statistic
+        '''
+        if not 0 <= k < self.n:
+            raise IndexError(k)
+
+        seen = 0
+
+        for value, weight in self._weighted():
+            seen += weight
+
+            if k < seen: return value
+
+        return value            # compaction rounding left seen short of n
+
+    def quantile(self, q):
+        '''
+        Method: quantile
+        Input:
+            self - this KllSketch
+            q - a fraction from 0 to 1
+        Output: value whose rank is about q*n
+        Functionality: Approximate quantile
+        '''
+        return self.kth(min(int(q*self.n), self.n - 1))
+
+    def rank(self, value):
+        '''
+        Method: rank
+        Input:
+            self - this KllSketch
+            value - a value
+        Output: approximate number of values seen less than value
+        Functionality: Approximate rank
+        '''
+        return sum(weight for v, weight in self._weighted() if v < value)
+
+    def getQuartileVals(self):
+        '''
+        Method: getQuartileVals
+        Input: self - this KllSketch
+        Output: (q1, med, q3) - by the index rules getQuartileVals in
+                                median_iqr_rpts_per_ptnt uses. Exact if isExact.
+        Functionality: Approximate quartile values
+        '''
+        n = self.n
+        medind = n/2
+
+        if n%2 == 0:
+            med = (self.kth(medind) + self.kth(medind - 1))/2.0
+        else:
+            med = self.kth(medind)
+
+        return (self.kth(int(n*0.25) + 1), med, self.kth(int(n*0.75)))
+
+def mergeSketches(sketches, k=K, seed=None):
+    '''
+    Function: mergeSketches
+    Input:
+        sketches - iterable of KllSketches, e.g., one per shard
+        k - size parameter of the merged sketch
+        seed - seed for the merged sketch's random choices
+    Output: merged - a new KllSketch of all the sketches' values
+    Functionality: Merges sketches without changing them
+    '''
+    merged = KllSketch(k, seed)
+
+    for sketch in sketches:
+        merged.merge(sketch)
+
+    return merged
@@ -0,0 +1,314 @@
+'''
+File: rptstats.py
+Author: Scott Halgrim, halgrim.s@ghc.org
+Date: 10/19/26
+Functionality: Keeps per-patient report counts for a directory of reports
+               whose filenames encode the patient ID, and updates them from
+               only the files added or removed since the last run instead of
+               recounting the whole directory.
+Contents:
+    RptCountSnapshot - class holding a directory's filenames, per-patient
+                       report counts and a histogram of those counts
+    loadRptCountSnapshot - function that loads a saved snapshot, or starts a
+                           new one if there isn't one
+    getQuartileValsFromHist - function that gets q1, median and q3 from a
+                              histogram of report counts
+    mergeHists - function that adds histograms of report counts together
+'''
+import os, time, logging, cPickle
+from org.ghri.shalgrim.util import myos, myre
+
+# seconds before a listing (or read) that a directory's (or PID file's) mtime
+# must be to show nothing changed since. Coarse-mtime filesystems and SMB
+# shares can give a file added just after a listing the same mtime the
+# directory had before it
+STAMP_SLACK = 2
+
+class RptCountSnapshot(object):
+    '''
+    Class: RptCountSnapshot
+    Members:
+        adir - directory of reports
+        pidfn - file listing the cohort's patient IDs. If '', every patient
+                with a report in adir is in the cohort
+        pidre - compiled regex whose first match in a filename is its patient ID
+        dirStamp - mtime of adir when last updated
+        listTime - time adir was last listed
+        pidStamp - (size, mtime) of pidfn when counts were built
+        pidTime - time pidfn was read
+        fns - set of filenames in adir when last updated
+        counts - dict of patient ID (string) to number of reports
+        hist - dict of number of reports to number of patients with that many
+        numReports - total reports belonging to cohort patients
+    Functionality: Holds report counts like those getNumReports, getNumPtnts
+                   and getRptNamesByPID compute, and brings them up to date by
+                   applying just the difference between the directory now and
+                   when last updated
+    '''
+
+    def __init__(self, adir, pidfn='', pidre=myre.NUMRE):
+        '''
+        Method: __init__
+        Input:
+            self - this RptCountSnapshot
+            adir - directory of reports
+            pidfn - file listing the cohort's patient IDs, or '' for everyone
+            pidre - compiled regex that finds the patient ID in a filename
+        Output: self - a new, empty RptCountSnapshot. Call update to fill it
+        Functionality: constructor
+        '''
+        self.adir = adir
+        self.pidfn = pidfn
+        self.pidre = pidre
+        self.dirStamp = None
+        self.listTime = None
+        self.pidStamp = None
+        self.pidTime = None
+        self.fns = set()
+        self.counts = {}
+        self.hist = {}
+        self.numReports = 0
+
+        return
+
+    def _reset(self):
+        '''
+        Method: _reset
+        Input: self - this RptCountSnapshot
+        Output: none
+        Functionality: Empties the counts and starts every cohort patient at
+                       zero reports
+        '''
+        self.dirStamp = None
+        self.listTime = None
+        self.fns = set()
+        self.numReports = 0
+
+        if self.pidfn:
+            self.pidTime = time.time()
+            st = os.stat(self.pidfn)
+            self.pidStamp = (st.st_size, st.st_mtime)
+            pids = set(line.strip() for line in myos.readlines(self.pidfn))
+            pids.discard('')
+            self.counts = dict.fromkeys(pids, 0)
+            self.hist = {0: len(pids)} if pids else {}
+        else:
+            self.pidStamp = None
+            self.pidTime = None
+            self.counts = {}
+            self.hist = {}
+
+        return
+
+    def _move(self, pid, delta):
+        '''
+        Method: _move
+        Input:
+            self - this RptCountSnapshot
+            pid - patient ID of a report added or removed
+            delta - 1 if added, -1 if removed
+        Output: none
+        Functionality: Moves pid's count and the histogram by delta
+        '''
+        try:
+            old = self.counts[pid]
+        except KeyError:
+            if self.pidfn: return       # not in cohort, so doesn't count
+            old = 0                     # new patient when cohort is everyone
+        else:
+            self.hist[old] -= 1
+
+            if not self.hist[old]: del self.hist[old]
+
+        new = old + delta
+        self.numReports += delta
+
+        # when cohort is everyone, patients with no reports drop out
+        if new or self.pidfn:
+            self.counts[pid] = new
+            self.hist[new] = self.hist.get(new, 0) + 1
+        else:
+            del self.counts[pid]
+
+        return
+
+    def update(self):
+        '''
+        Method: update
+        Input: self - this RptCountSnapshot
+        Output: (numAdded, numRemoved) - the number of filenames applied
+        Functionality: Brings the counts up to date. If neither adir nor pidfn
+                       changed since last time this returns without listing
+                       the directory. If pidfn changed, the counts are rebuilt.
+                       Otherwise adir is listed and only the filenames added
+                       or removed since last time are looked at. adir's and
+                       pidfn's mtimes are only trusted to be unchanged if
+                       they're more than STAMP_SLACK seconds older than the
+                       last listing or reading, so a change in the same mtime
+                       tick as that isn't missed.
+        '''
+        if self.pidfn:                          # rebuild on cohort change
+            st = os.stat(self.pidfn)
+
+            if (st.st_size, st.st_mtime) != self.pidStamp or \
+                        self.pidTime is None or \
+                        st.st_mtime >= self.pidTime - STAMP_SLACK:
+                logging.info('%s may have changed, recounting %s'%(self.pidfn,
+                                                                    self.adir))
+                self._reset()
+
+        dirStamp = os.stat(self.adir).st_mtime
+
+        # snapshots saved before listTime was kept have none, so relist.
+        # Same for pidTime above
+        if dirStamp == self.dirStamp and self.listTime is not None and \
+                                dirStamp < self.listTime - STAMP_SLACK:
+            return (0, 0)                       # nothing added or removed
+
+        listTime = time.time()
+        fns = set(os.listdir(self.adir))
+        added = fns - self.fns
+        removed = self.fns - fns
+
+        for fn in removed:
+            self._move(self.pidre.search(fn).group(), -1)
+
+        for fn in added:
+            self._move(self.pidre.search(fn).group(), 1)
+
+        self.fns = fns
+        self.dirStamp = dirStamp
+        self.listTime = listTime
+        logging.debug('%s: %d added, %d removed'%(self.adir, len(added),
+                                                                len(removed)))
+
+        return (len(added), len(removed))
+
+    def getNumPtnts(self):
+        '''
+        Method: getNumPtnts
+        Input: self - this RptCountSnapshot
+        Output: number of cohort patients with at least one report
+        Functionality: accessor
+        '''
+        return len(self.counts) - self.hist.get(0, 0)
+
+    def getHist(self, includeZeroRptPtnts=True):
+        '''
+        Method: getHist
+        Input:
+            self - this RptCountSnapshot
+            includeZeroRptPtnts - if False, patients without reports are left
+                                  out
+        Output: hist - copy of dict of number of reports to number of patients
+        Functionality: accessor
+        '''
+        hist = dict(self.hist)
+
+        if not includeZeroRptPtnts:
+            hist.pop(0, None)
+
+        return hist
+
+    def save(self, fn):
+        '''
+        Method: save
+        Input:
+            self - this RptCountSnapshot
+            fn - file to save to
+        Output: none
+        Functionality: Pickles this snapshot to fn, writing to a temporary file
+                       first so an interrupted save doesn't lose the old one
+        '''
+        tmpfn = fn + '.tmp'
+        myos.mkdir_p(os.path.dirname(fn))      # create path if necessary
+        fd = open(tmpfn, 'wb')
+        state = dict(self.__dict__, pidre=self.pidre.pattern)
+        cPickle.dump(state, fd, cPickle.HIGHEST_PROTOCOL)
+        fd.close()
+
+        if os.path.exists(fn): os.remove(fn)    # windows won't rename over it
+        os.rename(tmpfn, fn)
+
+        return
+
+def loadRptCountSnapshot(fn, adir, pidfn='', pidre=myre.NUMRE):
+    '''
+    Function: loadRptCountSnapshot
+    Input:
+        fn - file a RptCountSnapshot was saved to
+        adir, pidfn, pidre - as for RptCountSnapshot
+    Output: snap - the saved snapshot if fn exists and was made for the same
+                   adir, pidfn and pidre, otherwise a new empty one. Call
+                   update on it either way.
+    Functionality: Loads a RptCountSnapshot
+    '''
+    snap = RptCountSnapshot(adir, pidfn, pidre)
+
+    if os.path.exists(fn):
+        fd = open(fn, 'rb')
+        state = cPickle.load(fd)
+        fd.close()
+
+        if (state['adir'], state['pidfn'], state['pidre']) == \
+                                            (adir, pidfn, pidre.pattern):
+            state['pidre'] = pidre
+            snap.__dict__.update(state)
+        else:
+            logging.warning('%s was made for other inputs, starting over'%(fn))
+
+    return snap
+
+def mergeHists(*hists):
+    '''
+    Function: mergeHists
+    Input: hists - dicts of number of reports to number of patients
+    Output: answer - histogram of all patients in hists
+    Functionality: Adds histograms together, e.g., to get the counts for the
+                   train and test sets together
+    '''
+    answer = {}
+
+    for hist in hists:
+        for count, numPtnts in hist.iteritems():
+            answer[count] = answer.get(count, 0) + numPtnts
+
+    return answer
+
+def getQuartileValsFromHist(hist):
+    '''
+    Function: getQuartileValsFromHist
+    Input: hist - dict of number of reports to number of patients
+    Output: (q1, med, q3) - same values getQuartileVals in
+                            median_iqr_rpts_per_ptnt gives for the patients
+                            hist summarizes
+    Functionality: Finds the quartile values by walking the sorted counts in
+                   hist instead of sorting every patient
+    '''
+    counts = sorted(hist)
+    n = sum(hist.itervalues())
+
+    def kth(k):
+        '''
+        count of the patient at index k of the patients sorted by count
+        '''
+        seen = 0
+
+        for count in counts:
+            seen += hist[count]
+
+            if k < seen: return count
+
+        raise IndexError(k)
+
+    medind = n/2
+
+    if n%2 == 0:
+        med = (kth(medind) + kth(medind-1))/2.0
+    else:
+        med = kth(medind)
+
+    q1 = kth(int(n*0.25) + 1)
+    q3 = kth(int(n*0.75))
+
+    return (q1, med, q3)
@@ -7,9 +7,17 @@ Functionality: Gets values of one column from a table and writes each to a line
 Contents:
     - __main__ code that gets the values of a column from a database and writes
       each to a line in a file
+History:
+    10/19/26 - values are fetched a batch at a time on a worker thread and
+               written while the next batches are fetched, instead of all
+               fetched and then all written. Added optional batchsize and
+               queuedepth args.
+             - added optional nshards arg to split the output into shards
+               with a manifest (see myos.writeShards)
 '''
 import sys
-from org.ghri.shalgrim.util import db, myos
+from org.ghri.shalgrim.util import db
+from org.ghri.shalgrim.util.dbpool import DbExecutor, BATCH_SIZE, PREFETCH
 
 if __name__ == '__main__':      # if run as main
     try:
@@ -18,13 +26,28 @@ if __name__ == '__main__':      # if run as main
         table = sys.argv[2]     # get name of table to select from
         column = sys.argv[3]    # get name of column to select
         outfn = sys.argv[4]     # get name of output file
-    except IndexError:              # if not enough args given
+
+        # rows per fetch and most fetched batches waiting to be written
+        batchsize = int(sys.argv[5]) if len(sys.argv) > 5 else BATCH_SIZE
+        queuedepth = int(sys.argv[6]) if len(sys.argv) > 6 else PREFETCH
+
+        # number of shards to split output into. One file if not given
+        nshards = int(sys.argv[7]) if len(sys.argv) > 7 else 0
+    except (IndexError, ValueError):    # if not enough args or bad numbers
 
         # print usage error message
-        print >> sys.stderr, '%'% \
-              ('Error. Usage: python sel_column.py odbc table column outfile')
+        print >> sys.stderr, 'Error. Usage: python sel_column.py odbc table ' \
+                             'column outfile [batchsize [queuedepth ' \
+                             '[nshards]]]'
         sys.exit()              # and exit
 
-    # get list of rows of that clm
-    values = db.selColumn(table, column, datasrc=odbc)
-    myos.writelines(values, outfn)              # write each val to output file
+    # fetch on a worker thread while this one writes each val to output file
+    executor = DbExecutor(lambda: db.connect(
+                    'Data Source=%s;Trusted_Connection=true;'%(odbc)), 1)
+
+    try:
+        executor.export('SELECT %s FROM %s'%(column, table), outfn,
+                                    batchsize=batchsize, prefetch=queuedepth,
+                                    nshards=nshards)
+    finally:
+        executor.close()